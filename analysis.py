@@ -0,0 +1,189 @@
+"""Background analysis of the current position in a separate process.
+
+The GUI event loop hands AnalysisService a GameState whenever the position
+changes and polls for updates once per frame, so legal move scans, game
+status and engine searches never block drawing. Each submitted position is
+a job with a number; submitting a new one cancels the job in progress, and
+updates of cancelled jobs are dropped by poll(). For every job the worker
+reports, in order:
+
+    moves   the legal move table, as GameState.legal_moves() returns it
+    status  the game status, as GameState.game_status() returns it
+    search  a SearchResult after every completed depth
+    done    the final SearchResult, or None when the game is over
+
+With profile set, the worker runs with instrument.enable() and close()
+returns its Profiler, to be merged with the one of the calling process.
+
+    python analysis.py --time 5 --pairing bg --moves e2e4
+"""
+import argparse
+import copy
+import multiprocessing
+import queue
+import random
+import time
+from collections import namedtuple
+
+from chess_logic import GameState, move_name, parse_move, parse_pairing
+
+AnalysisUpdate = namedtuple('AnalysisUpdate', 'job kind value')
+
+# How long close() waits for the worker before terminating it, in seconds
+SHUTDOWN_TIMEOUT = 2.0
+
+def _analysis_worker(jobs, updates, current, book_path, tablebase_dir, profile=False):
+    # Only the worker process needs the engine
+    from engine import Engine
+    if profile:
+        import instrument
+        instrument.enable()
+    book = None
+    if book_path:
+        from book import OpeningBook
+        book = OpeningBook(book_path)
+    tablebase = None
+    if tablebase_dir:
+        from tablebase import Tablebase
+        tablebase = Tablebase(tablebase_dir)
+    # One engine for every job, so its table carries over from position to position
+    engine = Engine(book=book, tablebase=tablebase)
+    while True:
+        item = jobs.get()
+        if item is None:
+            if profile:
+                updates.put(AnalysisUpdate(None, 'profile', instrument.disable()))
+            return
+        job, game, time_limit, max_depth = item
+        cancelled = lambda: current.value != job
+        if cancelled():
+            continue
+        updates.put(AnalysisUpdate(job, 'moves', game.legal_moves()))
+        status = game.game_status()
+        updates.put(AnalysisUpdate(job, 'status', status))
+        if status not in (None, 'check'):
+            updates.put(AnalysisUpdate(job, 'done', None))
+            continue
+        result = engine.search(game, time_limit, max_depth, stop=cancelled,
+                               on_iteration=lambda r: updates.put(AnalysisUpdate(job, 'search', r)))
+        if not cancelled():
+            updates.put(AnalysisUpdate(job, 'done', result))
+
+class AnalysisService:
+    """Analyses positions in a worker process and streams the results back.
+
+    submit() starts a job for a snapshot of the game and returns its number;
+    poll() never blocks and returns the updates of the current job that have
+    arrived since the last call. The worker is started with the spawn method,
+    so it loads only the rules and the engine, never pygame.
+    """
+
+    def __init__(self, book_path=None, tablebase_dir=None, profile=False):
+        context = multiprocessing.get_context('spawn')
+        self.jobs = context.Queue()
+        self.updates = context.Queue()
+        # Number of the job the worker should be busy with; anything else is cancelled
+        self.current = context.Value('q', 0, lock=False)
+        self.job = 0
+        self.profile = profile
+        self.process = context.Process(target=_analysis_worker, daemon=True,
+                                       args=(self.jobs, self.updates, self.current,
+                                             book_path, tablebase_dir, profile))
+        self.process.start()
+
+    def submit(self, game, time_limit=None, max_depth=64):
+        """Cancel the running job and analyse this position instead.
+
+        time_limit bounds the search in seconds; None searches until
+        max_depth is reached or the next submit() or cancel().
+        """
+        self.job += 1
+        self.current.value = self.job
+        # The queue pickles the game in a background thread, so hand it a copy
+        # that later moves on the board cannot change
+        self.jobs.put((self.job, copy.deepcopy(game), time_limit, max_depth))
+        return self.job
+
+    def cancel(self):
+        """Stop the running job; its remaining updates are never returned"""
+        self.job += 1
+        self.current.value = self.job
+
+    def poll(self):
+        updates = []
+        while True:
+            try:
+                update = self.updates.get_nowait()
+            except queue.Empty:
+                return updates
+            if update.job == self.job:
+                updates.append(update)
+
+    def close(self):
+        """Stop the worker; returns its Profiler when profiling, else None"""
+        self.cancel()
+        self.jobs.put(None)
+        profiler = None
+        if self.profile:
+            # The worker sends its Profiler as it exits, after any stale updates
+            deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+            while profiler is None:
+                try:
+                    update = self.updates.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if update.kind == 'profile':
+                    profiler = update.value
+        self.process.join(SHUTDOWN_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.jobs.close()
+        self.updates.close()
+        return profiler
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream background analysis of a position')
+    parser.add_argument('--time', type=float, default=5.0, help='seconds to analyse')
+    parser.add_argument('--depth', type=int, default=64, help='maximum depth')
+    parser.add_argument('--pairing', default=None, help="joker columns as files, e.g. 'bg'")
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random joker pairing')
+    parser.add_argument('--moves', nargs='*', default=[], help='moves played before analysing')
+    parser.add_argument('--book', default=None, help='opening book file built by book.py')
+    parser.add_argument('--tablebase', default=None, help='directory of tables built by tablebase.py')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    try:
+        game = GameState(joker_columns=parse_pairing(args.pairing) if args.pairing else None)
+        for text in args.moves:
+            start_pos, end_pos = parse_move(text)
+            if end_pos not in game.legal_moves().get(start_pos, []):
+                raise ValueError(f"Illegal move: {text}")
+            game.make_move(start_pos, end_pos)
+    except ValueError as e:
+        parser.error(str(e))
+
+    from engine import format_result
+    with AnalysisService(args.book, args.tablebase) as service:
+        service.submit(game, args.time, args.depth)
+        while True:
+            update = service.updates.get()
+            if update.kind == 'moves':
+                print(f"moves {sum(len(targets) for targets in update.value.values())}")
+            elif update.kind == 'status':
+                print(f"status {update.value or 'ongoing'}")
+            elif update.kind == 'search':
+                print(format_result(update.value), flush=True)
+            else:
+                if update.value is not None and update.value.move is not None:
+                    print(f"bestmove {move_name(*update.value.move)}")
+                break
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Game archive: stored games indexed by position and joker pairing.
+
+Games from self-play JSON Lines or PGN files are replayed through the move
+rules once, when they are added, and stored in segments. A segment is four
+files of fixed-size records:
+
+    <name>.games      offset of its moves, plies, pairing and result, per game
+    <name>.moves      the packed moves of every game (see pack_move)
+    <name>.positions  (Zobrist hash, game) pairs sorted by hash; each position
+                      a game reaches is listed once for that game
+    <name>.pairings   (pairing, game) pairs sorted by pairing
+
+Queries binary search read-only memory maps of every segment, so lookups
+take milliseconds however many games are stored, and any number of readers
+can share an archive. Each add writes a new segment, replaying games in a
+process pool, and registers it in the MANIFEST file under a file lock, so
+several processes can add to one archive at the same time. Games that start
+from a FEN position are skipped.
+
+    python archive.py add games/ selfplay.jsonl games.pgn --workers 8
+    python archive.py search games/ --pairing bg --moves e2e4 e7e5
+    python archive.py pairing games/ bg
+    python archive.py show games/ 1234
+"""
+import argparse
+import fcntl
+import json
+import os
+import sys
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from chess_logic import (JOKER_PAIRINGS, GameState, move_name, pairing_name, parse_move,
+                         parse_pairing, unpack_move)
+from notation import read_games, replay
+
+GAME_DTYPE = np.dtype([('offset', '<u8'), ('plies', '<u2'), ('pairing', 'u1'), ('result', 'i1')])
+POSITION_DTYPE = np.dtype([('key', '<u8'), ('game', '<u4')])
+PAIRING_DTYPE = np.dtype([('pairing', 'u1'), ('game', '<u4')])
+
+# Game results as stored; UNFINISHED games count towards no side
+WHITE_WINS, DRAW, BLACK_WINS, UNFINISHED = 1, 0, -1, 2
+PGN_RESULTS = {'1-0': WHITE_WINS, '0-1': BLACK_WINS, '1/2-1/2': DRAW, '*': UNFINISHED}
+RESULT_TOKENS = {result: token for token, result in PGN_RESULTS.items()}
+
+# Games replayed per task in the ingest pool
+CHUNK_GAMES = 256
+
+MANIFEST = 'MANIFEST'
+LOCK = 'LOCK'
+
+ArchivedGame = namedtuple('ArchivedGame', 'pairing result moves')
+# Game counts of a query; unfinished games are in games but none of the others
+ResultStats = namedtuple('ResultStats', 'games white_wins draws black_wins')
+
+def _read_records(path):
+    """Yield (pairing index, coordinate moves, result) for every game in a JSONL or PGN file"""
+    with open(path) as stream:
+        if path.endswith('.jsonl'):
+            for line in stream:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get('termination') == 'max_plies':
+                        result = UNFINISHED
+                    else:
+                        result = {'white': WHITE_WINS, 'black': BLACK_WINS}.get(record['winner'], DRAW)
+                    pairing = JOKER_PAIRINGS.index(parse_pairing(record['pairing']))
+                    yield pairing, record['moves'], result
+        else:
+            for pgn_game in read_games(stream):
+                if 'FEN' in pgn_game.tags:
+                    continue
+                pairing = JOKER_PAIRINGS.index(parse_pairing(pgn_game.tags.get('JokerPairing', '')))
+                yield pairing, pgn_game.moves, PGN_RESULTS[pgn_game.result]
+
+def _replay_chunk(records):
+    """Replay games and return their (games, moves, positions) arrays.
+
+    Move offsets and game numbers count from the start of the chunk. A game
+    is kept up to its first illegal move.
+    """
+    games = np.zeros(len(records), dtype=GAME_DTYPE)
+    moves = []
+    keys = []
+    numbers = []
+    for number, (pairing, texts, result) in enumerate(records):
+        # Hashes do not depend on the backend, and bitboards replay fastest
+        game = GameState('bitboard', JOKER_PAIRINGS[pairing])
+        seen = {game.hash}
+        offset = len(moves)
+        for text in texts:
+            start_pos, end_pos = parse_move(text)
+            # Checking one piece's moves is much cheaper than the whole legal move table
+            if end_pos not in game.valid_moves_from(start_pos):
+                break
+            game.make_move(start_pos, end_pos)
+            moves.append(game.move_history[-1])
+            seen.add(game.hash)
+        games[number] = (offset, len(moves) - offset, pairing, result)
+        keys.extend(seen)
+        numbers.extend([number] * len(seen))
+    positions = np.empty(len(keys), dtype=POSITION_DTYPE)
+    positions['key'] = np.array(keys, dtype=np.uint64)
+    positions['game'] = numbers
+    return games, np.array(moves, dtype=np.uint16), positions
+
+def _chunks(paths, size):
+    chunk = []
+    for path in paths:
+        for record in _read_records(path):
+            chunk.append(record)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def add_games(directory, paths, workers=None, log=None):
+    """Replay every game of the files into a new segment of the archive; returns the game count"""
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count()
+    name = uuid.uuid4().hex
+    base = os.path.join(directory, name)
+    positions = []
+    game_count = move_count = 0
+    with open(base + '.games', 'wb') as games_file, open(base + '.moves', 'wb') as moves_file, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = _chunks(paths, CHUNK_GAMES)
+        pending = set()
+        exhausted = False
+        # Keep a bounded number of chunks in flight so memory stays flat
+        while pending or not exhausted:
+            while not exhausted and len(pending) < workers * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(_replay_chunk, chunk))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                games, moves, chunk_positions = future.result()
+                # Chunks finish in any order; numbering follows the order they are written in
+                games['offset'] += move_count
+                chunk_positions['game'] += game_count
+                games.tofile(games_file)
+                moves.tofile(moves_file)
+                positions.append(chunk_positions)
+                game_count += len(games)
+                move_count += len(moves)
+                if log:
+                    log(f"{game_count} games replayed")
+
+    games = np.fromfile(base + '.games', dtype=GAME_DTYPE)
+    positions = np.concatenate(positions) if positions else np.zeros(0, dtype=POSITION_DTYPE)
+    positions[np.lexsort((positions['game'], positions['key']))].tofile(base + '.positions')
+    pairings = np.empty(len(games), dtype=PAIRING_DTYPE)
+    pairings['pairing'] = games['pairing']
+    pairings['game'] = np.arange(len(games))
+    pairings[np.argsort(pairings['pairing'], kind='stable')].tofile(base + '.pairings')
+
+    # The segment becomes visible to readers only once the manifest lists it
+    with open(os.path.join(directory, LOCK), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        segments = _read_manifest(directory) + [name]
+        temp = os.path.join(directory, f'{MANIFEST}.{name}')
+        with open(temp, 'w') as f:
+            f.write(''.join(segment + '\n' for segment in segments))
+        os.replace(temp, os.path.join(directory, MANIFEST))
+    return game_count
+
+def _memmap(path, dtype):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+class Segment:
+    """Read-only view of the files of one segment"""
+
+    def __init__(self, base):
+        self.games = _memmap(base + '.games', GAME_DTYPE)
+        self.moves = _memmap(base + '.moves', np.uint16)
+        self.positions = _memmap(base + '.positions', POSITION_DTYPE)
+        self.position_keys = self.positions['key']
+        self.pairings = _memmap(base + '.pairings', PAIRING_DTYPE)
+        self.pairing_keys = self.pairings['pairing']
+
+    def _find(self, entries, keys, value):
+        start = int(np.searchsorted(keys, value, 'left'))
+        end = int(np.searchsorted(keys, value, 'right'))
+        return entries['game'][start:end]
+
+    def games_with_position(self, key):
+        return self._find(self.positions, self.position_keys, np.uint64(key))
+
+    def games_with_pairing(self, pairing):
+        return self._find(self.pairings, self.pairing_keys, np.uint8(pairing))
+
+class GameArchive:
+    """Read-only view of an archive directory.
+
+    Games are numbered across segments in the order the manifest lists
+    them. Segments added after opening are picked up by reload().
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.reload()
+
+    def reload(self):
+        self.segments = [Segment(os.path.join(self.directory, name))
+                         for name in _read_manifest(self.directory)]
+        self.bases = np.cumsum([0] + [len(segment.games) for segment in self.segments])
+
+    def __len__(self):
+        return int(self.bases[-1])
+
+    def _collect(self, per_segment):
+        found = [per_segment(segment).astype(np.int64) + base
+                 for segment, base in zip(self.segments, self.bases)]
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def games_with_position(self, key):
+        """Numbers of the games that reached a position, given its Zobrist hash"""
+        return self._collect(lambda segment: segment.games_with_position(key))
+
+    def games_with_pairing(self, joker_columns):
+        """Numbers of the games played with a joker pairing such as (1, 6)"""
+        pairing = JOKER_PAIRINGS.index(tuple(joker_columns))
+        return self._collect(lambda segment: segment.games_with_pairing(pairing))
+
+    def _locate(self, number):
+        if not 0 <= number < len(self):
+            raise IndexError(f"No game {number} in an archive of {len(self)} games")
+        index = int(np.searchsorted(self.bases, number, 'right')) - 1
+        return self.segments[index], number - int(self.bases[index])
+
+    def game(self, number):
+        segment, local = self._locate(number)
+        record = segment.games[local]
+        offset, plies = int(record['offset']), int(record['plies'])
+        moves = [unpack_move(int(packed)) for packed in segment.moves[offset:offset + plies]]
+        return ArchivedGame(JOKER_PAIRINGS[int(record['pairing'])], int(record['result']), moves)
+
+    def results(self, numbers):
+        """Stored results of the given games, as an array"""
+        numbers = np.asarray(numbers, dtype=np.int64)
+        results = np.empty(len(numbers), dtype=np.int8)
+        segment_of = np.searchsorted(self.bases, numbers, 'right') - 1
+        for index in np.unique(segment_of):
+            mask = segment_of == index
+            results[mask] = self.segments[index].games['result'][numbers[mask] - self.bases[index]]
+        return results
+
+    def stats(self, numbers):
+        """Win/draw/loss counts over the given games"""
+        counts = np.bincount(self.results(numbers) + 1, minlength=4)
+        return ResultStats(len(numbers), int(counts[WHITE_WINS + 1]), int(counts[DRAW + 1]),
+                           int(counts[BLACK_WINS + 1]))
+
+    def position_stats(self, key):
+        """Win/draw/loss counts over the games that reached a position"""
+        return self.stats(self.games_with_position(key))
+
+def _format_stats(stats):
+    return (f"games {stats.games} white {stats.white_wins} draws {stats.draws} "
+            f"black {stats.black_wins}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query a chess with jokers game archive')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='add self-play JSONL or PGN files to an archive')
+    add.add_argument('archive')
+    add.add_argument('files', nargs='+')
+    add.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+
+    search = commands.add_parser('search', help='find the games that reached a position')
+    search.add_argument('archive')
+    search.add_argument('--pairing', required=True, help="joker columns as files, e.g. 'bg'")
+    search.add_argument('--moves', nargs='*', default=[])
+    search.add_argument('--limit', type=int, default=20, help='game numbers to list')
+
+    pairing = commands.add_parser('pairing', help='find the games played with a joker pairing')
+    pairing.add_argument('archive')
+    pairing.add_argument('pairing', help="joker columns as files, e.g. 'bg'")
+    pairing.add_argument('--limit', type=int, default=20, help='game numbers to list')
+
+    show = commands.add_parser('show', help='print a stored game')
+    show.add_argument('archive')
+    show.add_argument('number', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        count = add_games(args.archive, args.files, args.workers,
+                          log=lambda message: print(message, file=sys.stderr))
+        print(f"{count} games added to {args.archive}", file=sys.stderr)
+        return
+
+    archive = GameArchive(args.archive)
+    try:
+        if args.command == 'search':
+            numbers = archive.games_with_position(replay(args.moves, parse_pairing(args.pairing)).hash)
+        elif args.command == 'pairing':
+            numbers = archive.games_with_pairing(parse_pairing(args.pairing))
+        else:
+            game = archive.game(args.number)
+            print(f"pairing {pairing_name(game.pairing)} result {RESULT_TOKENS[game.result]}")
+            print(' '.join(move_name(*move) for move in game.moves))
+            return
+    except (ValueError, IndexError) as e:
+        parser.error(str(e))
+    print(_format_stats(archive.stats(numbers)))
+    if len(numbers):
+        print('games ' + ' '.join(str(number) for number in numbers[:args.limit]))
+
+if __name__ == "__main__":
+    main()
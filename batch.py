@@ -0,0 +1,285 @@
+import numpy as np
+
+from pieces import W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING
+from chess_logic import KNIGHT_JUMPS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS
+
+# Vectorized move generation over a (N, 8, 8) stack of int8 boards.
+#
+# Every operation works on the whole stack at once, so the number of
+# Python-level steps depends on piece types and directions, not on N.
+# Joker movement is given per board as a (N, 8, 8) plane of movement types
+# (0 where a piece moves as itself). Castling rights (the GameState.castling
+# bits) and en passant targets (a square index, -1 for none) are optional
+# per-board arrays; without them no castling or en passant moves are made.
+
+KING_OFFSETS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+def shift(a, dr, dc):
+    """Move every cell of a (N, 8, 8) stack by (dr, dc), filling with zeros"""
+    out = np.zeros_like(a)
+    if abs(dr) >= 8 or abs(dc) >= 8:
+        return out
+    src_r = slice(max(0, -dr), 8 - max(0, dr))
+    dst_r = slice(max(0, dr), 8 - max(0, -dr))
+    src_c = slice(max(0, -dc), 8 - max(0, dc))
+    dst_c = slice(max(0, dc), 8 - max(0, -dc))
+    out[:, dst_r, dst_c] = a[:, src_r, src_c]
+    return out
+
+def _at(a, dr, dc):
+    """Value of a at (row + dr, col + dc), seen from (row, col); off-board is zero"""
+    return shift(a, -dr, -dc)
+
+def movement_types(boards, movement=None):
+    """Movement type of every occupied square, joker overrides applied"""
+    types = np.abs(boards)
+    if movement is not None:
+        types = np.where((movement != 0) & (boards != 0), movement, types)
+    return types.astype(np.int8)
+
+def attack_map(boards, white, movement=None):
+    """Squares attacked by one side in every board, as a (N, 8, 8) bool array"""
+    types = movement_types(boards, movement)
+    own = boards > 0 if white else boards < 0
+    empty = boards == 0
+    attacks = np.zeros(boards.shape, dtype=bool)
+
+    pawns = own & (types == W_PAWN)
+    direction = -1 if white else 1
+    attacks |= shift(pawns, direction, -1) | shift(pawns, direction, 1)
+
+    knights = own & (types == W_KNIGHT)
+    for dr, dc in KNIGHT_JUMPS:
+        attacks |= shift(knights, dr, dc)
+    kings = own & (types == W_KING)
+    for dr, dc in KING_OFFSETS:
+        attacks |= shift(kings, dr, dc)
+
+    queens = own & (types == W_QUEEN)
+    straight = (own & (types == W_ROOK)) | queens
+    diagonal = (own & (types == W_BISHOP)) | queens
+    for directions, sliders in ((ROOK_DIRECTIONS, straight), (BISHOP_DIRECTIONS, diagonal)):
+        for dr, dc in directions:
+            ray = shift(sliders, dr, dc)
+            while ray.any():
+                attacks |= ray
+                # Rays continue only through empty squares
+                ray = shift(ray & empty, dr, dc)
+    return attacks
+
+def _as_side_array(white_to_move, n):
+    return np.broadcast_to(np.asarray(white_to_move, dtype=bool), (n,))
+
+def _king_attacked(boards, types, white_king):
+    """Whether the given king is attacked, probing outward from its square.
+
+    Works on flattened (N, 64) boards and gathers one square per board at a
+    time, which is far cheaper than full attack maps for many boards.
+    """
+    n = np.arange(len(boards))
+    king = W_KING if white_king else -W_KING
+    king_sq = np.argmax(boards == king, axis=1)
+    has_king = boards[n, king_sq] == king
+    king_row, king_col = king_sq // 8, king_sq % 8
+    enemy = (boards < 0) if white_king else (boards > 0)
+    attacked = np.zeros(len(boards), dtype=bool)
+
+    def probe(dr, dc):
+        r, c = king_row + dr, king_col + dc
+        inside = (r >= 0) & (r < 8) & (c >= 0) & (c < 8)
+        sq = np.where(inside, r * 8 + c, 0)
+        return inside, boards[n, sq], enemy[n, sq], types[n, sq]
+
+    for dr, dc in KNIGHT_JUMPS:
+        inside, _, is_enemy, kind = probe(dr, dc)
+        attacked |= inside & is_enemy & (kind == W_KNIGHT)
+
+    # Enemy pawns capture towards the king's side of the board
+    pawn_row = -1 if white_king else 1
+    for directions, slider in ((ROOK_DIRECTIONS, W_ROOK), (BISHOP_DIRECTIONS, W_BISHOP)):
+        for dr, dc in directions:
+            open_ray = np.ones(len(boards), dtype=bool)
+            for distance in range(1, 8):
+                inside, piece, is_enemy, kind = probe(distance * dr, distance * dc)
+                hit = open_ray & inside & is_enemy
+                threat = (kind == slider) | (kind == W_QUEEN)
+                if distance == 1:
+                    threat |= kind == W_KING
+                    if slider == W_BISHOP and dr == pawn_row:
+                        threat |= kind == W_PAWN
+                attacked |= hit & threat
+                open_ray &= inside & (piece == 0)
+                if not open_ray.any():
+                    break
+    return attacked & has_king
+
+def in_check(boards, white_to_move, movement=None):
+    """Whether the side to move is in check, for every board"""
+    boards = np.asarray(boards, dtype=np.int8)
+    white_to_move = _as_side_array(white_to_move, len(boards))
+    flat = boards.reshape(len(boards), 64)
+    types = movement_types(boards, movement).reshape(len(boards), 64)
+    result = np.zeros(len(boards), dtype=bool)
+    for white in (True, False):
+        side = white_to_move == white
+        if side.any():
+            result[side] = _king_attacked(flat[side], types[side], white)
+    return result
+
+def _pseudo_moves(boards, movement):
+    """Pseudo-legal moves for white in every board, as (board, from, to) index arrays"""
+    types = movement_types(boards, movement)
+    own = boards > 0
+    empty = boards == 0
+    enemy = boards < 0
+    not_own = ~own
+    found = []
+
+    def add(origins, dr, dc):
+        n, r, c = np.nonzero(origins)
+        found.append((n, r * 8 + c, (r + dr) * 8 + (c + dc)))
+
+    pawns = own & (types == W_PAWN)
+    single = pawns & _at(empty, -1, 0)
+    add(single, -1, 0)
+    double = single & _at(empty, -2, 0)
+    double[:, :6] = False
+    double[:, 7] = False
+    add(double, -2, 0)
+    for dc in (-1, 1):
+        add(pawns & _at(enemy, -1, dc), -1, dc)
+
+    for kind, offsets in ((W_KNIGHT, KNIGHT_JUMPS), (W_KING, KING_OFFSETS)):
+        leapers = own & (types == kind)
+        if leapers.any():
+            for dr, dc in offsets:
+                add(leapers & _at(not_own, dr, dc), dr, dc)
+
+    queens = own & (types == W_QUEEN)
+    straight = (own & (types == W_ROOK)) | queens
+    diagonal = (own & (types == W_BISHOP)) | queens
+    for directions, sliders in ((ROOK_DIRECTIONS, straight), (BISHOP_DIRECTIONS, diagonal)):
+        for dr, dc in directions:
+            alive = sliders
+            for distance in range(1, 8):
+                if not alive.any():
+                    break
+                add(alive & _at(not_own, distance * dr, distance * dc), distance * dr, distance * dc)
+                alive = alive & _at(empty, distance * dr, distance * dc)
+
+    n = np.concatenate([f[0] for f in found])
+    origin = np.concatenate([f[1] for f in found])
+    target = np.concatenate([f[2] for f in found])
+    return n, origin, target
+
+def _special_moves(boards, movement, castling, en_passant):
+    """Castling and en passant moves for white, as (board, from, to) index arrays.
+
+    castling holds white's two bits (kingside 1, queenside 2) per board. As in
+    get_basic_moves, castling needs the king and a rook at home with empty
+    squares between them, and only pawns moving as themselves capture en
+    passant. Legality is then checked like any other move, which tests the
+    king's destination and leaves the captured pawn in place.
+    """
+    flat = boards.reshape(-1, 64)
+    plain = movement.reshape(-1, 64) == 0
+    found = []
+    king_home = flat[:, 60] == W_KING
+    for bit, rook, between, target in ((1, 63, (61, 62), 62), (2, 56, (57, 58, 59), 58)):
+        ok = king_home & ((castling & bit) != 0) & (flat[:, rook] == W_ROOK)
+        for sq in between:
+            ok &= flat[:, sq] == 0
+        n = np.flatnonzero(ok)
+        found.append((n, np.full(len(n), 60), np.full(len(n), target)))
+    n = np.flatnonzero(en_passant >= 0)
+    target = en_passant[n].astype(np.intp)
+    for dc in (-1, 1):
+        # Pawns beside the target square's column, one row below it
+        col = target % 8 + dc
+        origin = target + 8 + dc
+        inside = (col >= 0) & (col < 8)
+        ok = inside.copy()
+        ok[inside] = (flat[n[inside], origin[inside]] == W_PAWN) & plain[n[inside], origin[inside]]
+        found.append((n[ok], origin[ok], target[ok]))
+    return tuple(np.concatenate([f[i] for f in found]).astype(np.intp) for i in range(3))
+
+def _legal_chunk(boards, white_to_move, movement, castling, en_passant):
+    count = len(boards)
+    # Mirror black-to-move boards so every board has white to move
+    black = ~white_to_move
+    boards = boards.copy()
+    boards[black] = -boards[black][:, ::-1, :]
+    if movement is None:
+        movement = np.zeros_like(boards)
+    else:
+        movement = movement.copy()
+        movement[black] = movement[black][:, ::-1, :]
+
+    n, origin, target = _pseudo_moves(boards, movement)
+    if castling is not None or en_passant is not None:
+        rights = np.zeros(count, dtype=np.int64) if castling is None else castling.astype(np.int64)
+        rights = np.where(black, rights >> 2, rights) & 3
+        targets = np.full(count, -1, dtype=np.int64)
+        if en_passant is not None:
+            targets = en_passant.astype(np.int64)
+        targets = np.where(black & (targets >= 0), (7 - targets // 8) * 8 + targets % 8, targets)
+        special = _special_moves(boards, movement, rights, targets)
+        n, origin, target = (np.concatenate([a, b]) for a, b in zip((n, origin, target), special))
+    m = np.arange(len(n))
+    after = boards[n].reshape(-1, 64)
+    after_movement = movement[n].reshape(-1, 64)
+    piece = after[m, origin]
+    after[m, target] = np.where((piece == W_PAWN) & (target < 8), W_QUEEN, piece)
+    after[m, origin] = 0
+    after_movement[m, target] = after_movement[m, origin]
+    after_movement[m, origin] = 0
+    legal = ~in_check(after.reshape(-1, 8, 8), True, after_movement.reshape(-1, 8, 8))
+
+    # Map squares of mirrored boards back to their real rows
+    flip = black[n]
+    origin = np.where(flip, (7 - origin // 8) * 8 + origin % 8, origin)
+    target = np.where(flip, (7 - target // 8) * 8 + target % 8, target)
+    masks = np.zeros((count, 64, 64), dtype=bool)
+    masks[n[legal], origin[legal], target[legal]] = True
+    return masks
+
+def legal_move_masks(boards, white_to_move, movement=None, castling=None, en_passant=None,
+                     chunk_size=2048):
+    """Legal moves of the side to move in every board, as a (N, 64, 64) bool array.
+
+    masks[i, from_square, to_square] is set when the move is legal in board i,
+    with squares numbered row * 8 + col. castling and en_passant are per-board
+    arrays as stack_games returns them; leave them out for positions without
+    castling rights or en passant targets.
+    """
+    boards = np.asarray(boards, dtype=np.int8)
+    white_to_move = _as_side_array(white_to_move, len(boards))
+    if movement is not None:
+        movement = np.asarray(movement, dtype=np.int8)
+    if castling is not None:
+        castling = np.asarray(castling)
+    if en_passant is not None:
+        en_passant = np.asarray(en_passant)
+    masks = np.zeros((len(boards), 64, 64), dtype=bool)
+    # Chunks bound the memory used by the boards built for every candidate move
+    for start in range(0, len(boards), chunk_size):
+        end = start + chunk_size
+        masks[start:end] = _legal_chunk(boards[start:end], white_to_move[start:end],
+                                        None if movement is None else movement[start:end],
+                                        None if castling is None else castling[start:end],
+                                        None if en_passant is None else en_passant[start:end])
+    return masks
+
+def stack_games(games):
+    """Stack GameStates into (boards, white_to_move, movement, castling, en_passant) arrays.
+
+    The result unpacks straight into legal_move_masks. en_passant is -1 where
+    a position has no en passant target.
+    """
+    boards = np.stack([game.board for game in games])
+    white_to_move = np.array([game.current_player_white for game in games], dtype=bool)
+    movement = np.stack([game.movement for game in games])
+    castling = np.array([game.castling for game in games], dtype=np.uint8)
+    en_passant = np.array([-1 if game.en_passant is None else game.en_passant for game in games],
+                          dtype=np.int8)
+    return boards, white_to_move, movement, castling, en_passant
@@ -0,0 +1,444 @@
+import numpy as np
+
+from pieces import (W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING,
+                    B_PAWN, B_ROOK, B_KNIGHT, B_BISHOP, B_QUEEN, B_KING)
+
+# Squares are numbered row * 8 + col, so bit 0 is the top-left corner (a8)
+# and bit 63 the bottom-right one (h1), matching the layout of the NumPy board.
+
+PIECES = [W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING,
+          B_PAWN, B_ROOK, B_KNIGHT, B_BISHOP, B_QUEEN, B_KING]
+
+KNIGHT_OFFSETS = [(2,1), (2,-1), (-2,1), (-2,-1), (1,2), (1,-2), (-1,2), (-1,-2)]
+KING_OFFSETS = [(0,1), (0,-1), (1,0), (-1,0), (1,1), (1,-1), (-1,1), (-1,-1)]
+ROOK_DIRECTIONS = [(0,1), (0,-1), (1,0), (-1,0)]
+BISHOP_DIRECTIONS = [(1,1), (1,-1), (-1,1), (-1,-1)]
+
+def _build_leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << (r * 8 + c)
+        table.append(bb)
+    return table
+
+def _build_ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _build_leaper_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _build_leaper_table(KING_OFFSETS)
+# PAWN_ATTACKS[0] holds white pawn captures (towards row 0), PAWN_ATTACKS[1] black ones
+PAWN_ATTACKS = (_build_leaper_table([(-1,-1), (-1,1)]),
+                _build_leaper_table([(1,-1), (1,1)]))
+
+RAYS = {d: _build_ray_table(*d) for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+# A ray pointing to higher square numbers meets its first blocker at the lowest set bit
+_ROOK_RAYS = [(RAYS[d], d[0] * 8 + d[1] > 0) for d in ROOK_DIRECTIONS]
+_BISHOP_RAYS = [(RAYS[d], d[0] * 8 + d[1] > 0) for d in BISHOP_DIRECTIONS]
+
+def _build_between_table():
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            between = 0
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                table[sq][r * 8 + c] = between
+                between |= 1 << (r * 8 + c)
+                r, c = r + dr, c + dc
+    return table
+
+# BETWEEN[a][b] holds the squares strictly between two squares on a line, 0 off a line
+BETWEEN = _build_between_table()
+ALL_SQUARES = (1 << 64) - 1
+
+def _slider_attacks(sq, occupied, rays):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, _ROOK_RAYS)
+
+def bishop_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, _BISHOP_RAYS)
+
+def queen_attacks(sq, occupied):
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+def iter_bits(bb):
+    """Yield the index of every set bit, lowest first"""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+def iter_squares(bb):
+    """Yield the (row, col) of every set bit, lowest square first"""
+    while bb:
+        low = bb & -bb
+        yield divmod(low.bit_length() - 1, 8)
+        bb ^= low
+
+class Bitboards:
+    """Bitboard view of a position: one set per piece plus colour occupancy.
+
+    ``pieces`` is keyed by the signed piece value stored on the board, while
+    ``movers`` is keyed by the signed piece a square actually moves like, so
+    joker pieces are attacked and attack with their swapped movement.
+    """
+
+    def __init__(self):
+        self.pieces = {piece: 0 for piece in PIECES}
+        self.movers = {piece: 0 for piece in PIECES}
+        self.white = 0
+        self.black = 0
+        self.squares = [0] * 64
+
+    @property
+    def occupied(self):
+        return self.white | self.black
+
+    @classmethod
+    def from_array(cls, board, movement=None, pieces=None):
+        """Build bitboards from an 8x8 board, taking joker movement from the movement plane.
+
+        With the position's PieceLists only the occupied squares are visited.
+        """
+        bb = cls()
+        types = movement.ravel().tolist() if movement is not None else [0] * 64
+        cells = board.ravel().tolist() if isinstance(board, np.ndarray) else [p for r in board for p in r]
+        if pieces is None:
+            occupied = [sq for sq in range(64) if cells[sq]]
+        else:
+            occupied = list(iter_bits(pieces.squares[0] | pieces.squares[1]))
+        for sq in occupied:
+            piece = int(cells[sq])
+            bit = 1 << sq
+            bb.squares[sq] = piece
+            bb.pieces[piece] |= bit
+            movement_type = types[sq] or abs(piece)
+            bb.movers[movement_type if piece > 0 else -movement_type] |= bit
+            if piece > 0:
+                bb.white |= bit
+            else:
+                bb.black |= bit
+        return bb
+
+    def is_attacked(self, sq, by_white, occupied=None, exclude=0):
+        """Check whether any piece of the given colour attacks ``sq``.
+
+        ``exclude`` removes squares from the attacking side, which lets callers
+        test a capture without rebuilding the bitboards.
+        """
+        if occupied is None:
+            occupied = self.occupied
+        sign = 1 if by_white else -1
+        movers = self.movers
+        keep = ~exclude
+
+        if KNIGHT_ATTACKS[sq] & movers[W_KNIGHT * sign] & keep:
+            return True
+        if KING_ATTACKS[sq] & movers[W_KING * sign] & keep:
+            return True
+        # A white pawn attacks sq from the squares a black pawn on sq would attack
+        if PAWN_ATTACKS[1 if by_white else 0][sq] & movers[W_PAWN * sign] & keep:
+            return True
+        straight = (movers[W_ROOK * sign] | movers[W_QUEEN * sign]) & keep
+        if straight and rook_attacks(sq, occupied) & straight:
+            return True
+        diagonal = (movers[W_BISHOP * sign] | movers[W_QUEEN * sign]) & keep
+        if diagonal and bishop_attacks(sq, occupied) & diagonal:
+            return True
+        return False
+
+def _as_bitboards(board, movement=None, pieces=None):
+    if isinstance(board, Bitboards):
+        return board
+    return Bitboards.from_array(board, movement, pieces)
+
+def get_basic_moves(piece, pos, board, castling_rights=None, en_passant=None):
+    """Get all possible moves without considering check"""
+    bb = _as_bitboards(board)
+    row, col = pos
+    sq = row * 8 + col
+    kind = abs(piece)
+    own = bb.white if piece > 0 else bb.black
+    squares = bb.squares
+    moves = []
+
+    if kind == 1:
+        direction = -1 if piece > 0 else 1
+        ahead = row + direction
+        if 0 <= ahead < 8 and squares[ahead * 8 + col] == 0:
+            moves.append((ahead, col))
+            if ((piece > 0 and row == 6) or (piece < 0 and row == 1)) and \
+               squares[(row + 2*direction) * 8 + col] == 0:
+                moves.append((row + 2*direction, col))
+        enemy = bb.black if piece > 0 else bb.white
+        moves.extend(iter_squares(PAWN_ATTACKS[0 if piece > 0 else 1][sq] & enemy))
+        if en_passant and row == (3 if piece > 0 else 4):
+            if abs(col - en_passant[1]) == 1 and row == en_passant[0] - direction:
+                moves.append(en_passant)
+        return moves
+
+    if kind == 3:
+        targets = KNIGHT_ATTACKS[sq]
+    elif kind == 4:
+        targets = bishop_attacks(sq, bb.occupied)
+    elif kind == 2:
+        targets = rook_attacks(sq, bb.occupied)
+    elif kind == 5:
+        targets = queen_attacks(sq, bb.occupied)
+    elif kind == 6:
+        targets = KING_ATTACKS[sq]
+    else:
+        return moves
+    moves.extend(iter_squares(targets & ~own))
+
+    if kind == 6 and castling_rights:
+        is_white = piece > 0
+        base_row = 7 if is_white else 0
+        base = base_row * 8
+        rook = W_ROOK if is_white else B_ROOK
+        if row == base_row and col == 4:
+            if castling_rights['kingside'] and \
+               squares[base + 5] == 0 and squares[base + 6] == 0 and \
+               squares[base + 7] == rook:
+                moves.append((base_row, 6))
+            if castling_rights['queenside'] and \
+               squares[base + 1] == 0 and squares[base + 2] == 0 and squares[base + 3] == 0 and \
+               squares[base] == rook:
+                moves.append((base_row, 2))
+    return moves
+
+def is_in_check(board, is_white, movement=None, pieces=None):
+    """Check if the king is in check, considering joker pieces"""
+    bb = _as_bitboards(board, movement, pieces)
+    kings = bb.pieces[W_KING if is_white else B_KING]
+    if not kings:
+        return False
+    king_sq = (kings & -kings).bit_length() - 1
+    return bb.is_attacked(king_sq, not is_white)
+
+def _first_blocker(blockers, positive):
+    if positive:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+def _checks_and_pins(bb, is_white):
+    """Find what limits the moves of a side: its king, checks and absolute pins.
+
+    Returns (king_sq, check_mask, pins). A move other than the king's must
+    land on check_mask (everything when not in check, the checker and the
+    squares between when in single check, nothing in double check), and a
+    pinned piece, keyed by square in pins, must stay on the line between its
+    king and the pinner. Attacks and pins follow joker movement.
+    """
+    sign = 1 if is_white else -1
+    kings = bb.pieces[W_KING * sign]
+    if not kings:
+        return None, ALL_SQUARES, {}
+    king_sq = (kings & -kings).bit_length() - 1
+    movers = bb.movers
+    own = bb.white if is_white else bb.black
+    occupied = bb.occupied
+
+    checkers = KNIGHT_ATTACKS[king_sq] & movers[-W_KNIGHT * sign]
+    checkers |= PAWN_ATTACKS[0 if is_white else 1][king_sq] & movers[-W_PAWN * sign]
+    checkers |= KING_ATTACKS[king_sq] & movers[-W_KING * sign]
+    pins = {}
+    enemy_queens = movers[-W_QUEEN * sign]
+    for rays, sliders in ((_ROOK_RAYS, movers[-W_ROOK * sign] | enemy_queens),
+                          (_BISHOP_RAYS, movers[-W_BISHOP * sign] | enemy_queens)):
+        if not sliders:
+            continue
+        for table, positive in rays:
+            blockers = table[king_sq] & occupied
+            if not blockers:
+                continue
+            first = _first_blocker(blockers, positive)
+            if sliders >> first & 1:
+                checkers |= 1 << first
+            elif own >> first & 1:
+                beyond = blockers & table[first]
+                if beyond:
+                    second = _first_blocker(beyond, positive)
+                    if sliders >> second & 1:
+                        pins[first] = BETWEEN[king_sq][second] | 1 << second
+
+    if not checkers:
+        check_mask = ALL_SQUARES
+    elif checkers & (checkers - 1):
+        check_mask = 0
+    else:
+        checker_sq = checkers.bit_length() - 1
+        check_mask = checkers | BETWEEN[king_sq][checker_sq]
+    return king_sq, check_mask, pins
+
+def attacked_squares(bb, by_white, occupied=None):
+    """Every square a side attacks, following joker movement"""
+    if occupied is None:
+        occupied = bb.occupied
+    sign = 1 if by_white else -1
+    movers = bb.movers
+    attacks = 0
+    for piece, table in ((W_KNIGHT, KNIGHT_ATTACKS), (W_KING, KING_ATTACKS),
+                         (W_PAWN, PAWN_ATTACKS[0 if by_white else 1])):
+        bits = movers[piece * sign]
+        while bits:
+            low = bits & -bits
+            attacks |= table[low.bit_length() - 1]
+            bits ^= low
+    queens = movers[W_QUEEN * sign]
+    for sliders, attack in ((movers[W_ROOK * sign] | queens, rook_attacks),
+                            (movers[W_BISHOP * sign] | queens, bishop_attacks)):
+        while sliders:
+            low = sliders & -sliders
+            attacks |= attack(low.bit_length() - 1, occupied)
+            sliders ^= low
+    return attacks
+
+def _king_danger(bb, is_white, king_sq):
+    """Squares the king may not step on: enemy attacks with the king lifted off the board"""
+    return attacked_squares(bb, not is_white, bb.occupied & ~(1 << king_sq))
+
+def get_valid_moves(piece, pos, board, castling_rights=None, en_passant=None, movement=None,
+                    pieces=None):
+    """Get valid moves considering check and joker pieces"""
+    bb = _as_bitboards(board, movement, pieces)
+    moves = get_basic_moves(piece, pos, bb, castling_rights, en_passant)
+    king_sq, check_mask, pins = _checks_and_pins(bb, piece > 0)
+    sq = pos[0] * 8 + pos[1]
+    if sq == king_sq:
+        danger = _king_danger(bb, piece > 0, king_sq)
+        return [move for move in moves if not danger >> (move[0] * 8 + move[1]) & 1]
+    allowed = check_mask & pins.get(sq, ALL_SQUARES)
+    return [move for move in moves if allowed >> (move[0] * 8 + move[1]) & 1]
+
+def _movement_type(bb, sq, sign):
+    bit = 1 << sq
+    for movement_type in (W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING):
+        if bb.movers[movement_type * sign] & bit:
+            return movement_type
+    return 0
+
+def _own_pieces(bb, is_white, en_passant):
+    """(piece to generate moves for, square, en passant target) of every piece but the king"""
+    sign = 1 if is_white else -1
+    pieces = []
+    for row, col in iter_squares(bb.white if is_white else bb.black):
+        sq = row * 8 + col
+        piece = bb.squares[sq]
+        movement_type = _movement_type(bb, sq, sign)
+        if movement_type != abs(piece):
+            # Joker pieces move like their partner and never castle or capture en passant
+            pieces.append((movement_type * sign, (row, col), None))
+        elif piece != W_KING * sign:
+            pieces.append((piece, (row, col), en_passant))
+    return pieces
+
+def legal_move_table(board, is_white, movement=None, castling_rights=None, en_passant=None,
+                     pieces=None):
+    """Map every square of a side to its legal destinations, like GameState.legal_moves.
+
+    Checks and pins are worked out once for the position, so each candidate
+    move is accepted or rejected with a mask test instead of a check test.
+    """
+    bb = _as_bitboards(board, movement, pieces)
+    king_sq, check_mask, pins = _checks_and_pins(bb, is_white)
+    table = {}
+    if king_sq is not None:
+        danger = _king_danger(bb, is_white, king_sq)
+        king_pos = divmod(king_sq, 8)
+        table[king_pos] = [move for move in get_basic_moves(bb.squares[king_sq], king_pos, bb,
+                                                            castling_rights, None)
+                           if not danger >> (move[0] * 8 + move[1]) & 1]
+    for piece, pos, target in _own_pieces(bb, is_white, en_passant):
+        allowed = check_mask & pins.get(pos[0] * 8 + pos[1], ALL_SQUARES)
+        table[pos] = [move for move in get_basic_moves(piece, pos, bb, None, target)
+                      if allowed >> (move[0] * 8 + move[1]) & 1] if allowed else []
+    # Same order as scanning the board, lowest square first
+    return dict(sorted(table.items()))
+
+def iter_legal_moves(board, is_white, movement=None, castling_rights=None, en_passant=None,
+                     pieces=None):
+    """Yield the legal (start_pos, end_pos) moves of a side one at a time.
+
+    King moves come first, then, when in check, captures of the checking
+    piece before the remaining moves. Checks and pins are worked out once, so
+    every candidate costs one mask test. The position must not change while
+    iterating.
+    """
+    bb = _as_bitboards(board, movement, pieces)
+    king_sq, check_mask, pins = _checks_and_pins(bb, is_white)
+    if king_sq is not None:
+        danger = _king_danger(bb, is_white, king_sq)
+        king_pos = divmod(king_sq, 8)
+        for move in get_basic_moves(bb.squares[king_sq], king_pos, bb, castling_rights, None):
+            if not danger >> (move[0] * 8 + move[1]) & 1:
+                yield king_pos, move
+    if not check_mask:
+        return
+
+    pieces = _own_pieces(bb, is_white, en_passant)
+    if check_mask == ALL_SQUARES:
+        for piece, pos, target in pieces:
+            allowed = pins.get(pos[0] * 8 + pos[1], ALL_SQUARES)
+            for move in get_basic_moves(piece, pos, bb, None, target):
+                if allowed >> (move[0] * 8 + move[1]) & 1:
+                    yield pos, move
+        return
+
+    # In single check the mask holds the checker and empty blocking squares,
+    # so the captures it allows, which are tried first, are of the checker
+    generated = [(pos, get_basic_moves(piece, pos, bb, None, target),
+                  check_mask & pins.get(pos[0] * 8 + pos[1], ALL_SQUARES))
+                 for piece, pos, target in pieces]
+    for captures in (True, False):
+        for pos, moves, allowed in generated:
+            for move in moves:
+                to_sq = move[0] * 8 + move[1]
+                if allowed >> to_sq & 1 and (bb.squares[to_sq] != 0) == captures:
+                    yield pos, move
+
+def has_any_legal_move(board, is_white, movement=None, castling_rights=None, en_passant=None,
+                       pieces=None):
+    """Whether the side has a legal move, stopping at the first one found"""
+    moves = iter_legal_moves(board, is_white, movement, castling_rights, en_passant, pieces)
+    return next(moves, None) is not None
+
+def is_checkmate(board, is_white, movement=None, pieces=None):
+    bb = _as_bitboards(board, movement, pieces)
+    if not is_in_check(bb, is_white):
+        return False
+    return not has_any_legal_move(bb, is_white)
+
+def is_stalemate(board, is_white, movement=None, pieces=None):
+    bb = _as_bitboards(board, movement, pieces)
+    if is_in_check(bb, is_white):
+        return False
+    return not has_any_legal_move(bb, is_white)
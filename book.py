@@ -0,0 +1,145 @@
+"""Opening book: a sorted binary file of moves keyed by position hash.
+
+Each record is 14 bytes: Zobrist hash, packed move (see pack_move), weight
+(how many games played the move) and score (the mover's average result in
+thousandths, from -1000 for a loss to 1000 for a win). Records are sorted by
+hash, and lookups binary search a read-only memory map, so any number of
+engine processes can share one book without loading it into memory.
+
+    python book.py build --output book.bin games.jsonl games.pgn --plies 20
+    python book.py probe book.bin --pairing bg --moves e2e4 e7e5
+"""
+import argparse
+import json
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from chess_logic import GameState, move_name, pack_move, parse_move, parse_pairing, unpack_move
+from notation import game_from_pgn, read_games, replay
+
+BOOK_DTYPE = np.dtype([('key', '<u8'), ('move', '<u2'), ('weight', '<u2'), ('score', '<i2')])
+
+BookEntry = namedtuple('BookEntry', 'move weight score')
+
+# Winner of a game by its PGN result token
+WINNERS = {'1-0': 'white', '0-1': 'black'}
+
+class OpeningBook:
+    """Read-only view of a book file"""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) == 0:
+            self.entries = np.zeros(0, dtype=BOOK_DTYPE)
+        else:
+            self.entries = np.memmap(path, dtype=BOOK_DTYPE, mode='r')
+        self.keys = self.entries['key']
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """Return the BookEntry list stored for a position hash, most played first"""
+        key = np.uint64(key)
+        start = int(np.searchsorted(self.keys, key, 'left'))
+        end = int(np.searchsorted(self.keys, key, 'right'))
+        return [BookEntry(unpack_move(int(record['move'])), int(record['weight']), int(record['score']))
+                for record in self.entries[start:end]]
+
+    def choose(self, game, rng=None):
+        """Pick a book move for the position, or None when it is out of book.
+
+        Without rng the most played move wins; with one, moves are drawn in
+        proportion to their weight. Moves that are not legal here (a hash
+        collision) are ignored.
+        """
+        legal = game.legal_moves()
+        entries = [entry for entry in self.lookup(game.hash)
+                   if entry.move[1] in legal.get(entry.move[0], [])]
+        if not entries:
+            return None
+        if rng is None:
+            return max(entries, key=lambda entry: (entry.weight, entry.score)).move
+        return rng.choices([entry.move for entry in entries],
+                           weights=[entry.weight for entry in entries])[0]
+
+def _read_archive(path):
+    """Yield (GameState at the start, moves, winner) for every game in a JSONL or PGN file"""
+    with open(path) as stream:
+        if path.endswith('.jsonl'):
+            for line in stream:
+                if line.strip():
+                    record = json.loads(line)
+                    game = GameState(joker_columns=parse_pairing(record['pairing']))
+                    yield game, record['moves'], record['winner']
+        else:
+            for pgn_game in read_games(stream):
+                # Replaying no moves gives the start position, honouring a FEN tag
+                game = game_from_pgn(pgn_game._replace(moves=[]))
+                yield game, pgn_game.moves, WINNERS.get(pgn_game.result)
+
+def collect(paths, plies=20):
+    """Count every (position, move) pair in the first plies of each game.
+
+    Returns {(hash, packed move): [games, summed result for the mover]}.
+    """
+    stats = {}
+    for path in paths:
+        for game, moves, winner in _read_archive(path):
+            for text in moves[:plies]:
+                start_pos, end_pos = parse_move(text)
+                if end_pos not in game.legal_moves().get(start_pos, []):
+                    break
+                mover = 'white' if game.current_player_white else 'black'
+                result = 0 if winner is None else (1 if winner == mover else -1)
+                entry = stats.setdefault((game.hash, pack_move(start_pos, end_pos)), [0, 0])
+                entry[0] += 1
+                entry[1] += result
+                game.make_move(start_pos, end_pos)
+    return stats
+
+def write_book(stats, output, min_games=1):
+    """Write collected statistics as a sorted book file, returning the record count"""
+    records = np.array([(key, move, min(games, 0xFFFF), round(1000 * total / games))
+                        for (key, move), (games, total) in stats.items() if games >= min_games],
+                       dtype=BOOK_DTYPE)
+    # Sort by hash, and most played first within a position
+    records = records[np.lexsort((-records['weight'].astype(np.int32), records['key']))]
+    records.tofile(output)
+    return len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or probe a chess with jokers opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build a book from self-play JSONL or PGN archives')
+    build.add_argument('archives', nargs='+')
+    build.add_argument('--output', required=True)
+    build.add_argument('--plies', type=int, default=20, help='plies of each game to include')
+    build.add_argument('--min-games', type=int, default=1, help='drop moves played fewer times')
+
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('--pairing', required=True, help="joker columns as files, e.g. 'bg'")
+    probe.add_argument('--moves', nargs='*', default=[])
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        stats = collect(args.archives, args.plies)
+        count = write_book(stats, args.output, args.min_games)
+        print(f"{count} book moves written to {args.output}", file=sys.stderr)
+        return
+
+    book = OpeningBook(args.book)
+    try:
+        game = replay(args.moves, parse_pairing(args.pairing))
+    except ValueError as e:
+        parser.error(str(e))
+    for entry in book.lookup(game.hash):
+        print(f"{move_name(*entry.move)} weight {entry.weight} score {entry.score / 1000:+.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,38 @@
 import numpy as np
 import random
+import sys
+from array import array
+from itertools import combinations
+
+import evaluation
+import zobrist
 
 # Import constants directly instead of importing from pieces
 from pieces import (W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING,
                    B_PAWN, B_ROOK, B_KNIGHT, B_BISHOP, B_QUEEN, B_KING,
                    get_basic_moves)
 
-def initialize_board():
+# Define valid positions for joker pieces (excluding king position)
+JOKER_COLUMNS = [0, 1, 2, 3, 5, 6, 7]  # Position 4 is king
+# Every distinct pair of joker columns a game can start with
+JOKER_PAIRINGS = list(combinations(JOKER_COLUMNS, 2))
+
+# Castling rights are the bits of GameState.castling
+CASTLE_WHITE_KINGSIDE, CASTLE_WHITE_QUEENSIDE = 1, 2
+CASTLE_BLACK_KINGSIDE, CASTLE_BLACK_QUEENSIDE = 4, 8
+ALL_CASTLING = 15
+# Rights lost when a piece leaves a king or rook home square, by square index
+CASTLING_LOST = {4: 12, 0: CASTLE_BLACK_QUEENSIDE, 7: CASTLE_BLACK_KINGSIDE,
+                 60: 3, 56: CASTLE_WHITE_QUEENSIDE, 63: CASTLE_WHITE_KINGSIDE}
+# One side's two castling bits (kingside, queenside) in the form move generators take
+SIDE_CASTLING = [{'kingside': bool(bits & 1), 'queenside': bool(bits & 2)} for bits in range(4)]
+
+# Kinds of move, stored in the top two bits of a packed move
+MOVE_NORMAL, MOVE_PROMOTION, MOVE_EN_PASSANT, MOVE_CASTLING = 0, 1, 2, 3
+# Promotion pieces by the two bit code stored below the kind
+PROMOTION_PIECES = (W_KNIGHT, W_BISHOP, W_ROOK, W_QUEEN)
+
+def initialize_board(joker_columns=None):
     board = np.zeros((8, 8), dtype=np.int8)
     board[1, :] = B_PAWN
     board[6, :] = W_PAWN
@@ -16,11 +42,11 @@ def initialize_board():
         board[0, i] = -piece  # Black pieces
         board[7, i] = piece   # White pieces
     
-    # Define valid positions for joker pieces (excluding king position)
-    valid_positions = [0, 1, 2, 3, 5, 6, 7]  # Position 4 is king
-    
-    # Select random positions for white joker pieces
-    white_positions = random.sample(valid_positions, 2)
+    # Select random positions for white joker pieces unless a pairing was given
+    if joker_columns is None:
+        white_positions = random.sample(JOKER_COLUMNS, 2)
+    else:
+        white_positions = list(joker_columns)
     # Select corresponding positions for black joker pieces
     black_positions = white_positions.copy()  # Use same positions on black side
     
@@ -42,70 +68,27 @@ def initialize_board():
     
     return board, joker_mapping
 
-def is_checkmate(board, is_white, joker_mapping=None, moved_jokers=None):
-    if not is_in_check(board, is_white, joker_mapping, moved_jokers):
+def initial_movement(joker_mapping):
+    """Build the 8x8 movement plane of the starting position.
+
+    Each square holds the movement type of the joker standing on it, or 0
+    where the piece moves as itself.
+    """
+    movement = np.zeros((8, 8), dtype=np.int8)
+    for side, home_row in (('white', 7), ('black', 0)):
+        for col, move_piece in joker_mapping[side]['moves']:
+            movement[home_row, col] = abs(move_piece)
+    return movement
+
+def is_checkmate(board, is_white, movement=None, pieces=None):
+    if not is_in_check(board, is_white, movement, pieces):
         return False
-    
-    for i in range(8):
-        for j in range(8):
-            piece = board[i, j]
-            if (is_white and piece > 0) or (not is_white and piece < 0):
-                moves = get_valid_moves(piece, (i, j), board, None, None, joker_mapping, moved_jokers)
-                for move in moves:
-                    temp_board = board.copy()
-                    temp_board[move[0], move[1]] = piece
-                    temp_board[i, j] = 0
-                    if not is_in_check(temp_board, is_white, joker_mapping, moved_jokers):
-                        return False
-    return True
-
-def is_stalemate(board, is_white, joker_mapping=None, moved_jokers=None):
-    if is_in_check(board, is_white, joker_mapping, moved_jokers):
+    return not has_any_legal_move(board, is_white, movement, pieces=pieces)
+
+def is_stalemate(board, is_white, movement=None, pieces=None):
+    if is_in_check(board, is_white, movement, pieces):
         return False
-        
-    for i in range(8):
-        for j in range(8):
-            piece = board[i, j]
-            if (is_white and piece > 0) or (not is_white and piece < 0):
-                moves = get_valid_moves(piece, (i, j), board, None, None, joker_mapping, moved_jokers)
-                for move in moves:
-                    temp_board = board.copy()
-                    temp_board[move[0], move[1]] = piece
-                    temp_board[i, j] = 0
-                    if not is_in_check(temp_board, is_white, joker_mapping, moved_jokers):
-                        return False
-    return True
-
-def handle_castling(board, start_pos, end_pos, castling_rights):
-    row, col = start_pos
-    new_row, new_col = end_pos
-    piece = board[row, col]
-    
-    if abs(piece) == W_KING and abs(col - new_col) == 2:  # Changed KING to W_KING
-        if new_col > col:
-            rook_start = (row, 7)
-            rook_end = (row, 5)
-        else:
-            rook_start = (row, 0)
-            rook_end = (row, 3)
-            
-        board[rook_end[0], rook_end[1]] = board[rook_start[0], rook_start[1]]
-        board[rook_start[0], rook_start[1]] = 0
-        
-    if abs(piece) == W_KING:  # Changed KING to W_KING
-        if piece > 0:
-            castling_rights['White'] = {'kingside': False, 'queenside': False}
-        else:
-            castling_rights['Black'] = {'kingside': False, 'queenside': False}
-    
-    if row == 0 and col == 0:
-        castling_rights['Black']['queenside'] = False
-    elif row == 0 and col == 7:
-        castling_rights['Black']['kingside'] = False
-    elif row == 7 and col == 0:
-        castling_rights['White']['queenside'] = False
-    elif row == 7 and col == 7:
-        castling_rights['White']['kingside'] = False
+    return not has_any_legal_move(board, is_white, movement, pieces=pieces)
 
 def handle_pawn_promotion(board, pos, is_white):
     """Handle pawn promotion"""
@@ -114,24 +97,66 @@ def handle_pawn_promotion(board, pos, is_white):
         return board[row, col] * 5
     return board[row, col]
 
-def handle_en_passant(board, start_pos, end_pos, last_move):
-    """Handle en passant capture"""
-    if last_move is None:
-        return False
-        
-    start_row, start_col = start_pos
-    end_row, end_col = end_pos
-    last_start_row, last_start_col = last_move[0]
-    last_end_row, last_end_col = last_move[1]
-    
-    piece = board[start_row, start_col]
-    if abs(piece) == W_PAWN:  # Changed PAWN to W_PAWN
-        if abs(start_col - end_col) == 1 and board[end_row, end_col] == 0:
-            if (piece > 0 and start_row == 3) or (piece < 0 and start_row == 4):
-                if abs(last_start_row - last_end_row) == 2:
-                    board[last_end_row, last_end_col] = 0
-                    return True
-    return False
+def square_name(pos):
+    """Convert (row, col) to a square name such as 'e2'"""
+    row, col = pos
+    return 'abcdefgh'[col] + str(8 - row)
+
+def parse_square(name):
+    """Convert a square name such as 'e2' to (row, col)"""
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f"Invalid square: {name}")
+    return (8 - int(name[1]), 'abcdefgh'.index(name[0]))
+
+def move_name(start_pos, end_pos):
+    return square_name(start_pos) + square_name(end_pos)
+
+def pack_move(start_pos, end_pos, kind=MOVE_NORMAL, promotion=W_QUEEN):
+    """Pack a move into 16 bits: from | to << 6 | promotion << 12 | kind << 14.
+
+    The promotion bits index PROMOTION_PIECES and are only set for
+    MOVE_PROMOTION. Plain from/to packing (kind MOVE_NORMAL) is what the
+    opening book and transposition tables store.
+    """
+    packed = (start_pos[0] * 8 + start_pos[1]) | (end_pos[0] * 8 + end_pos[1]) << 6 | kind << 14
+    if kind == MOVE_PROMOTION:
+        packed |= PROMOTION_PIECES.index(promotion) << 12
+    return packed
+
+def unpack_move(packed):
+    """Inverse of pack_move, returning (start_pos, end_pos)"""
+    start, end = packed & 63, (packed >> 6) & 63
+    return (start // 8, start % 8), (end // 8, end % 8)
+
+def move_kind(packed):
+    return packed >> 14
+
+def move_promotion(packed):
+    """Piece type a packed move promotes to, or None"""
+    if packed >> 14 != MOVE_PROMOTION:
+        return None
+    return PROMOTION_PIECES[(packed >> 12) & 3]
+
+def parse_move(text):
+    """Convert coordinate notation such as 'e2e4' to (start_pos, end_pos)"""
+    if len(text) != 4:
+        raise ValueError(f"Invalid move: {text}")
+    return parse_square(text[:2]), parse_square(text[2:])
+
+def pairing_name(joker_columns):
+    """Name a joker pairing by its files, e.g. (1, 6) -> 'bg'"""
+    return ''.join('abcdefgh'[col] for col in joker_columns)
+
+def parse_pairing(text):
+    """Convert a joker pairing name such as 'bg' to its columns"""
+    columns = tuple(sorted('abcdefgh'.index(f) for f in text if f in 'abcdefgh'))
+    if len(columns) != 2 or columns not in JOKER_PAIRINGS:
+        raise ValueError(f"Invalid joker pairing: {text}")
+    return columns
+
+def get_joker_columns(joker_mapping):
+    """Columns of the joker pieces in ascending order; the swap is symmetric"""
+    return tuple(sorted(int(piece_pos[0]) for piece_pos in joker_mapping['white']['pieces']))
 
 def get_piece_at(board, pos):
     """Get piece at given position"""
@@ -140,38 +165,14 @@ def get_piece_at(board, pos):
         return board[row, col]
     return None
 
-def get_piece_movement_type(pos, joker_mapping, moved_jokers=None):
-    """Get the actual movement type for a piece considering joker rules and moved pieces"""
-    row, col = pos
-    
-    # Check moved jokers first
-    if moved_jokers:
-        # Check if this position is in moved jokers
-        if pos in moved_jokers['white']:
-            orig_col = moved_jokers['white'][pos]
-            for piece_pos, move_pos in zip(joker_mapping['white']['pieces'], joker_mapping['white']['moves']):
-                if orig_col == piece_pos[0]:
-                    return abs(move_pos[1])
-                    
-        if pos in moved_jokers['black']:
-            orig_col = moved_jokers['black'][pos]
-            for piece_pos, move_pos in zip(joker_mapping['black']['pieces'], joker_mapping['black']['moves']):
-                if orig_col == piece_pos[0]:
-                    return abs(move_pos[1])
-    
-    # Check initial positions (unchanged)
-    if row == 7:
-        for piece_pos, move_pos in zip(joker_mapping['white']['pieces'], joker_mapping['white']['moves']):
-            if col == piece_pos[0]:
-                return abs(move_pos[1])
-    elif row == 0:
-        for piece_pos, move_pos in zip(joker_mapping['black']['pieces'], joker_mapping['black']['moves']):
-            if col == piece_pos[0]:
-                return abs(move_pos[1])
-    
-    return None
+def get_piece_movement_type(pos, movement):
+    """Get the movement type of the joker on pos from a movement plane, or None"""
+    if movement is None:
+        return None
+    movement_type = movement[pos[0], pos[1]]
+    return int(movement_type) if movement_type else None
 
-def is_valid_move(board, start_pos, end_pos, is_white, joker_mapping, moved_jokers=None):
+def is_valid_move(board, start_pos, end_pos, is_white, movement=None):
     piece = get_piece_at(board, start_pos)
     if piece is None:
         return False
@@ -180,24 +181,27 @@ def is_valid_move(board, start_pos, end_pos, is_white, joker_mapping, moved_joke
         return False
     
     # Check if piece is a joker and use its movement type
-    movement_type = get_piece_movement_type(start_pos, joker_mapping, moved_jokers)
+    movement_type = get_piece_movement_type(start_pos, movement)
     if movement_type:
         piece_for_movement = movement_type if is_white else -movement_type
-        moves = get_valid_moves(piece_for_movement, start_pos, board)
+        moves = get_valid_moves(piece_for_movement, start_pos, board, None, None, movement)
     else:
-        moves = get_valid_moves(piece, start_pos, board)
+        moves = get_valid_moves(piece, start_pos, board, None, None, movement)
     
     return end_pos in moves
 
-def HasInsufficientMaterial(board):
+def HasInsufficientMaterial(board, movement=None):
+    """Check for K v K or K and a lone minor piece v K, judging jokers by how they move"""
     pieces = {'W': [], 'B': []}
     for i in range(8):
         for j in range(8):
             piece = board[i, j]
+            # A pawn can still promote whatever it moves like, so it keeps its own type
+            movement_type = movement[i, j] if movement is not None and abs(piece) != W_PAWN else 0
             if piece > 0:
-                pieces['W'].append(abs(piece))
+                pieces['W'].append(movement_type or abs(piece))
             elif piece < 0:
-                pieces['B'].append(abs(piece))
+                pieces['B'].append(movement_type or abs(piece))
     
     if len(pieces['W']) == 1 and len(pieces['B']) == 1:
         return True
@@ -210,6 +214,79 @@ def HasInsufficientMaterial(board):
     
     return False
 
+class PieceLists:
+    """Where the pieces of each side stand, updated move by move by GameState.
+
+    squares holds one bitset of occupied squares per side (bit row * 8 + col,
+    white first), kings the square index of each king or None, and counts
+    the number of pieces of every signed piece value, indexed by piece + 6.
+    movers counts the same pieces by how they move, indexed by the signed
+    movement type + 6, so a joker counts as the piece it moves like.
+    """
+
+    __slots__ = ('squares', 'kings', 'counts', 'movers')
+
+    def __init__(self, board, movement=None):
+        self.squares = [0, 0]
+        self.kings = [None, None]
+        self.counts = array('B', bytes(13))
+        self.movers = array('B', bytes(13))
+        movement_types = movement.ravel().tolist() if movement is not None else [0] * 64
+        for sq, (piece, movement_type) in enumerate(zip(board.ravel().tolist(), movement_types)):
+            if piece:
+                self.add(sq, piece, movement_type)
+
+    def add(self, sq, piece, movement_type=0):
+        side = 0 if piece > 0 else 1
+        self.squares[side] |= 1 << sq
+        self.counts[piece + 6] += 1
+        mover = movement_type or abs(piece)
+        self.movers[(mover if side == 0 else -mover) + 6] += 1
+        if piece == W_KING or piece == B_KING:
+            self.kings[side] = sq
+
+    def remove(self, sq, piece, movement_type=0):
+        side = 0 if piece > 0 else 1
+        self.squares[side] &= ~(1 << sq)
+        self.counts[piece + 6] -= 1
+        mover = movement_type or abs(piece)
+        self.movers[(mover if side == 0 else -mover) + 6] -= 1
+        if (piece == W_KING or piece == B_KING) and self.kings[side] == sq:
+            self.kings[side] = None
+
+    def iter_squares(self, is_white):
+        """Yield the (row, col) of every piece of a side in board order"""
+        bits = self.squares[0 if is_white else 1]
+        while bits:
+            low = bits & -bits
+            yield divmod(low.bit_length() - 1, 8)
+            bits ^= low
+
+    def king(self, is_white):
+        sq = self.kings[0 if is_white else 1]
+        return None if sq is None else divmod(sq, 8)
+
+    def count(self, is_white):
+        return bin(self.squares[0 if is_white else 1]).count('1')
+
+    def insufficient_material(self):
+        """Same rule as HasInsufficientMaterial, from the counts by movement type.
+
+        A lone piece that moves like a bishop or knight cannot mate, unless
+        it is a pawn, which can still promote.
+        """
+        white, black = self.count(True), self.count(False)
+        if white == 1 and black == 1:
+            return True
+        counts, movers = self.counts, self.movers
+        if (white == 2 and black == 1 and (movers[W_BISHOP + 6] or movers[W_KNIGHT + 6])
+                and not counts[W_PAWN + 6]):
+            return True
+        if (black == 2 and white == 1 and (movers[B_BISHOP + 6] or movers[B_KNIGHT + 6])
+                and not counts[B_PAWN + 6]):
+            return True
+        return False
+
 def get_piece_name(piece_value):
     """Convert piece value to readable name"""
     piece_names = {
@@ -240,57 +317,587 @@ def format_joker_info(joker_mapping):
     
     return info_lines
 
-def is_in_check(board, is_white, joker_mapping=None, moved_jokers=None):
-    """Check if the king is in check, considering joker pieces"""
-    king = W_KING if is_white else B_KING
-    king_pos = None
-    
-    # Find king position
-    for i in range(8):
-        for j in range(8):
-            if board[i][j] == king:
-                king_pos = (i, j)
-                break
-        if king_pos:
-            break
-            
-    if not king_pos:
+KNIGHT_JUMPS = [(2,1), (2,-1), (-2,1), (-2,-1), (1,2), (1,-2), (-1,2), (-1,-2)]
+ROOK_DIRECTIONS = [(0,1), (0,-1), (1,0), (-1,0)]
+BISHOP_DIRECTIONS = [(1,1), (1,-1), (-1,1), (-1,-1)]
+
+def find_attacker(board, pos, by_white, movement=None):
+    """Return the position of a piece of the given colour attacking pos, or None.
+
+    Probes outward from pos along knight jumps and rays instead of generating
+    the moves of every enemy piece.
+    """
+    cells = board.ravel().tolist()
+    types = movement.ravel().tolist() if movement is not None else [0] * 64
+    row, col = pos
+    sign = 1 if by_white else -1
+
+    for dr, dc in KNIGHT_JUMPS:
+        r, c = row + dr, col + dc
+        if 0 <= r < 8 and 0 <= c < 8:
+            piece = cells[r * 8 + c]
+            if piece * sign > 0 and (types[r * 8 + c] or abs(piece)) == W_KNIGHT:
+                return (r, c)
+
+    for directions, slider in ((ROOK_DIRECTIONS, W_ROOK), (BISHOP_DIRECTIONS, W_BISHOP)):
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            adjacent = True
+            while 0 <= r < 8 and 0 <= c < 8:
+                piece = cells[r * 8 + c]
+                if piece != 0:
+                    if piece * sign > 0:
+                        kind = types[r * 8 + c] or abs(piece)
+                        if kind == slider or kind == W_QUEEN:
+                            return (r, c)
+                        if adjacent and kind == W_KING:
+                            return (r, c)
+                        # Pawns capture towards the opponent, so a white pawn sits one row below
+                        if adjacent and kind == W_PAWN and slider == W_BISHOP and dr == sign:
+                            return (r, c)
+                    break
+                r, c = r + dr, c + dc
+                adjacent = False
+    return None
+
+def _king_position(board, is_white, pieces=None):
+    if pieces is not None:
+        return pieces.king(is_white)
+    matches = np.flatnonzero(board == (W_KING if is_white else B_KING))
+    return divmod(int(matches[0]), 8) if len(matches) else None
+
+def is_in_check(board, is_white, movement=None, pieces=None):
+    """Check if the king is in check, considering joker pieces.
+
+    With the PieceLists of the position the king square is read from it
+    instead of searching the board.
+    """
+    king_pos = _king_position(board, is_white, pieces)
+    if king_pos is None:
         return False
-    
-    # Check for attacking pieces
-    for i in range(8):
-        for j in range(8):
-            piece = board[i][j]
-            if piece != 0 and ((is_white and piece < 0) or (not is_white and piece > 0)):
-                # Check if this piece is a joker
-                movement_type = None
-                if joker_mapping and moved_jokers:
-                    movement_type = get_piece_movement_type((i, j), joker_mapping, moved_jokers)
-                
-                if movement_type:
-                    # Use joker movement type
-                    piece_for_moves = movement_type if not is_white else -movement_type
-                    moves = get_basic_moves(piece_for_moves, (i, j), board)
-                else:
-                    # Use normal piece movement
-                    moves = get_basic_moves(piece, (i, j), board)
-                    
-                if king_pos in moves:
-                    return True
-    return False
+    return find_attacker(board, king_pos, not is_white, movement) is not None
+
+def _checks_and_pins(board, king_pos, is_white, movement=None):
+    """Find what limits the moves of a side other than its king's.
+
+    Returns (check_squares, pins). check_squares is None when the king is
+    not in check, else the squares a move must land on to answer the check:
+    the checker and the squares between it and the king, or none at all in
+    double check. A pinned piece, keyed by square in pins, must stay on the
+    squares between its king and the pinner, the pinner included. Like
+    find_attacker, probes outward from the king and follows joker movement.
+    """
+    if king_pos is None:
+        return None, {}
+    cells = board.ravel().tolist()
+    types = movement.ravel().tolist() if movement is not None else [0] * 64
+    row, col = king_pos
+    sign = -1 if is_white else 1
+    checks = []
+    pins = {}
+
+    for dr, dc in KNIGHT_JUMPS:
+        r, c = row + dr, col + dc
+        if 0 <= r < 8 and 0 <= c < 8:
+            piece = cells[r * 8 + c]
+            if piece * sign > 0 and (types[r * 8 + c] or abs(piece)) == W_KNIGHT:
+                checks.append([(r, c)])
+
+    for directions, slider in ((ROOK_DIRECTIONS, W_ROOK), (BISHOP_DIRECTIONS, W_BISHOP)):
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            line = []
+            blocker = None
+            while 0 <= r < 8 and 0 <= c < 8:
+                line.append((r, c))
+                piece = cells[r * 8 + c]
+                if piece * sign > 0:
+                    kind = types[r * 8 + c] or abs(piece)
+                    attacks = kind == slider or kind == W_QUEEN
+                    if len(line) == 1:
+                        # Pawns capture towards the opponent, as in find_attacker
+                        attacks = attacks or kind == W_KING or (
+                            kind == W_PAWN and slider == W_BISHOP and dr == sign)
+                    if attacks and blocker is None:
+                        checks.append(line)
+                    elif attacks:
+                        pins[blocker] = set(line)
+                    break
+                if piece != 0:
+                    if blocker is not None:
+                        break
+                    blocker = (r, c)
+                r, c = r + dr, c + dc
+
+    if not checks:
+        return None, pins
+    return (set(checks[0]) if len(checks) == 1 else set()), pins
+
+def _answers_checks_and_pins(pos, move, check_squares, pins):
+    """Whether a move of a piece other than the king keeps its king safe"""
+    if check_squares is not None and move not in check_squares:
+        return False
+    pinned = pins.get(pos)
+    return pinned is None or move in pinned
+
+def _is_legal(piece, pos, move, board, movement, king_pos):
+    """Whether moving piece from pos to move leaves its own king, on king_pos, safe.
 
-def get_valid_moves(piece, pos, board, castling_rights=None, en_passant=None, joker_mapping=None, moved_jokers=None):
+    Only king moves are tested this way; the moves of every other piece are
+    filtered with the masks of _checks_and_pins.
+    """
+    row, col = pos
+    is_white = piece > 0
+    if piece == (W_KING if is_white else B_KING):
+        king_pos = move
+    elif king_pos is None:
+        return True
+    original = board[row, col]
+    captured = board[move[0], move[1]]
+    # Try the move on the board itself and put the squares back afterwards.
+    # Only the mover's side changes, so stale movement entries are never read.
+    board[move[0], move[1]] = piece
+    board[row, col] = 0
+    try:
+        return find_attacker(board, king_pos, not is_white, movement) is None
+    finally:
+        board[row, col] = original
+        board[move[0], move[1]] = captured
+
+def get_valid_moves(piece, pos, board, castling_rights=None, en_passant=None, movement=None,
+                    pieces=None):
     """Get valid moves considering check and joker pieces"""
     moves = get_basic_moves(piece, pos, board, castling_rights, en_passant)
-    valid_moves = []
     is_white = piece > 0
-    row, col = pos
-    
-    for move in moves:
-        temp_board = board.copy()
-        temp_board[move[0]][move[1]] = piece
-        temp_board[row][col] = 0
-        if not is_in_check(temp_board, is_white, joker_mapping, moved_jokers):
-            valid_moves.append(move)
-            
-    return valid_moves
+    king_pos = _king_position(board, is_white, pieces)
+    if piece == (W_KING if is_white else B_KING):
+        return [move for move in moves if _is_legal(piece, pos, move, board, movement, king_pos)]
+    check_squares, pins = _checks_and_pins(board, king_pos, is_white, movement)
+    return [move for move in moves if _answers_checks_and_pins(pos, move, check_squares, pins)]
+
+def _side_pieces(board, is_white, movement, en_passant, pieces):
+    """(piece to generate moves for, square, en passant target) of every piece but the king"""
+    sign = 1 if is_white else -1
+    if pieces is None:
+        pieces = PieceLists(board, movement)
+    result = []
+    for row, col in pieces.iter_squares(is_white):
+        piece = int(board[row, col])
+        movement_type = int(movement[row, col]) if movement is not None else 0
+        if movement_type:
+            # Joker pieces move like their partner and never castle or capture en passant
+            result.append((movement_type * sign, (row, col), None))
+        elif piece != W_KING * sign:
+            result.append((piece, (row, col), en_passant))
+    return result
+
+def iter_legal_moves(board, is_white, movement=None, castling_rights=None, en_passant=None,
+                     pieces=None):
+    """Yield the legal (start_pos, end_pos) moves of a side one at a time.
+
+    The moves most likely to exist in a tight spot come first: king moves,
+    then captures of a checking piece, then everything else. Checks and pins
+    are worked out once, so each candidate other than a king move costs a
+    set lookup, and a caller that stops early pays only for the moves it
+    looked at. The position must not change while iterating.
+    """
+    king = W_KING if is_white else B_KING
+    king_pos = _king_position(board, is_white, pieces)
+    if king_pos is not None:
+        for move in get_basic_moves(king, king_pos, board, castling_rights, None):
+            if _is_legal(king, king_pos, move, board, movement, king_pos):
+                yield king_pos, move
+
+    check_squares, pins = _checks_and_pins(board, king_pos, is_white, movement)
+    if check_squares is not None and not check_squares:
+        # Only the king can answer a double check
+        return
+    others = _side_pieces(board, is_white, movement, en_passant, pieces)
+    if check_squares is None:
+        for piece, pos, target in others:
+            for move in get_basic_moves(piece, pos, board, None, target):
+                if _answers_checks_and_pins(pos, move, check_squares, pins):
+                    yield pos, move
+        return
+
+    # In check only capturing the checker or blocking can help, so captures go first
+    generated = [(pos, get_basic_moves(piece, pos, board, None, target))
+                 for piece, pos, target in others]
+    for captures in (True, False):
+        for pos, moves in generated:
+            for move in moves:
+                if ((board[move] != 0) == captures and
+                        _answers_checks_and_pins(pos, move, check_squares, pins)):
+                    yield pos, move
+
+def legal_move_table(board, is_white, movement=None, castling_rights=None, en_passant=None,
+                     pieces=None):
+    """Map every square of a side to its legal destinations, in board order.
+
+    Checks and pins are worked out once for the position, so only king moves
+    are tried on the board; every other candidate is a set lookup.
+    """
+    if pieces is None:
+        pieces = PieceLists(board, movement)
+    king_pos = pieces.king(is_white)
+    check_squares, pins = _checks_and_pins(board, king_pos, is_white, movement)
+    sign = 1 if is_white else -1
+    table = {}
+    for row, col in pieces.iter_squares(is_white):
+        movement_type = int(movement[row, col]) if movement is not None else 0
+        if movement_type:
+            # Joker pieces move like their partner and never castle or capture en passant
+            piece, rights, target = movement_type * sign, None, None
+        else:
+            piece, rights, target = int(board[row, col]), castling_rights, en_passant
+        moves = get_basic_moves(piece, (row, col), board, rights, target)
+        if (row, col) == king_pos:
+            table[(row, col)] = [move for move in moves
+                                 if _is_legal(piece, (row, col), move, board, movement, king_pos)]
+        else:
+            table[(row, col)] = [move for move in moves
+                                 if _answers_checks_and_pins((row, col), move, check_squares, pins)]
+    return table
+
+def has_any_legal_move(board, is_white, movement=None, castling_rights=None, en_passant=None,
+                       pieces=None):
+    """Whether the side has a legal move, stopping at the first one found"""
+    moves = iter_legal_moves(board, is_white, movement, castling_rights, en_passant, pieces)
+    return next(moves, None) is not None
+
+def get_backend(name='numpy'):
+    """Return the module providing move generation for the given backend name"""
+    if name == 'numpy':
+        return sys.modules[__name__]
+    if name == 'bitboard':
+        import bitboard
+        return bitboard
+    raise ValueError(f"Unknown move generation backend: {name}")
+
+class GameState:
+    """A game in progress: the position, its hash and the moves that led to it.
+
+    The position is kept in flat fields (castling bits, en passant square
+    index, move counters) and the moves played as 16-bit packed moves, so
+    thousands of games fit in memory at once. Any earlier position can be
+    recovered with replay_to from the starting position and the history.
+    """
+
+    __slots__ = ('board', 'movement', 'joker_mapping', 'backend', 'rules', 'current_player_white',
+                 'castling', 'en_passant', 'halfmove_clock', 'fullmove_number', 'hash',
+                 'score', 'hash_history', 'move_history', 'pieces', '_start', '_legal_moves',
+                 '_legal_moves_hash', '_status', '_status_valid')
+
+    def __init__(self, backend='numpy', joker_columns=None):
+        self.board, self.joker_mapping = initialize_board(joker_columns)
+        # Module implementing get_valid_moves/is_in_check/is_checkmate/is_stalemate
+        self.backend = backend
+        self.rules = get_backend(backend)
+        # Movement type of the joker on each square, 0 for every other square.
+        # Entries travel with their piece and vanish when it is captured.
+        self.movement = initial_movement(self.joker_mapping)
+        self._reset(True, ALL_CASTLING, None, 0, 1)
+
+    def _reset(self, white_to_move, castling, en_passant, halfmove_clock, fullmove_number):
+        """Start a new history from the current board and movement plane"""
+        self.current_player_white = white_to_move
+        self.castling = castling
+        # Square index of the en passant target, or None
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        # Piece squares, king squares and material, kept in step with the board
+        self.pieces = PieceLists(self.board, self.movement)
+        # Everything replay_to needs to rebuild the position the history starts from
+        self._start = (self.board.tobytes(), self.movement.tobytes(), white_to_move, castling,
+                       en_passant, halfmove_clock, fullmove_number)
+        # Packed moves played since then (see pack_move)
+        self.move_history = array('H')
+        # Zobrist hash of the current position and of every position since the start
+        self.hash = zobrist.position_hash(self.board, white_to_move, castling, en_passant,
+                                          self.joker_overrides())
+        self.hash_history = array('Q', [self.hash])
+        # Material and piece-square score from white's point of view (see evaluation)
+        self.score = evaluation.evaluate(self.board, self.movement)
+        # Legal move table, built once per position hash
+        self._legal_moves = None
+        self._legal_moves_hash = None
+        # Game status, which also depends on history, so moves reset it
+        self._status = None
+        self._status_valid = False
+
+    def __getstate__(self):
+        # Modules cannot be pickled, so worker processes look the backend up again
+        return {name: getattr(self, name) for name in self.__slots__
+                if name not in ('rules', '_legal_moves', '_legal_moves_hash')}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.rules = get_backend(self.backend)
+        self._legal_moves = None
+        self._legal_moves_hash = None
+
+    def set_position(self, board, movement, white_to_move, castling, en_passant=None,
+                     halfmove_clock=0, fullmove_number=1):
+        """Replace the current position, e.g. one read from a FEN, and forget the history.
+
+        castling holds the CASTLE_* bits and en_passant is the index of the
+        target square (row * 8 + col) or None.
+        """
+        self.board = np.array(board, dtype=np.int8)
+        self.movement = np.array(movement, dtype=np.int8)
+        self._reset(white_to_move, castling, en_passant, halfmove_clock, fullmove_number)
+
+    @property
+    def en_passant_target(self):
+        """The en passant target as (row, col), or None"""
+        return None if self.en_passant is None else divmod(self.en_passant, 8)
+
+    @property
+    def last_move(self):
+        """The last move played as (start_pos, end_pos), or None at the start of the history"""
+        return unpack_move(self.move_history[-1]) if self.move_history else None
+
+    @property
+    def ply(self):
+        return len(self.move_history)
+
+    def replay_to(self, ply):
+        """Go back to the position after the first ply moves of the history.
+
+        ply must be at most the number of moves played. Moves after ply are
+        dropped from the history, so a new move can follow.
+        """
+        if not 0 <= ply <= len(self.move_history):
+            raise ValueError(f"No ply {ply} in a history of {len(self.move_history)} moves")
+        moves = self.move_history[:ply]
+        board, movement, white_to_move, castling, en_passant, halfmove_clock, fullmove_number = self._start
+        self.board = np.frombuffer(board, dtype=np.int8).reshape(8, 8).copy()
+        self.movement = np.frombuffer(movement, dtype=np.int8).reshape(8, 8).copy()
+        self._reset(white_to_move, castling, en_passant, halfmove_clock, fullmove_number)
+        for packed in moves:
+            self.make_move(*unpack_move(packed))
+
+    def takeback(self, plies=1):
+        """Undo the last plies moves of the history"""
+        self.replay_to(len(self.move_history) - plies)
+
+    def joker_overrides(self):
+        """List the (pos, movement_type) pairs where joker movement currently applies"""
+        rows, cols = np.nonzero(self.movement)
+        return [((int(row), int(col)), int(self.movement[row, col])) for row, col in zip(rows, cols)]
+
+    def valid_moves_from(self, pos):
+        """Get the legal destinations of the piece on pos for the side to move"""
+        row, col = pos
+        piece = self.board[row, col]
+        is_white = self.current_player_white
+        if piece == 0 or (is_white and piece < 0) or (not is_white and piece > 0):
+            return []
+        
+        # Joker pieces move like their partner and never castle or capture en passant
+        movement_type = self.movement[row, col]
+        if movement_type:
+            piece_for_moves = movement_type if is_white else -movement_type
+            return self.rules.get_valid_moves(piece_for_moves, pos, self.board,
+                                              None, None, self.movement)
+        castling = self.castling & 3 if is_white else self.castling >> 2
+        return self.rules.get_valid_moves(piece, pos, self.board, SIDE_CASTLING[castling],
+                                          self.en_passant_target, self.movement)
+
+    def legal_moves(self):
+        """Map every square of the side to move to its legal destinations.
+
+        The table is built once per position and reused until a move changes
+        the position hash.
+        """
+        if self._legal_moves_hash != self.hash:
+            is_white = self.current_player_white
+            castling = self.castling & 3 if is_white else self.castling >> 2
+            self._legal_moves = self.rules.legal_move_table(self.board, is_white, self.movement,
+                                                            SIDE_CASTLING[castling], self.en_passant_target,
+                                                            self.pieces)
+            self._legal_moves_hash = self.hash
+        return self._legal_moves
+
+    def all_valid_moves(self):
+        """Get every legal (start_pos, end_pos) move for the side to move"""
+        return [(start_pos, end_pos) for start_pos, ends in self.legal_moves().items() for end_pos in ends]
+
+    def iter_legal_moves(self):
+        """Yield the legal (start_pos, end_pos) moves one at a time, likely escapes first"""
+        if self._legal_moves_hash == self.hash:
+            return ((start_pos, end_pos) for start_pos, ends in self._legal_moves.items() for end_pos in ends)
+        is_white = self.current_player_white
+        castling = self.castling & 3 if is_white else self.castling >> 2
+        return self.rules.iter_legal_moves(self.board, is_white, self.movement, SIDE_CASTLING[castling],
+                                           self.en_passant_target, self.pieces)
+
+    def has_any_legal_move(self):
+        """Whether the side to move has a legal move, stopping at the first one found"""
+        return next(self.iter_legal_moves(), None) is not None
+
+    def game_status(self):
+        """Return 'checkmate', 'stalemate', 'insufficient_material', 'repetition',
+        'fifty_moves', 'check' or None for the current position"""
+        if not self._status_valid:
+            in_check = self.rules.is_in_check(self.board, self.current_player_white, self.movement,
+                                              self.pieces)
+            if not self.has_any_legal_move():
+                status = 'checkmate' if in_check else 'stalemate'
+            elif self.pieces.insufficient_material():
+                status = 'insufficient_material'
+            elif self.is_threefold_repetition():
+                status = 'repetition'
+            elif self.is_fifty_move_draw():
+                status = 'fifty_moves'
+            else:
+                status = 'check' if in_check else None
+            self._status = status
+            self._status_valid = True
+        return self._status
+
+    def is_game_over(self):
+        return self.game_status() not in (None, 'check')
+
+    def make_move(self, start_pos, end_pos):
+        """Apply a move in place and return the undo record for unmake_move"""
+        board = self.board
+        movement = self.movement
+        start_row, start_col = start_pos
+        end_row, end_col = end_pos
+        moving_piece = int(board[start_row, start_col])
+        captured = int(board[end_row, end_col])
+        
+        # Every square the move touches, with its piece before the move
+        squares = {start_pos: moving_piece, end_pos: captured}
+        kind = MOVE_NORMAL
+        if abs(moving_piece) == W_PAWN:
+            if end_row == 0 or end_row == 7:
+                kind = MOVE_PROMOTION
+            elif captured == 0 and start_col != end_col:
+                # Only the en passant target can be entered diagonally without a capture
+                kind = MOVE_EN_PASSANT
+                squares[(start_row, end_col)] = int(board[start_row, end_col])
+        elif abs(moving_piece) == W_KING and abs(start_col - end_col) == 2:
+            kind = MOVE_CASTLING
+            for rook_col in ((7, 5) if end_col > start_col else (0, 3)):
+                squares[(start_row, rook_col)] = int(board[start_row, rook_col])
+        
+        self._status_valid = False
+        old_hash = self.hash
+        castling = self.castling
+        h = old_hash ^ zobrist.castling_hash(castling) ^ zobrist.en_passant_hash(self.en_passant)
+        
+        undo = (tuple((pos[0], pos[1], piece, int(movement[pos[0], pos[1]])) for pos, piece in squares.items()),
+                castling, self.en_passant, old_hash, self.halfmove_clock)
+        
+        if kind == MOVE_CASTLING:
+            rook_start, rook_end = (7, 5) if end_col > start_col else (0, 3)
+            board[start_row, rook_end] = board[start_row, rook_start]
+            board[start_row, rook_start] = 0
+            movement[start_row, rook_end] = movement[start_row, rook_start]
+            movement[start_row, rook_start] = 0
+        elif kind == MOVE_EN_PASSANT:
+            board[start_row, end_col] = 0
+        
+        # Pawns always promote to a queen
+        if kind == MOVE_PROMOTION:
+            board[end_row, end_col] = W_QUEEN if moving_piece > 0 else B_QUEEN
+        else:
+            board[end_row, end_col] = moving_piece
+        board[start_row, start_col] = 0
+        # The mover's movement type replaces whatever was captured on end_pos
+        movement[end_row, end_col] = movement[start_row, start_col]
+        movement[start_row, start_col] = 0
+        
+        # King moves give up both rights of the side, rook moves the right on that side
+        lost = CASTLING_LOST.get(start_row * 8 + start_col, 0)
+        if abs(moving_piece) == W_KING:
+            lost |= 3 if moving_piece > 0 else 12
+        self.castling = castling & ~lost
+        
+        if abs(moving_piece) == W_PAWN and abs(start_row - end_row) == 2:
+            self.en_passant = (start_row + end_row) // 2 * 8 + start_col
+        else:
+            self.en_passant = None
+        
+        self.current_player_white = not self.current_player_white
+        
+        pieces = self.pieces
+        score = self.score
+        for row, col, piece, movement_type in undo[0]:
+            new_piece = int(board[row, col])
+            new_movement_type = int(movement[row, col])
+            h ^= zobrist.piece_key(piece, row, col) ^ zobrist.piece_key(new_piece, row, col)
+            h ^= zobrist.joker_key(movement_type, row, col) ^ zobrist.joker_key(new_movement_type, row, col)
+            sq = row * 8 + col
+            score += (evaluation.square_score(new_piece, new_movement_type, sq)
+                      - evaluation.square_score(piece, movement_type, sq))
+            if piece != new_piece or movement_type != new_movement_type:
+                if piece:
+                    pieces.remove(sq, piece, movement_type)
+                if new_piece:
+                    pieces.add(sq, new_piece, new_movement_type)
+        h ^= zobrist.castling_hash(self.castling) ^ zobrist.en_passant_hash(self.en_passant)
+        h ^= zobrist.SIDE_KEY
+        self.hash = h
+        self.score = score
+        self.hash_history.append(h)
+        self.move_history.append(pack_move(start_pos, end_pos, kind))
+        
+        # Pawn moves and captures reset the fifty-move counter
+        if abs(moving_piece) == W_PAWN or captured != 0:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.current_player_white:
+            self.fullmove_number += 1
+        return undo
+
+    def unmake_move(self, undo):
+        """Restore the position from the record returned by make_move"""
+        squares, castling, en_passant, old_hash, halfmove_clock = undo
+        board = self.board
+        movement = self.movement
+        
+        pieces = self.pieces
+        score = self.score
+        # Each entry holds the piece that stood there before the move and its movement type
+        for row, col, piece, movement_type in squares:
+            current = int(board[row, col])
+            current_movement_type = int(movement[row, col])
+            sq = row * 8 + col
+            score += (evaluation.square_score(piece, movement_type, sq)
+                      - evaluation.square_score(current, current_movement_type, sq))
+            if current != piece or current_movement_type != movement_type:
+                if current:
+                    pieces.remove(sq, current, current_movement_type)
+                if piece:
+                    pieces.add(sq, piece, movement_type)
+            board[row, col] = piece
+            movement[row, col] = movement_type
+        
+        self.castling = castling
+        self.en_passant = en_passant
+        if self.current_player_white:
+            self.fullmove_number -= 1
+        self.current_player_white = not self.current_player_white
+        self.hash = old_hash
+        self.score = score
+        self.hash_history.pop()
+        self.move_history.pop()
+        self._status_valid = False
+        self.halfmove_clock = halfmove_clock
+
+    def is_threefold_repetition(self):
+        """Check if the current position occurred at least three times"""
+        # Only positions since the last pawn move or capture can repeat,
+        # and only every other one has the same side to move
+        recent = self.hash_history[-1 - self.halfmove_clock:]
+        return recent[::-1][::2].count(self.hash) >= 3
+
+    def is_fifty_move_draw(self):
+        """Check if fifty moves passed without a pawn move or capture"""
+        return self.halfmove_clock >= 100
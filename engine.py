@@ -0,0 +1,344 @@
+"""Alpha-beta search engine for chess with jokers.
+
+Negamax with iterative deepening, a transposition table, captures-first
+move ordering with killer and history heuristics, quiescence search on
+captures and a hard wall-clock budget per move.
+
+    python engine.py --time 5
+    python engine.py --time 2 --pairing bg --moves e2e4 e7e5
+    python engine.py --time 10 --threads 8
+    python engine.py --time 5 --book book.bin --pairing bg
+    python engine.py --tablebase tables --pairing bg --moves e2e4
+"""
+import argparse
+import random
+import time
+from collections import Counter, namedtuple
+
+from chess_logic import GameState, move_name, parse_move, parse_pairing
+from evaluation import PIECE_VALUES
+from tablebase import MATE_VALUE as TABLEBASE_MATE, Tablebase
+from zobrist import TranspositionTable
+
+MATE_SCORE = 100000
+# Scores beyond this are mates, stored relative to the node in the table
+MATE_BOUND = MATE_SCORE - 1000
+INFINITY = MATE_SCORE + 1
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# How many nodes to search between clock checks
+TIME_CHECK_INTERVAL = 256
+
+SearchResult = namedtuple('SearchResult', 'move score depth nodes elapsed pv')
+
+class SearchTimeout(Exception):
+    pass
+
+def evaluate(game):
+    """Material and piece-square score from the side to move's point of view.
+
+    GameState keeps the score up to date move by move, with jokers counted
+    as the piece they move like (see evaluation).
+    """
+    return game.score if game.current_player_white else -game.score
+
+class Engine:
+    """Searches GameState positions in place using make_move/unmake_move.
+
+    The transposition table and history scores persist between searches, so
+    one Engine should be kept per game or analysis session. With an opening
+    book, positions found in it are answered from the book without searching,
+    and with a tablebase, endgames it covers are looked up instead of searched.
+    """
+
+    def __init__(self, tt_size=1 << 18, tt=None, book=None, tablebase=None):
+        # Any table with probe_depth/store/new_generation will do, e.g. a shared one
+        self.tt = tt if tt is not None else TranspositionTable(tt_size)
+        self.book = book
+        self.tablebase = tablebase
+        self.history = {}
+        self.killers = []
+        self.nodes = 0
+        # Per-search counters: quiescence nodes, beta cutoffs and table hits
+        self.stats = Counter()
+        self.deadline = None
+        self.stop = None
+
+    def search(self, game, time_limit=1.0, max_depth=64, stop=None, on_iteration=None, min_depth=1):
+        """Search the position for up to time_limit seconds.
+
+        on_iteration is called with a SearchResult after every completed depth,
+        and stop is an optional callable that aborts the search when it returns
+        True. Iterative deepening starts at min_depth. Returns the result of the
+        deepest completed iteration.
+        """
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit else None
+        self.stop = stop
+        self.nodes = 0
+        self.stats = Counter()
+        self.killers = [[None, None] for _ in range(max_depth + 64)]
+        self.tt.new_generation()
+
+        root_moves = game.all_valid_moves()
+        result = SearchResult(root_moves[0] if root_moves else None, 0, 0, 0, 0.0, [])
+        if len(root_moves) <= 1:
+            return result
+        if self.book is not None:
+            move = self.book.choose(game)
+            if move is not None:
+                return SearchResult(move, 0, 0, 0, time.perf_counter() - start, [move])
+        if self.tablebase is not None:
+            best = self.tablebase.best_move(game)
+            if best is not None:
+                move, value = best
+                return SearchResult(move, _tablebase_score(value, 0), 0, 0,
+                                    time.perf_counter() - start, [move])
+
+        for depth in range(min_depth, max_depth + 1):
+            try:
+                score = self._negamax(game, depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                break
+            entry = self.tt.probe_depth(game.hash)
+            move = entry[1][2] if entry else result.move
+            elapsed = time.perf_counter() - start
+            result = SearchResult(move, score, depth, self.nodes, elapsed, self._principal_variation(game, depth))
+            if on_iteration:
+                on_iteration(result)
+            if abs(score) > MATE_BOUND:
+                break
+        return result
+
+    def _check_time(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+        if self.stop is not None and self.stop():
+            raise SearchTimeout()
+
+    def _is_draw(self, game):
+        if game.halfmove_clock >= 100 or game.pieces.insufficient_material():
+            return True
+        # One earlier occurrence is enough to treat a line as a repetition
+        recent = game.hash_history[-1 - game.halfmove_clock:-1]
+        return game.hash in recent[::-1][1::2]
+
+    def _order_moves(self, game, moves, tt_move, ply):
+        board = game.board
+        movement = game.movement
+        killers = self.killers[ply]
+
+        def key(move):
+            if move == tt_move:
+                return 10000000
+            start_pos, end_pos = move
+            victim = board[end_pos[0], end_pos[1]]
+            if victim != 0:
+                # MVV-LVA by what the pieces move like, as evaluate scores jokers
+                victim_type = int(movement[end_pos[0], end_pos[1]]) or abs(int(victim))
+                attacker_type = (int(movement[start_pos[0], start_pos[1]]) or
+                                 abs(int(board[start_pos[0], start_pos[1]])))
+                return 1000000 + PIECE_VALUES[victim_type] * 10 - PIECE_VALUES[attacker_type] // 10
+            if move == killers[0] or move == killers[1]:
+                return 900000
+            return self.history.get(move, 0)
+
+        return sorted(moves, key=key, reverse=True)
+
+    def _negamax(self, game, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            self._check_time()
+
+        if ply > 0 and self._is_draw(game):
+            return 0
+        if ply > 0 and self.tablebase is not None:
+            value = self.tablebase.probe(game)
+            if value is not None:
+                self.stats['tablebase_hits'] += 1
+                return _tablebase_score(value, ply)
+
+        original_alpha = alpha
+        tt_move = None
+        entry = self.tt.probe_depth(game.hash)
+        if entry is not None:
+            entry_depth, (score, flag, tt_move) = entry
+            if ply > 0 and entry_depth >= depth:
+                score = _score_from_tt(score, ply)
+                if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                    self.stats['tt_cutoffs'] += 1
+                    return score
+
+        moves = game.all_valid_moves()
+        if not moves:
+            in_check = game.rules.is_in_check(game.board, game.current_player_white, game.movement)
+            return -MATE_SCORE + ply if in_check else 0
+        if depth <= 0:
+            return self._quiescence(game, alpha, beta, ply)
+
+        best_score = -INFINITY
+        best_move = None
+        for index, move in enumerate(self._order_moves(game, moves, tt_move, ply)):
+            is_capture = game.board[move[1][0], move[1][1]] != 0
+            undo = game.make_move(*move)
+            try:
+                score = -self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.unmake_move(undo)
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.stats['cutoffs'] += 1
+                if index == 0:
+                    self.stats['first_move_cutoffs'] += 1
+                if not is_capture:
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self.history[move] = self.history.get(move, 0) + depth * depth
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(game.hash, (_score_to_tt(best_score, ply), flag, best_move), depth)
+        return best_score
+
+    def _quiescence(self, game, alpha, beta, ply):
+        """Search captures only until the position is quiet"""
+        self.nodes += 1
+        self.stats['qnodes'] += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            self._check_time()
+
+        stand_pat = evaluate(game)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        board = game.board
+        captures = [move for move in game.all_valid_moves() if board[move[1][0], move[1][1]] != 0]
+        for move in self._order_moves(game, captures, None, min(ply, len(self.killers) - 1)):
+            undo = game.make_move(*move)
+            try:
+                score = -self._quiescence(game, -beta, -alpha, ply + 1)
+            finally:
+                game.unmake_move(undo)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _principal_variation(self, game, depth):
+        """Follow best moves stored in the table from the current position"""
+        pv = []
+        undos = []
+        seen = set()
+        while len(pv) < depth and game.hash not in seen:
+            seen.add(game.hash)
+            entry = self.tt.probe_depth(game.hash)
+            if entry is None or entry[1][2] is None:
+                break
+            move = entry[1][2]
+            if move not in game.all_valid_moves():
+                break
+            pv.append(move)
+            undos.append(game.make_move(*move))
+        for undo in reversed(undos):
+            game.unmake_move(undo)
+        return pv
+
+def _score_to_tt(score, ply):
+    # Mate scores are stored as distance from this node, not from the root
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def _score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+def _tablebase_score(value, ply):
+    # Tablebase values count plies to mate from this node, scores count from the root
+    if value > 0:
+        return MATE_SCORE - ply - (TABLEBASE_MATE - value)
+    if value < 0:
+        return -(MATE_SCORE - ply - (TABLEBASE_MATE + value))
+    return 0
+
+def format_result(result):
+    nps = result.nodes / result.elapsed if result.elapsed > 0 else 0
+    if abs(result.score) > MATE_BOUND:
+        plies = MATE_SCORE - abs(result.score)
+        score = f"mate {(plies + 1) // 2 if result.score > 0 else -((plies + 1) // 2)}"
+    else:
+        score = f"cp {result.score}"
+    pv = ' '.join(move_name(*move) for move in result.pv)
+    return (f"depth {result.depth} score {score} nodes {result.nodes} "
+            f"time {result.elapsed:.2f}s nps {nps:.0f} pv {pv}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Search a chess with jokers position')
+    parser.add_argument('--time', type=float, default=5.0, help='seconds to search')
+    parser.add_argument('--depth', type=int, default=64, help='maximum depth')
+    parser.add_argument('--pairing', default=None, help="joker columns as files, e.g. 'bg'")
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random joker pairing')
+    parser.add_argument('--moves', nargs='*', default=[], help='moves played before searching')
+    parser.add_argument('--book', default=None, help='opening book file built by book.py')
+    parser.add_argument('--tablebase', default=None, help='directory of tables built by tablebase.py')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='worker processes sharing one table (0: all cores)')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    try:
+        game = GameState(joker_columns=parse_pairing(args.pairing) if args.pairing else None)
+        for text in args.moves:
+            start_pos, end_pos = parse_move(text)
+            if end_pos not in game.legal_moves().get(start_pos, []):
+                raise ValueError(f"Illegal move: {text}")
+            game.make_move(start_pos, end_pos)
+    except ValueError as e:
+        parser.error(str(e))
+
+    book = None
+    if args.book:
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    report = lambda r: print(format_result(r), flush=True)
+    book_move = book.choose(game) if book is not None else None
+    if book_move is not None:
+        print(f"book {move_name(*book_move)}")
+        result = SearchResult(book_move, 0, 0, 0, 0.0, [book_move])
+    elif args.threads == 1:
+        result = Engine(tablebase=tablebase).search(game, args.time, args.depth, on_iteration=report)
+    else:
+        from smp import parallel_search
+        result, workers = parallel_search(game, args.time, args.depth, args.threads or None,
+                                          tablebase=tablebase,
+                                          on_iteration=report)
+        for worker_id, worker in enumerate(workers):
+            print(f"worker {worker_id}: depth {worker.depth} nodes {worker.nodes}")
+        print(format_result(result))
+    if result.move is not None:
+        print(f"bestmove {move_name(*result.move)}")
+
+if __name__ == "__main__":
+    main()
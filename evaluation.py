@@ -0,0 +1,127 @@
+import numpy as np
+
+from pieces import W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING
+
+# Static evaluation: material plus piece-square tables, in centipawns from
+# white's point of view.
+#
+# Jokers are scored by their movement type (the value get_piece_movement_type
+# reads from the movement plane), so a rook that moves like a knight counts
+# as a knight, on the knight's table. Every (piece, movement type, square)
+# combination is precomputed into SCORES, so scoring a board is one gather
+# and a sum, for a single (8, 8) board or a (N, 8, 8) stack alike.
+# GameState keeps the same sum up to date move by move with square_score.
+
+# Piece values by movement type, so a joker is worth what it moves like
+PIECE_VALUES = {W_PAWN: 100, W_ROOK: 500, W_KNIGHT: 320, W_BISHOP: 330, W_QUEEN: 900, W_KING: 0}
+
+# Bonus of each square for a white piece, row 0 being black's back rank as on
+# the board; black pieces use the table upside down
+PIECE_SQUARE_TABLES = {
+    W_PAWN: [
+          0,   0,   0,   0,   0,   0,   0,   0,
+         50,  50,  50,  50,  50,  50,  50,  50,
+         10,  10,  20,  30,  30,  20,  10,  10,
+          5,   5,  10,  25,  25,  10,   5,   5,
+          0,   0,   0,  20,  20,   0,   0,   0,
+          5,  -5, -10,   0,   0, -10,  -5,   5,
+          5,  10,  10, -20, -20,  10,  10,   5,
+          0,   0,   0,   0,   0,   0,   0,   0,
+    ],
+    W_KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20,   0,   0,   0,   0, -20, -40,
+        -30,   0,  10,  15,  15,  10,   0, -30,
+        -30,   5,  15,  20,  20,  15,   5, -30,
+        -30,   0,  15,  20,  20,  15,   0, -30,
+        -30,   5,  10,  15,  15,  10,   5, -30,
+        -40, -20,   0,   5,   5,   0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    W_BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,  10,  10,   5,   0, -10,
+        -10,   5,   5,  10,  10,   5,   5, -10,
+        -10,   0,  10,  10,  10,  10,   0, -10,
+        -10,  10,  10,  10,  10,  10,  10, -10,
+        -10,   5,   0,   0,   0,   0,   5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    W_ROOK: [
+          0,   0,   0,   0,   0,   0,   0,   0,
+          5,  10,  10,  10,  10,  10,  10,   5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+         -5,   0,   0,   0,   0,   0,   0,  -5,
+          0,   0,   0,   5,   5,   0,   0,   0,
+    ],
+    W_QUEEN: [
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+        -10,   0,   0,   0,   0,   0,   0, -10,
+        -10,   0,   5,   5,   5,   5,   0, -10,
+         -5,   0,   5,   5,   5,   5,   0,  -5,
+          0,   0,   5,   5,   5,   5,   0,  -5,
+        -10,   5,   5,   5,   5,   5,   0, -10,
+        -10,   0,   5,   0,   0,   0,   0, -10,
+        -20, -10, -10,  -5,  -5, -10, -10, -20,
+    ],
+    W_KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+         20,  20,   0,   0,   0,   0,  20,  20,
+         20,  30,  10,   0,   0,  10,  30,  20,
+    ],
+}
+
+def _build_scores():
+    # Indexed [piece + 6, movement type, square]; movement type 0 means the piece moves as itself
+    scores = np.zeros((13, 7, 64), dtype=np.int32)
+    for piece_type, table in PIECE_SQUARE_TABLES.items():
+        white = PIECE_VALUES[piece_type] + np.array(table, dtype=np.int32).reshape(8, 8)
+        black = -white[::-1]
+        for piece in range(1, 7):
+            for movement_type in range(7):
+                if (movement_type or piece) == piece_type:
+                    scores[piece + 6, movement_type] = white.ravel()
+                    scores[6 - piece, movement_type] = black.ravel()
+    return scores
+
+SCORES = _build_scores()
+# The same table as a flat list, for fast lookups one square at a time
+_SCORE_LIST = SCORES.ravel().tolist()
+_SQUARES = np.arange(64, dtype=np.intp).reshape(8, 8)
+
+def square_score(piece, movement_type, sq):
+    """What a piece with a movement type (0 for none) on square index sq adds to the score"""
+    return _SCORE_LIST[((piece + 6) * 7 + movement_type) * 64 + sq]
+
+def evaluate(board, movement=None):
+    """Score a (8, 8) board, or every board of a (..., 8, 8) stack, from white's point of view.
+
+    movement is the matching plane (or stack) of joker movement types, or
+    None when no joker has its movement swapped. Returns an int for a single
+    board and an int64 array of shape (...) for a stack.
+    """
+    board = np.asarray(board)
+    pieces = board.astype(np.intp) + 6
+    if movement is None:
+        movement = np.zeros(board.shape, dtype=np.intp)
+    values = SCORES[pieces, np.asarray(movement), _SQUARES]
+    total = values.sum(axis=(-2, -1), dtype=np.int64)
+    return int(total) if board.ndim == 2 else total
+
+def evaluate_games(games):
+    """Score a list of GameStates in one pass, each from the side to move's point of view"""
+    if not games:
+        return np.zeros(0, dtype=np.int64)
+    scores = evaluate(np.stack([game.board for game in games]),
+                      np.stack([game.movement for game in games]))
+    to_move = np.array([game.current_player_white for game in games])
+    return np.where(to_move, scores, -scores)
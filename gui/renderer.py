@@ -0,0 +1,66 @@
+import pygame
+from gui.sprites import SQUARE_SIZE, BOARD_SIZE, FPS
+
+LIGHT_SQUARE = (240, 217, 181)
+DARK_SQUARE = (181, 136, 99)
+SELECTED_COLOR = (255, 255, 0)
+MOVE_COLOR = (0, 255, 0)
+
+def _overlay(color):
+    s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
+    s.set_alpha(128)
+    s.fill(color)
+    return s
+
+class BoardRenderer:
+    """Draw the board from pre-rendered surfaces, repainting only changed squares"""
+
+    def __init__(self, screen, pieces_sprites):
+        self.screen = screen
+        self.pieces_sprites = pieces_sprites
+        self.background = pygame.Surface((BOARD_SIZE, BOARD_SIZE))
+        for row in range(8):
+            for col in range(8):
+                color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
+                pygame.draw.rect(self.background, color,
+                                 (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+        self.selected_overlay = _overlay(SELECTED_COLOR)
+        self.move_overlay = _overlay(MOVE_COLOR)
+        # What each square showed when last drawn: (piece, selected, highlighted)
+        self.drawn = {}
+
+    def invalidate(self):
+        """Force a full repaint, e.g. after something else drew over the board"""
+        self.drawn = {}
+
+    def draw(self, board, selected=None, valid_moves=None):
+        """Repaint squares whose contents changed and push only those to the display"""
+        targets = set(valid_moves) if valid_moves else set()
+        cells = board.tolist()
+        dirty = []
+        for row in range(8):
+            for col in range(8):
+                state = (cells[row][col], selected == (row, col), (row, col) in targets)
+                if self.drawn.get((row, col)) != state:
+                    dirty.append(self._draw_square(row, col, *state))
+                    self.drawn[(row, col)] = state
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+    def _draw_square(self, row, col, piece, is_selected, is_target):
+        rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+        self.screen.blit(self.background, rect, rect)
+        if is_selected:
+            self.screen.blit(self.selected_overlay, rect)
+        if is_target:
+            self.screen.blit(self.move_overlay, rect)
+        if piece != 0:
+            self.screen.blit(self.pieces_sprites[piece], rect)
+        return rect
+
+def wait_events(fps=FPS):
+    """Block until input arrives, or at most one frame when fps is set"""
+    first = pygame.event.wait(int(1000 / fps) if fps else 0)
+    events = [] if first.type == pygame.NOEVENT else [first]
+    return events + pygame.event.get()
@@ -1,25 +1,52 @@
-import pygame
-from pieces import *
+import os
+
+from pieces import (W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING,
+                    B_PAWN, B_ROOK, B_KNIGHT, B_BISHOP, B_QUEEN, B_KING)
 
 SQUARE_SIZE = 80
 BOARD_SIZE = SQUARE_SIZE * 8
 
-def load_pieces():
-    pieces = {}
-    piece_mapping = {
-        W_KING: 'WK', W_QUEEN: 'WQ', W_BISHOP: 'WB',
-        W_KNIGHT: 'WN', W_ROOK: 'WR', W_PAWN: 'WP',
-        B_KING: 'BK', B_QUEEN: 'BQ', B_BISHOP: 'BB',
-        B_KNIGHT: 'BN', B_ROOK: 'BR', B_PAWN: 'BP'
-    }
-    
-    for piece_num, piece_name in piece_mapping.items():
-        image_path = f'gui/assets/{piece_name}.png'
-        image = pygame.image.load(image_path)
-        image = pygame.transform.scale(image, (SQUARE_SIZE, SQUARE_SIZE))
-        pieces[piece_num] = image
-    
-    return pieces
+# Default frame cap for the GUI loop; 0 waits for input without any timeout
+FPS = 30
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# Image of each piece in ASSETS_DIR, in the order they sit in the atlas
+PIECE_IMAGES = {
+    W_KING: 'WK', W_QUEEN: 'WQ', W_BISHOP: 'WB',
+    W_KNIGHT: 'WN', W_ROOK: 'WR', W_PAWN: 'WP',
+    B_KING: 'BK', B_QUEEN: 'BQ', B_BISHOP: 'BB',
+    B_KNIGHT: 'BN', B_ROOK: 'BR', B_PAWN: 'BP'
+}
+
+# Every piece image side by side, read from disk once per process
+_atlas = None
+# Piece surfaces by square size, cut from a scaled copy of the atlas
+_scaled = {}
+
+def _load_atlas():
+    global _atlas
+    if _atlas is None:
+        # pygame is only needed once something is drawn, so the rules stay importable without it
+        import pygame
+        images = [pygame.image.load(os.path.join(ASSETS_DIR, f'{name}.png'))
+                  for name in PIECE_IMAGES.values()]
+        width, height = images[0].get_size()
+        atlas = pygame.Surface((width * len(images), height), pygame.SRCALPHA)
+        for i, image in enumerate(images):
+            # Copy the pixels as they are, alpha included, onto the transparent atlas
+            atlas.blit(image, (i * width, 0), special_flags=pygame.BLEND_RGBA_MAX)
+        _atlas = atlas
+    return _atlas
+
+def load_pieces(size=SQUARE_SIZE):
+    """Piece surfaces by piece value, scaled to size; cached, so later calls are free"""
+    if size not in _scaled:
+        import pygame
+        strip = pygame.transform.scale(_load_atlas(), (size * len(PIECE_IMAGES), size))
+        _scaled[size] = {piece: strip.subsurface((i * size, 0, size, size))
+                         for i, piece in enumerate(PIECE_IMAGES)}
+    return _scaled[size]
 
 def get_square_from_mouse(pos):
     x, y = pos
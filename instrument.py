@@ -0,0 +1,270 @@
+"""Opt-in instrumentation of move generation, search and the GUI loop.
+
+Nothing is wrapped until enable() is called: it replaces the hot functions
+in every loaded module of this project with timing wrappers, and disable()
+puts the originals back, so the cost when switched off is zero. While
+enabled it collects per-function call counts and cumulative times, a
+histogram of GUI frame times, and node and cutoff counts of every engine
+search. Results export as JSON or as collapsed stacks for flame graph tools.
+
+    python instrument.py --json profile.json --collapsed profile.folded perft.py 3
+    python main.py --profile profile.json
+"""
+import argparse
+import ast
+import functools
+import json
+import os
+import sys
+import time
+import types
+from collections import Counter
+
+# (module, attribute) of every instrumented function; Class.method for methods
+TARGETS = [
+    ('pieces', 'get_basic_moves'),
+    ('chess_logic', 'get_valid_moves'),
+    ('chess_logic', 'is_in_check'),
+    ('chess_logic', 'find_attacker'),
+    ('chess_logic', 'is_checkmate'),
+    ('chess_logic', 'is_stalemate'),
+    ('chess_logic', 'get_piece_movement_type'),
+    ('chess_logic', 'legal_move_table'),
+    ('chess_logic', 'has_any_legal_move'),
+    ('chess_logic', 'PieceLists.insufficient_material'),
+    ('chess_logic', 'GameState.legal_moves'),
+    ('chess_logic', 'GameState.game_status'),
+    ('chess_logic', 'GameState.make_move'),
+    ('chess_logic', 'GameState.unmake_move'),
+    ('bitboard', 'get_basic_moves'),
+    ('bitboard', 'get_valid_moves'),
+    ('bitboard', 'is_in_check'),
+    ('bitboard', 'is_checkmate'),
+    ('bitboard', 'is_stalemate'),
+    ('bitboard', 'legal_move_table'),
+    ('bitboard', 'has_any_legal_move'),
+    ('bitboard', 'Bitboards.from_array'),
+    ('evaluation', 'evaluate'),
+    ('engine', 'evaluate'),
+    ('engine', 'Engine.search'),
+]
+
+# Upper bounds of the frame time histogram buckets, in milliseconds
+FRAME_BUCKETS = [1, 2, 4, 8, 16, 33, 66, 133, 266]
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class Profiler:
+    """Counters filled in by the wrappers while instrumentation is enabled"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.total_ns = Counter()
+        # Exclusive time per call path, keyed 'outer;inner;function'
+        self.stacks = Counter()
+        self.frames = [0] * (len(FRAME_BUCKETS) + 1)
+        self.frame_count = 0
+        self.frame_total = 0.0
+        self.frame_max = 0.0
+        self.searches = []
+        self._stack = []
+
+    def wrap(self, name, func):
+        stack = self._stack
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Each frame holds the function name and the time spent in instrumented callees
+            frame = [name, 0]
+            stack.append(frame)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                stack.pop()
+                self.calls[name] += 1
+                self.total_ns[name] += elapsed
+                self.stacks[';'.join([f[0] for f in stack] + [name])] += elapsed - frame[1]
+                if stack:
+                    stack[-1][1] += elapsed
+
+        wrapper.__instrumented__ = func
+        return wrapper
+
+    def record_frame(self, seconds):
+        ms = seconds * 1000
+        bucket = 0
+        while bucket < len(FRAME_BUCKETS) and ms > FRAME_BUCKETS[bucket]:
+            bucket += 1
+        self.frames[bucket] += 1
+        self.frame_count += 1
+        self.frame_total += seconds
+        self.frame_max = max(self.frame_max, seconds)
+
+    def merge(self, other):
+        """Add what another Profiler collected, e.g. in a worker process"""
+        self.calls.update(other.calls)
+        self.total_ns.update(other.total_ns)
+        self.stacks.update(other.stacks)
+        self.frames = [a + b for a, b in zip(self.frames, other.frames)]
+        self.frame_count += other.frame_count
+        self.frame_total += other.frame_total
+        self.frame_max = max(self.frame_max, other.frame_max)
+        self.searches.extend(other.searches)
+
+    def record_search(self, engine, result):
+        self.searches.append({
+            'depth': result.depth,
+            'nodes': result.nodes,
+            'elapsed': result.elapsed,
+            'nps': result.nodes / result.elapsed if result.elapsed > 0 else 0,
+            **engine.stats,
+        })
+
+    def to_dict(self):
+        functions = {name: {'calls': self.calls[name],
+                            'total_s': self.total_ns[name] / 1e9,
+                            'mean_us': self.total_ns[name] / self.calls[name] / 1e3}
+                     for name in sorted(self.calls, key=self.total_ns.get, reverse=True)}
+        labels = [f"<={bound}ms" for bound in FRAME_BUCKETS] + [f">{FRAME_BUCKETS[-1]}ms"]
+        frames = {
+            'count': self.frame_count,
+            'mean_ms': self.frame_total / self.frame_count * 1000 if self.frame_count else 0,
+            'max_ms': self.frame_max * 1000,
+            'histogram': dict(zip(labels, self.frames)),
+        }
+        return {'functions': functions, 'frames': frames, 'searches': self.searches}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def collapsed(self):
+        """Stacks in the collapsed format of flamegraph.pl, weighted in microseconds"""
+        return ''.join(f"{path} {ns // 1000}\n" for path, ns in sorted(self.stacks.items()) if ns >= 1000)
+
+    def summary(self, limit=20):
+        lines = [f"{'function':<40} {'calls':>10} {'total s':>10} {'mean us':>10}"]
+        for name, stats in list(self.to_dict()['functions'].items())[:limit]:
+            lines.append(f"{name:<40} {stats['calls']:>10} {stats['total_s']:>10.3f} {stats['mean_us']:>10.2f}")
+        return '\n'.join(lines)
+
+_profiler = None
+_patched = []
+
+def _project_modules():
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if path and os.path.dirname(os.path.abspath(path)).startswith(_PROJECT_DIR):
+            yield module
+
+def _search_wrapper(profiler, search):
+    @functools.wraps(search)
+    def wrapper(engine, *args, **kwargs):
+        result = search(engine, *args, **kwargs)
+        profiler.record_search(engine, result)
+        return result
+    return wrapper
+
+def enable(targets=TARGETS):
+    """Start collecting; returns the Profiler that receives the data"""
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+    import importlib
+    profiler = Profiler()
+    modules = list(_project_modules())
+    for module_name, attribute in targets:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        owner_name, _, name = attribute.rpartition('.')
+        # A script run as __main__ (see main) is a second copy of its module
+        copies = [module] + [other for other in modules if other is not module and
+                             getattr(other, '__file__', None) == module.__file__]
+        label = f"{module_name}.{attribute}"
+        for namespace in copies:
+            owner = getattr(namespace, owner_name) if owner_name else namespace
+            original = getattr(owner, name)
+            wrapped = profiler.wrap(label, original)
+            if attribute == 'Engine.search':
+                wrapped = _search_wrapper(profiler, wrapped)
+            if owner_name:
+                setattr(owner, name, wrapped)
+                _patched.append((owner, name, original))
+                continue
+            # Names imported with 'from module import name' are separate bindings
+            for other in modules + [namespace]:
+                if getattr(other, name, None) is original:
+                    setattr(other, name, wrapped)
+                    _patched.append((other, name, original))
+    _profiler = profiler
+    return profiler
+
+def disable():
+    """Restore every wrapped function; the Profiler keeps what it collected"""
+    global _profiler
+    while _patched:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+    profiler, _profiler = _profiler, None
+    return profiler
+
+def active():
+    return _profiler
+
+def record_frame(seconds):
+    """Add one GUI frame time; does nothing unless instrumentation is enabled"""
+    if _profiler is not None:
+        _profiler.record_frame(seconds)
+
+def save(profiler, json_path=None, collapsed_path=None):
+    if json_path:
+        with open(json_path, 'w') as f:
+            f.write(profiler.to_json())
+    if collapsed_path:
+        with open(collapsed_path, 'w') as f:
+            f.write(profiler.collapsed())
+
+def _is_main_guard(node):
+    return (isinstance(node, ast.If) and isinstance(node.test, ast.Compare) and
+            isinstance(node.test.left, ast.Name) and node.test.left.id == '__name__')
+
+def _load_script(path):
+    """Run a script as __main__ up to its 'if __name__ == "__main__"' block.
+
+    Returns the module and the compiled block, so the functions and classes
+    the script defines itself can be instrumented before the block runs.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    body = [node for node in tree.body if not _is_main_guard(node)]
+    guard = [node for node in tree.body if _is_main_guard(node)]
+    module = types.ModuleType('__main__')
+    module.__file__ = os.path.abspath(path)
+    sys.modules['__main__'] = module
+    exec(compile(ast.Module(body, type_ignores=[]), path, 'exec'), module.__dict__)
+    return module, compile(ast.Module(guard, type_ignores=[]), path, 'exec')
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a script of this project with instrumentation')
+    parser.add_argument('--json', default=None, help='write counters and timings as JSON')
+    parser.add_argument('--collapsed', default=None, help='write collapsed stacks for flame graphs')
+    parser.add_argument('script', help='script to run, e.g. perft.py')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='arguments for the script')
+    args = parser.parse_args()
+
+    script = args.script if os.path.exists(args.script) else os.path.join(_PROJECT_DIR, args.script)
+    sys.argv = [script] + args.args
+    module, guard = _load_script(script)
+    profiler = enable()
+    try:
+        exec(guard, module.__dict__)
+    finally:
+        disable()
+        save(profiler, args.json, args.collapsed)
+        print(profiler.summary(), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
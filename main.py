@@ -1,58 +1,22 @@
-import pygame
-import numpy as np
-from pieces import *
-from chess_logic import *
-from gui.sprites import *
+import os
+import time
 
-class GameState:
-    def __init__(self):
-        self.board, self.joker_mapping = initialize_board()
-        self.current_player_white = True
-        self.move_history = []
-        self.castling_rights = {
-            'White': {'kingside': True, 'queenside': True},
-            'Black': {'kingside': True, 'queenside': True}
-        }
-        self.en_passant_target = None
-        self.last_move = None
-        self.halfmove_clock = 0
-        self.fullmove_number = 1
-        # Add tracking of moved joker pieces
-        self.moved_jokers = {
-            'white': {},  # Will store {new_pos: original_col}
-            'black': {}
-        }
+from analysis import AnalysisService
+from chess_logic import GameState, format_joker_info, move_name
+from engine import MATE_BOUND, MATE_SCORE
+from gui.sprites import BOARD_SIZE, FPS, get_square_from_mouse, load_pieces
+import instrument
 
-def draw_board(screen, board, pieces_sprites, selected=None, valid_moves=None):
-    for row in range(8):
-        for col in range(8):
-            # Draw square
-            color = (240, 217, 181) if (row + col) % 2 == 0 else (181, 136, 99)
-            pygame.draw.rect(screen, color, 
-                           (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-            
-            # Highlight selected square
-            if selected and selected == (row, col):
-                s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
-                s.set_alpha(128)
-                s.fill((255, 255, 0))
-                screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-            
-            # Highlight valid moves
-            if valid_moves and (row, col) in valid_moves:
-                s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
-                s.set_alpha(128)
-                s.fill((0, 255, 0))
-                screen.blit(s, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-            
-            # Draw piece
-            piece = board[row][col]
-            if piece != 0:  # If not empty
-                screen.blit(pieces_sprites[piece], 
-                          (col * SQUARE_SIZE, row * SQUARE_SIZE))
+GAME_OVER_MESSAGES = {
+    'stalemate': "Stalemate!",
+    'insufficient_material': "Draw - Insufficient Material!",
+    'repetition': "Draw - Threefold Repetition!",
+    'fifty_moves': "Draw - Fifty-Move Rule!",
+}
 
 def ShowGameOverWindow(screen, message):
     """Display game over message and handle replay choice"""
+    import pygame
     overlay = pygame.Surface((BOARD_SIZE, BOARD_SIZE))
     overlay.fill((0, 0, 0))
     overlay.set_alpha(128)
@@ -71,26 +35,54 @@ def ShowGameOverWindow(screen, message):
     screen.blit(play_again, play_rect)
     pygame.display.flip()
     
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+    while True:
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                return True
+            if event.key == pygame.K_ESCAPE:
                 return False
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:
-                    return True
-                if event.key == pygame.K_ESCAPE:
-                    return False
-    return False
 
-def main():
+def analysis_caption(game, result):
+    """Window title showing the depth, score for white and best line of a search"""
+    score = result.score if game.current_player_white else -result.score
+    if abs(score) > MATE_BOUND:
+        plies = MATE_SCORE - abs(score)
+        value = f"{'' if score > 0 else '-'}M{(plies + 1) // 2}"
+    else:
+        value = f"{score / 100:+.2f}"
+    pv = ' '.join(move_name(*move) for move in result.pv[:6])
+    return f"Chess with Jokers - depth {result.depth} {value} {pv}"
+
+def main(backend='numpy', fps=FPS, engine_side=None, think_time=1.0, book_path=None,
+         tablebase_dir=None, analysis_depth=0):
+    # pygame loads with the window, so importing this module stays headless
+    import pygame
     pygame.init()
     screen = pygame.display.set_mode((BOARD_SIZE, BOARD_SIZE))
     pygame.display.set_caption('Chess with Jokers')  # Fixed method name from setCaption to set_caption
     
+    # Move tables, game status and engine searches run in a worker process
+    # so the window keeps drawing while they are computed
+    profiler = instrument.active()
+    analysis = AnalysisService(book_path, tablebase_dir, profile=profiler is not None)
+    try:
+        play(screen, analysis, backend, fps, engine_side, think_time, analysis_depth)
+    finally:
+        worker_profiler = analysis.close()
+        if worker_profiler is not None:
+            # Searches and move tables run in the worker, so its timings belong in the report
+            profiler.merge(worker_profiler)
+        pygame.quit()
+
+def play(screen, analysis, backend, fps, engine_side, think_time, analysis_depth):
+    import pygame
+    from gui.renderer import BoardRenderer, wait_events
     play_again = True
     while play_again:
-        game = GameState()
+        game = GameState(backend)
         
         # Print joker piece information more clearly
         print("\n=== Joker Pieces for this game ===")
@@ -105,24 +97,50 @@ def main():
         # Wait for user acknowledgment
         waiting = True
         while waiting:
-            for event in pygame.event.get():
-                if event.type == pygame.KEYDOWN or event.type == pygame.MOUSEBUTTONDOWN:
-                    waiting = False
-                if event.type == pygame.QUIT:
-                    return
+            event = pygame.event.wait()
+            if event.type == pygame.KEYDOWN or event.type == pygame.MOUSEBUTTONDOWN:
+                waiting = False
+            if event.type == pygame.QUIT:
+                return
         
         pieces_sprites = load_pieces()
+        renderer = BoardRenderer(screen, pieces_sprites)
+        clock = pygame.time.Clock()
         selected = None
         valid_moves = []
         running = True
+        moved = True
         
         while running:
-            for event in pygame.event.get():
+            if moved:
+                # A new position cancels whatever the worker was still busy with
+                engine_to_move = (engine_side is not None and
+                                  game.current_player_white == (engine_side == 'white'))
+                if engine_to_move:
+                    analysis.submit(game, think_time)
+                else:
+                    analysis.submit(game, None, analysis_depth)
+                    if analysis_depth:
+                        pygame.display.set_caption('Chess with Jokers')
+                legal = None
+                status = None
+                busy = True
+                moved = False
+            
+            # Without a frame cap, still wake up to collect the worker's results
+            events = wait_events(fps if fps or not busy else FPS)
+            # Frame time is the work done for the frame, not the wait for input
+            frame_start = time.perf_counter()
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
                     play_again = False
                 
-                elif event.type == pygame.MOUSEBUTTONDOWN:
+                elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                    # The window was uncovered or restored, so every square needs repainting
+                    renderer.invalidate()
+                
+                elif event.type == pygame.MOUSEBUTTONDOWN and not engine_to_move:
                     if event.button == 1:  # Left click
                         row, col = get_square_from_mouse(event.pos)
                         
@@ -131,116 +149,74 @@ def main():
                             if piece != 0 and ((game.current_player_white and piece > 0) or 
                                              (not game.current_player_white and piece < 0)):
                                 selected = (row, col)
-                                # Get movement type for joker pieces
-                                movement_type = get_piece_movement_type((row, col), game.joker_mapping, game.moved_jokers)
-                                if movement_type:
-                                    piece_for_moves = movement_type if game.current_player_white else -movement_type
-                                    valid_moves = get_valid_moves(piece_for_moves, (row, col), game.board, 
-                                                                None, None, game.joker_mapping, game.moved_jokers)
-                                else:
-                                    valid_moves = get_valid_moves(piece, (row, col), game.board, 
-                                                                game.castling_rights[
-                                                                    'White' if game.current_player_white else 'Black'
-                                                                ],
-                                                                game.en_passant_target,
-                                                                game.joker_mapping, game.moved_jokers)
+                                if legal is None:
+                                    # Clicked before the worker's table arrived
+                                    legal = game.legal_moves()
+                                valid_moves = legal.get(selected, [])
                         else:
                             if (row, col) in valid_moves:
-                                # Store move information
-                                start_pos = selected
-                                end_pos = (row, col)
-                                moving_piece = game.board[start_pos[0]][start_pos[1]]
-                                
-                                # Update joker piece tracking
-                                if start_pos[0] == 7 or (start_pos[0], start_pos[1]) in game.moved_jokers['white'].keys():
-                                    # Check if it's a joker piece or a moved joker
-                                    orig_col = None
-                                    if start_pos in game.moved_jokers['white']:
-                                        orig_col = game.moved_jokers['white'][start_pos]
-                                    else:
-                                        for piece_info in game.joker_mapping['white']['pieces']:
-                                            if start_pos[1] == piece_info[0]:
-                                                orig_col = piece_info[0]
-                                                break
-                                    
-                                    if orig_col is not None:
-                                        # Remove the old position
-                                        to_remove = []
-                                        for pos, col in game.moved_jokers['white'].items():
-                                            if col == orig_col:
-                                                to_remove.append(pos)
-                                        for pos in to_remove:
-                                            del game.moved_jokers['white'][pos]
-                                        # Add the new position
-                                        game.moved_jokers['white'][end_pos] = orig_col
-
-                                elif start_pos[0] == 0 or (start_pos[0], start_pos[1]) in game.moved_jokers['black'].keys():
-                                    # Check if it's a joker piece or a moved joker
-                                    orig_col = None
-                                    if start_pos in game.moved_jokers['black']:
-                                        orig_col = game.moved_jokers['black'][start_pos]
-                                    else:
-                                        for piece_info in game.joker_mapping['black']['pieces']:
-                                            if start_pos[1] == piece_info[0]:
-                                                orig_col = piece_info[0]
-                                                break
-                                    
-                                    if orig_col is not None:
-                                        # Remove the old position
-                                        to_remove = []
-                                        for pos, col in game.moved_jokers['black'].items():
-                                            if col == orig_col:
-                                                to_remove.append(pos)
-                                        for pos in to_remove:
-                                            del game.moved_jokers['black'][pos]
-                                        # Add the new position
-                                        game.moved_jokers['black'][end_pos] = orig_col
-                                
-                                # Handle special moves
-                                if abs(moving_piece) == 6:  # King
-                                    handle_castling(game.board, start_pos, end_pos, game.castling_rights)
-                                
-                                # Make the move
-                                game.board[end_pos[0]][end_pos[1]] = moving_piece
-                                game.board[start_pos[0]][start_pos[1]] = 0
-                                
-                                # Handle pawn promotion
-                                if abs(moving_piece) == 1 and (row == 0 or row == 7):
-                                    game.board[row][col] = (W_QUEEN if moving_piece > 0 else B_QUEEN)
-                                
-                                # Handle en passant
-                                if abs(moving_piece) == 1 and abs(start_pos[0] - end_pos[0]) == 2:
-                                    game.en_passant_target = (
-                                        (start_pos[0] + end_pos[0]) // 2,
-                                        start_pos[1]
-                                    )
-                                else:
-                                    game.en_passant_target = None
-                                
-                                game.last_move = (start_pos, end_pos)
-                                game.current_player_white = not game.current_player_white
+                                game.make_move(selected, (row, col))
+                                moved = True
                                 
                             selected = None
                             valid_moves = []
             
-            draw_board(screen, game.board, pieces_sprites, selected, valid_moves)
-            pygame.display.flip()
+            for update in analysis.poll():
+                if update.kind == 'moves':
+                    legal = update.value
+                elif update.kind == 'status':
+                    status = update.value
+                elif update.kind == 'search' and not engine_to_move:
+                    pygame.display.set_caption(analysis_caption(game, update.value))
+                elif update.kind == 'done':
+                    busy = False
+                    # The computer opponent replies once its search in the worker is done
+                    if engine_to_move and update.value is not None and update.value.move is not None:
+                        game.make_move(*update.value.move)
+                        moved = True
             
-            # Check game end conditions
-            is_white = game.current_player_white
-            if is_in_check(game.board, is_white, game.joker_mapping, game.moved_jokers):
-                if is_checkmate(game.board, is_white, game.joker_mapping, game.moved_jokers):
-                    winner = "Black" if is_white else "White"
-                    play_again = ShowGameOverWindow(screen, f"{winner} Wins!")
-                    running = False
-            elif is_stalemate(game.board, is_white, game.joker_mapping, game.moved_jokers):
-                play_again = ShowGameOverWindow(screen, "Stalemate!")
+            renderer.draw(game.board, selected, valid_moves)
+            instrument.record_frame(time.perf_counter() - frame_start)
+            clock.tick(fps)
+            
+            # Check game end conditions reported by the worker for this position
+            if moved:
+                continue
+            if status == 'checkmate':
+                winner = "Black" if game.current_player_white else "White"
+                play_again = ShowGameOverWindow(screen, f"{winner} Wins!")
                 running = False
-            elif HasInsufficientMaterial(game.board):
-                play_again = ShowGameOverWindow(screen, "Draw - Insufficient Material!")
+            elif status in GAME_OVER_MESSAGES:
+                play_again = ShowGameOverWindow(screen, GAME_OVER_MESSAGES[status])
                 running = False
-    
-    pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Chess with Jokers')
+    parser.add_argument('--backend', choices=['numpy', 'bitboard'], default='numpy',
+                        help='move generation backend')
+    parser.add_argument('--fps', type=int, default=FPS,
+                        help='frame rate cap; 0 redraws only on input')
+    parser.add_argument('--engine', choices=['white', 'black'], default=None,
+                        help='side played by the computer')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='seconds the computer thinks per move')
+    parser.add_argument('--book', default=None,
+                        help='opening book file for the computer')
+    parser.add_argument('--tablebase', default=None,
+                        help='endgame table directory for the computer')
+    parser.add_argument('--analyse', type=int, default=0, metavar='DEPTH',
+                        help='search your positions to this depth in the background '
+                             'and show the best line in the title bar')
+    parser.add_argument('--profile', default=None,
+                        help='record timings to this JSON file, with collapsed stacks next to it')
+    args = parser.parse_args()
+    if args.profile:
+        instrument.enable()
+    try:
+        main(args.backend, args.fps, args.engine, args.think, args.book, args.tablebase,
+             args.analyse)
+    finally:
+        if args.profile:
+            profiler = instrument.disable()
+            instrument.save(profiler, args.profile, os.path.splitext(args.profile)[0] + '.folded')
@@ -0,0 +1,234 @@
+"""Text formats for chess with jokers: extended FEN and PGN.
+
+Extended FEN is standard FEN plus two fields, the joker pairing and the
+current joker squares with the movement type of each:
+
+    rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 bc b8B,c8N,b1B,c1N
+
+The pairing names the columns the jokers started on, as in 'bc'. The last
+field is '-' once every joker has been captured.
+
+Games are written as PGN with a JokerPairing tag and moves in coordinate
+notation. read_games parses one game at a time, so archives of any size
+stream through in constant memory.
+
+    python notation.py games.jsonl > games.pgn
+"""
+import argparse
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from chess_logic import (CASTLE_WHITE_KINGSIDE, CASTLE_WHITE_QUEENSIDE, CASTLE_BLACK_KINGSIDE,
+                         CASTLE_BLACK_QUEENSIDE, GameState, get_joker_columns, pairing_name,
+                         parse_move, parse_pairing, parse_square, square_name)
+from pieces import W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING
+
+PIECE_LETTERS = {W_PAWN: 'P', W_ROOK: 'R', W_KNIGHT: 'N', W_BISHOP: 'B', W_QUEEN: 'Q', W_KING: 'K'}
+LETTER_PIECES = {letter: piece for piece, letter in PIECE_LETTERS.items()}
+
+# FEN castling letters and the GameState.castling bit of each
+CASTLING_LETTERS = (('K', CASTLE_WHITE_KINGSIDE), ('Q', CASTLE_WHITE_QUEENSIDE),
+                    ('k', CASTLE_BLACK_KINGSIDE), ('q', CASTLE_BLACK_QUEENSIDE))
+
+RESULTS = {'white': '1-0', 'black': '0-1', None: '1/2-1/2'}
+RESULT_TOKENS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# A game read from PGN: tag name -> value, and moves in coordinate notation
+PgnGame = namedtuple('PgnGame', 'tags moves result')
+
+def board_to_fen(board):
+    rows = []
+    for row in board.tolist():
+        text = ''
+        empty = 0
+        for piece in row:
+            if piece == 0:
+                empty += 1
+                continue
+            if empty:
+                text += str(empty)
+                empty = 0
+            letter = PIECE_LETTERS[abs(piece)]
+            text += letter if piece > 0 else letter.lower()
+        if empty:
+            text += str(empty)
+        rows.append(text)
+    return '/'.join(rows)
+
+def board_from_fen(text):
+    rows = text.split('/')
+    if len(rows) != 8:
+        raise ValueError(f"Invalid FEN board: {text}")
+    board = np.zeros((8, 8), dtype=np.int8)
+    for row, row_text in enumerate(rows):
+        col = 0
+        for char in row_text:
+            if char.isdigit():
+                col += int(char)
+            elif char.upper() in LETTER_PIECES and col < 8:
+                piece = LETTER_PIECES[char.upper()]
+                board[row, col] = piece if char.isupper() else -piece
+                col += 1
+            else:
+                raise ValueError(f"Invalid FEN board: {text}")
+        if col != 8:
+            raise ValueError(f"Invalid FEN board: {text}")
+    return board
+
+def to_fen(game):
+    """Extended FEN of a GameState"""
+    castling = ''.join(letter for letter, bit in CASTLING_LETTERS if game.castling & bit) or '-'
+    en_passant = square_name(game.en_passant_target) if game.en_passant is not None else '-'
+    jokers = ','.join(square_name(pos) + PIECE_LETTERS[movement_type]
+                      for pos, movement_type in game.joker_overrides()) or '-'
+    return ' '.join([board_to_fen(game.board), 'w' if game.current_player_white else 'b',
+                     castling, en_passant, str(game.halfmove_clock), str(game.fullmove_number),
+                     pairing_name(get_joker_columns(game.joker_mapping)), jokers])
+
+def from_fen(text, backend='numpy'):
+    """Build a GameState from an extended FEN; raises ValueError if it is malformed"""
+    fields = text.split()
+    if len(fields) != 8:
+        raise ValueError(f"Extended FEN needs 8 fields, got {len(fields)}: {text}")
+    board_text, side, castling, en_passant, halfmove, fullmove, pairing, jokers = fields
+
+    board = board_from_fen(board_text)
+    if side not in ('w', 'b'):
+        raise ValueError(f"Invalid side to move: {side}")
+    if castling != '-' and (not castling or set(castling) - set('KQkq')):
+        raise ValueError(f"Invalid castling rights: {castling}")
+    castling_bits = sum(bit for letter, bit in CASTLING_LETTERS if letter in castling)
+    en_passant_square = None
+    if en_passant != '-':
+        row, col = parse_square(en_passant)
+        if row not in (2, 5):
+            raise ValueError(f"Invalid en passant square: {en_passant}")
+        en_passant_square = row * 8 + col
+    if not (halfmove.isdigit() and fullmove.isdigit()):
+        raise ValueError(f"Invalid move counters: {halfmove} {fullmove}")
+
+    movement = np.zeros((8, 8), dtype=np.int8)
+    if jokers != '-':
+        for entry in jokers.split(','):
+            if len(entry) != 3 or entry[2] not in LETTER_PIECES:
+                raise ValueError(f"Invalid joker square: {entry}")
+            row, col = parse_square(entry[:2])
+            if board[row, col] == 0:
+                raise ValueError(f"Joker square {entry[:2]} is empty")
+            movement[row, col] = LETTER_PIECES[entry[2]]
+
+    game = GameState(backend, parse_pairing(pairing))
+    game.set_position(board, movement, side == 'w', castling_bits, en_passant_square,
+                      int(halfmove), int(fullmove))
+    return game
+
+def replay(moves, joker_columns=None, fen=None, backend='numpy'):
+    """Play coordinate moves from the start (or a FEN) and return the GameState"""
+    game = from_fen(fen, backend) if fen else GameState(backend, joker_columns)
+    for text in moves:
+        start_pos, end_pos = parse_move(text)
+        if end_pos not in game.legal_moves().get(start_pos, []):
+            raise ValueError(f"Illegal move: {text}")
+        game.make_move(start_pos, end_pos)
+    return game
+
+def game_from_pgn(pgn_game, backend='numpy'):
+    """Replay a PgnGame, starting from its FEN tag when it has one"""
+    fen = pgn_game.tags.get('FEN')
+    columns = None if fen else parse_pairing(pgn_game.tags.get('JokerPairing', ''))
+    return replay(pgn_game.moves, columns, fen, backend)
+
+def write_game(stream, tags, moves, result='*'):
+    """Write one game as PGN: tags, then numbered coordinate moves wrapped at 80 columns"""
+    for name, value in tags.items():
+        stream.write(f'[{name} "{value}"]\n')
+    stream.write('\n')
+    tokens = []
+    for i, move in enumerate(moves):
+        if i % 2 == 0:
+            tokens.append(f'{i // 2 + 1}.')
+        tokens.append(move)
+    tokens.append(result)
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            stream.write(line + '\n')
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    stream.write(line + '\n\n')
+
+def selfplay_tags(record):
+    """PGN tags for a self-play result record"""
+    return {
+        'Event': 'Self-play',
+        'White': record['white'],
+        'Black': record['black'],
+        'Result': RESULTS[record['winner']] if record['termination'] != 'max_plies' else '*',
+        'JokerPairing': record['pairing'],
+        'Seed': record['seed'],
+        'PlyCount': record['plies'],
+        'Termination': record['termination'],
+    }
+
+def write_games(stream, records):
+    """Write self-play result records as PGN, returning how many were written"""
+    count = 0
+    for record in records:
+        tags = selfplay_tags(record)
+        write_game(stream, tags, record['moves'], tags['Result'])
+        count += 1
+    return count
+
+def _parse_tag(line):
+    name, _, value = line[1:-1].partition(' ')
+    value = value.strip()
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        value = value[1:-1]
+    return name, value
+
+def read_games(stream):
+    """Yield a PgnGame for every game in a PGN text stream, one game at a time"""
+    tags = {}
+    moves = []
+    in_moves = False
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('['):
+            # A tag after move text means the previous game had no result token
+            if in_moves:
+                yield PgnGame(tags, moves, '*')
+                tags, moves, in_moves = {}, [], False
+            name, value = _parse_tag(line)
+            tags[name] = value
+            continue
+        in_moves = True
+        for token in line.split():
+            if token in RESULT_TOKENS:
+                yield PgnGame(tags, moves, token)
+                tags, moves, in_moves = {}, [], False
+            elif not token[0].isdigit():
+                moves.append(token)
+    if in_moves or tags:
+        yield PgnGame(tags, moves, '*')
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert self-play JSON Lines to PGN')
+    parser.add_argument('input', nargs='?', default='-', help="JSON Lines file, '-' for stdin")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    try:
+        count = write_games(sys.stdout, (json.loads(line) for line in source if line.strip()))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(f"{count} games written", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+Used to check that move generators agree with each other and to measure
+move generation throughput.
+
+    python perft.py 3
+    python perft.py 3 --divide --pairing bg
+    python perft.py 2 --pairing all --backend bitboard
+    python perft.py 3 --moves e2e4 e7e5 --seed 42
+    python perft.py 4 --fen "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1 bg -"
+"""
+import argparse
+import random
+import time
+
+from chess_logic import (GameState, JOKER_PAIRINGS, get_joker_columns, move_name,
+                         pairing_name, parse_move, parse_pairing)
+from notation import from_fen
+
+def perft(game, depth):
+    """Count the positions reachable in exactly depth plies"""
+    if depth == 0:
+        return 1
+    moves = game.all_valid_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for start_pos, end_pos in moves:
+        undo = game.make_move(start_pos, end_pos)
+        nodes += perft(game, depth - 1)
+        game.unmake_move(undo)
+    return nodes
+
+def divide(game, depth):
+    """Return (move, nodes) for every root move, as perft(depth - 1) below it"""
+    results = []
+    for start_pos, end_pos in game.all_valid_moves():
+        undo = game.make_move(start_pos, end_pos)
+        results.append(((start_pos, end_pos), perft(game, depth - 1)))
+        game.unmake_move(undo)
+    return results
+
+def parse_pairings(text):
+    """Parse --pairing: a pairing name such as 'bg', or 'all' for all 21 pairings"""
+    if text == 'all':
+        return JOKER_PAIRINGS
+    try:
+        return [parse_pairing(text)]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def setup_game(joker_columns, moves, backend='numpy', fen=None):
+    """Start from the initial position, or from an extended FEN, and play moves"""
+    game = from_fen(fen, backend) if fen else GameState(backend, joker_columns)
+    for text in moves:
+        start_pos, end_pos = parse_move(text)
+        if end_pos not in game.valid_moves_from(start_pos):
+            raise ValueError(f"Illegal move: {text}")
+        game.make_move(start_pos, end_pos)
+    return game
+
+def run(game, depth, show_divide=False):
+    start = time.perf_counter()
+    if show_divide:
+        nodes = 0
+        for move, count in divide(game, depth):
+            print(f"{move_name(*move)}: {count}")
+            nodes += count
+    else:
+        nodes = perft(game, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Perft for chess with jokers')
+    parser.add_argument('depth', type=int)
+    parser.add_argument('--divide', action='store_true', help='show node counts per root move')
+    parser.add_argument('--pairing', type=parse_pairings, default=None,
+                        help="joker columns as files (e.g. 'bg'), or 'all' for all 21 pairings")
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the random joker pairing, for reproducible runs')
+    parser.add_argument('--moves', nargs='*', default=[],
+                        help='moves in coordinate notation played before counting')
+    parser.add_argument('--fen', default=None,
+                        help='extended FEN of the position to count from; it names its own pairing')
+    parser.add_argument('--backend', choices=['numpy', 'bitboard'], default='numpy')
+    args = parser.parse_args()
+    if args.fen and args.pairing:
+        parser.error('--pairing cannot be combined with --fen')
+
+    pairings = args.pairing
+    if pairings is None:
+        random.seed(args.seed)
+        pairings = [None]
+
+    total_nodes = 0
+    total_time = 0.0
+    for columns in pairings:
+        try:
+            game = setup_game(columns, args.moves, args.backend, args.fen)
+        except ValueError as e:
+            parser.error(str(e))
+        columns = get_joker_columns(game.joker_mapping)
+        nodes, elapsed = run(game, args.depth, args.divide)
+        total_nodes += nodes
+        total_time += elapsed
+        nps = nodes / elapsed if elapsed > 0 else 0
+        print(f"pairing {pairing_name(columns)} depth {args.depth}: {nodes} nodes "
+              f"in {elapsed:.3f}s ({nps:.0f} nodes/sec)")
+
+    if len(pairings) > 1:
+        nps = total_nodes / total_time if total_time > 0 else 0
+        print(f"total: {total_nodes} nodes in {total_time:.3f}s ({nps:.0f} nodes/sec)")
+
+if __name__ == "__main__":
+    main()
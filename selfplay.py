@@ -0,0 +1,153 @@
+"""Headless self-play: play many joker chess games across all cores.
+
+Results are streamed to a JSON Lines file as games finish, one object per
+game with its seed, joker pairing, winner, length, termination reason and
+moves in coordinate notation.
+
+    python selfplay.py --games 10000 --output games.jsonl
+    python selfplay.py --games 500 --white capture --black random --pairing bg
+    python selfplay.py --games 1000 --format pgn --output games.pgn
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from chess_logic import GameState, get_joker_columns, move_name, pairing_name, parse_pairing
+from notation import write_games
+
+PIECE_VALUES = {1: 1, 2: 5, 3: 3, 4: 3, 5: 9, 6: 0}
+
+def random_policy(game, moves, rng):
+    return rng.choice(moves)
+
+def capture_policy(game, moves, rng):
+    """Take the most valuable piece available, otherwise move at random"""
+    board = game.board
+    best_value = max(PIECE_VALUES[abs(int(board[end_pos]))] if board[end_pos] != 0 else 0
+                     for _, end_pos in moves)
+    if best_value == 0:
+        return rng.choice(moves)
+    return rng.choice([(start_pos, end_pos) for start_pos, end_pos in moves
+                       if board[end_pos] != 0 and PIECE_VALUES[abs(int(board[end_pos]))] == best_value])
+
+# Move selection policies by name; each picks one of the legal moves
+POLICIES = {
+    'random': random_policy,
+    'capture': capture_policy,
+}
+
+def play_game(seed, white='random', black='random', max_plies=400, joker_columns=None):
+    """Play one game and return its result record.
+
+    Everything random in the game, including the joker pairing picked by
+    initialize_board, derives from seed, so a game can be replayed from its
+    record no matter which worker process played it.
+    """
+    random.seed(seed)
+    rng = random.Random(seed)
+    game = GameState(joker_columns=joker_columns)
+    policies = {True: POLICIES[white], False: POLICIES[black]}
+    moves = []
+
+    status = game.game_status()
+    while not game.is_game_over() and len(moves) < max_plies:
+        start_pos, end_pos = policies[game.current_player_white](game, game.all_valid_moves(), rng)
+        game.make_move(start_pos, end_pos)
+        moves.append(move_name(start_pos, end_pos))
+        status = game.game_status()
+
+    if status == 'checkmate':
+        winner = 'black' if game.current_player_white else 'white'
+    else:
+        winner = None
+    if not game.is_game_over():
+        status = 'max_plies'
+    return {
+        'seed': seed,
+        'pairing': pairing_name(get_joker_columns(game.joker_mapping)),
+        'white': white,
+        'black': black,
+        'winner': winner,
+        'plies': len(moves),
+        'termination': status,
+        'moves': moves,
+    }
+
+def _outcome(result):
+    """'white', 'black', 'draw', or 'unfinished' for games stopped at the ply limit"""
+    if result['termination'] == 'max_plies':
+        return 'unfinished'
+    return result['winner'] or 'draw'
+
+def run(games, output, workers=None, seed=0, white='random', black='random',
+        max_plies=400, joker_columns=None, output_format='jsonl'):
+    """Play games in worker processes and append each result to output as it finishes.
+
+    output_format is 'jsonl' for one JSON object per game or 'pgn'.
+    """
+    workers = workers or os.cpu_count()
+    summary = Counter()
+    pending = set()
+    next_game = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded number of games in flight so memory stays flat
+        while next_game < games or pending:
+            while next_game < games and len(pending) < workers * 4:
+                pending.add(executor.submit(play_game, seed + next_game, white, black,
+                                            max_plies, joker_columns))
+                next_game += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if output_format == 'pgn':
+                    write_games(output, [result])
+                else:
+                    output.write(json.dumps(result) + '\n')
+                output.flush()
+                summary[(result['pairing'], _outcome(result))] += 1
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless self-play for chess with jokers')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--output', default='-', help="file to append to, '-' for stdout")
+    parser.add_argument('--format', choices=['jsonl', 'pgn'], default='jsonl')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game; game i uses seed + i')
+    parser.add_argument('--white', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--black', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--max-plies', type=int, default=400)
+    parser.add_argument('--pairing', default=None, help="fixed joker columns as files, e.g. 'bg'")
+    args = parser.parse_args()
+
+    joker_columns = None
+    if args.pairing:
+        try:
+            joker_columns = parse_pairing(args.pairing)
+        except ValueError as e:
+            parser.error(str(e))
+
+    start = time.perf_counter()
+    if args.output == '-':
+        summary = run(args.games, sys.stdout, args.workers, args.seed, args.white, args.black,
+                      args.max_plies, joker_columns, args.format)
+    else:
+        with open(args.output, 'a') as output:
+            summary = run(args.games, output, args.workers, args.seed, args.white, args.black,
+                          args.max_plies, joker_columns, args.format)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.games} games in {elapsed:.1f}s ({args.games / elapsed:.1f} games/sec)", file=sys.stderr)
+    for pairing in sorted({p for p, _ in summary}):
+        counts = {result: summary[(pairing, result)]
+                  for result in ('white', 'black', 'draw', 'unfinished')}
+        print(f"pairing {pairing}: white {counts['white']} black {counts['black']} draw {counts['draw']} "
+              f"unfinished {counts['unfinished']}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""Asyncio server hosting many chess with jokers games in one process.
+
+Clients speak a line protocol over TCP or a Unix socket. Every request is
+one line of whitespace separated words and gets one reply line, 'OK ...'
+or 'ERR <reason>'. Games are shared by the server, so any connection can
+play any game by its id.
+
+    NEW [pairing]           OK <id> <pairing>
+    MOVE <id> <move>        OK <status>        play e.g. e2e4 if it is legal
+    MOVES <id> [square]     OK <move> ...      legal moves, optionally from one square
+    STATUS <id>             OK <side> <status>
+    FEN <id>                OK <extended FEN>
+    ENGINE <id> [seconds]   OK <move> <status> the engine plays the side to move
+    CLOSE <id>              OK
+    STATS                   OK <name>=<value> ...
+    QUIT
+
+Status is 'none', 'check' or how the game ended, as from game_status().
+Move generation and status checks run in a thread pool and engine replies
+in worker processes, so a slow position never stalls the event loop.
+
+    python server.py serve --port 7100 --workers 4
+    python server.py serve --unix /tmp/jokers.sock
+    python server.py load --port 7100 --connections 100 --games 500
+"""
+import argparse
+import asyncio
+import math
+import random
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from chess_logic import (GameState, get_joker_columns, move_name, pairing_name, parse_move,
+                         parse_pairing, parse_square)
+from notation import to_fen
+
+# Latencies kept for the percentiles reported by STATS
+LATENCY_WINDOW = 10000
+
+class ProtocolError(Exception):
+    pass
+
+class Session:
+    """One hosted game; the lock keeps its requests from interleaving"""
+
+    def __init__(self, game):
+        self.game = game
+        self.lock = asyncio.Lock()
+
+class ServerStats:
+    """Request counts and latencies, reported by the STATS command"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.requests = Counter()
+        self.errors = 0
+        self.connections = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, command, seconds, ok):
+        self.requests[command] += 1
+        if not ok:
+            self.errors += 1
+        self.latencies.append(seconds)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.start
+        total = sum(self.requests.values())
+        latencies = sorted(self.latencies)
+        stats = {
+            'uptime': round(elapsed, 1),
+            'connections': self.connections,
+            'requests': total,
+            'errors': self.errors,
+            'rps': round(total / elapsed, 1) if elapsed > 0 else 0,
+        }
+        for name, fraction in (('p50_ms', 0.5), ('p99_ms', 0.99), ('max_ms', 1.0)):
+            index = min(len(latencies) - 1, int(fraction * len(latencies)))
+            stats[name] = round(latencies[index] * 1000, 2) if latencies else 0
+        for command, count in sorted(self.requests.items()):
+            stats[command.lower()] = count
+        return stats
+
+# Engine of each worker process, kept between requests for its table and history
+_engine = None
+
+def _init_engine_worker(book_path, tablebase_dir):
+    global _engine
+    from engine import Engine
+    from book import OpeningBook
+    from tablebase import Tablebase
+    _engine = Engine(book=OpeningBook(book_path) if book_path else None,
+                     tablebase=Tablebase(tablebase_dir) if tablebase_dir else None)
+
+def _engine_move(game, think_time):
+    return _engine.search(game, think_time).move
+
+def _status_name(status):
+    return status or 'none'
+
+class GameServer:
+    def __init__(self, workers=None, think_time=1.0, max_think=10.0, max_sessions=10000,
+                 book_path=None, tablebase_dir=None, backend='numpy'):
+        self.sessions = {}
+        self.next_id = 1
+        self.stats = ServerStats()
+        self.think_time = think_time
+        self.max_think = max_think
+        self.max_sessions = max_sessions
+        self.backend = backend
+        self.threads = ThreadPoolExecutor()
+        self.engines = ProcessPoolExecutor(max_workers=workers, initializer=_init_engine_worker,
+                                           initargs=(book_path, tablebase_dir))
+        self.commands = {
+            'NEW': self.cmd_new,
+            'MOVE': self.cmd_move,
+            'MOVES': self.cmd_moves,
+            'STATUS': self.cmd_status,
+            'FEN': self.cmd_fen,
+            'ENGINE': self.cmd_engine,
+            'CLOSE': self.cmd_close,
+            'STATS': self.cmd_stats,
+        }
+
+    def close(self):
+        self.threads.shutdown(cancel_futures=True)
+        self.engines.shutdown(cancel_futures=True)
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.threads, func, *args)
+
+    def _session(self, args):
+        if not args:
+            raise ProtocolError('missing game id')
+        try:
+            return self.sessions[int(args[0])]
+        except (ValueError, KeyError):
+            raise ProtocolError(f'no game {args[0]}')
+
+    async def cmd_new(self, args):
+        if len(self.sessions) >= self.max_sessions:
+            raise ProtocolError('too many games')
+        try:
+            joker_columns = parse_pairing(args[0]) if args else None
+        except ValueError as e:
+            raise ProtocolError(str(e))
+        game = GameState(self.backend, joker_columns)
+        game_id = self.next_id
+        self.next_id += 1
+        self.sessions[game_id] = Session(game)
+        return f'{game_id} {pairing_name(get_joker_columns(game.joker_mapping))}'
+
+    async def cmd_move(self, args):
+        session = self._session(args)
+        if len(args) < 2:
+            raise ProtocolError('missing move')
+        try:
+            start_pos, end_pos = parse_move(args[1])
+        except ValueError as e:
+            raise ProtocolError(str(e))
+        async with session.lock:
+            game = session.game
+            if await self._in_thread(game.is_game_over):
+                raise ProtocolError('game is over')
+            legal = await self._in_thread(game.legal_moves)
+            # The same check as a click in the GUI: only legal moves of the side to move
+            if end_pos not in legal.get(start_pos, []):
+                raise ProtocolError(f'illegal move {args[1]}')
+            game.make_move(start_pos, end_pos)
+            return _status_name(await self._in_thread(game.game_status))
+
+    async def cmd_moves(self, args):
+        session = self._session(args)
+        async with session.lock:
+            legal = await self._in_thread(session.game.legal_moves)
+        if len(args) > 1:
+            try:
+                start_pos = parse_square(args[1])
+            except ValueError as e:
+                raise ProtocolError(str(e))
+            legal = {start_pos: legal.get(start_pos, [])}
+        return ' '.join(move_name(start_pos, end_pos)
+                        for start_pos, ends in legal.items() for end_pos in ends)
+
+    async def cmd_status(self, args):
+        session = self._session(args)
+        async with session.lock:
+            status = await self._in_thread(session.game.game_status)
+        side = 'white' if session.game.current_player_white else 'black'
+        return f'{side} {_status_name(status)}'
+
+    async def cmd_fen(self, args):
+        session = self._session(args)
+        async with session.lock:
+            return to_fen(session.game)
+
+    async def cmd_engine(self, args):
+        session = self._session(args)
+        think_time = self.think_time
+        if len(args) > 1:
+            try:
+                think_time = float(args[1])
+            except ValueError:
+                raise ProtocolError(f'invalid think time {args[1]}')
+            # The engine reads a zero time limit as no limit at all
+            if not math.isfinite(think_time) or think_time <= 0:
+                raise ProtocolError(f'invalid think time {args[1]}')
+            think_time = min(think_time, self.max_think)
+        async with session.lock:
+            game = session.game
+            if await self._in_thread(game.is_game_over):
+                raise ProtocolError('game is over')
+            loop = asyncio.get_running_loop()
+            move = await loop.run_in_executor(self.engines, _engine_move, game, think_time)
+            game.make_move(*move)
+            status = await self._in_thread(game.game_status)
+        return f'{move_name(*move)} {_status_name(status)}'
+
+    async def cmd_close(self, args):
+        session = self._session(args)
+        # Wait for a MOVE or ENGINE still running on the game
+        async with session.lock:
+            self.sessions.pop(int(args[0]), None)
+        return ''
+
+    async def cmd_stats(self, args):
+        stats = self.stats.snapshot()
+        stats['games'] = len(self.sessions)
+        return ' '.join(f'{name}={value}' for name, value in stats.items())
+
+    async def handle(self, request):
+        """Answer one request line; returns the reply without its newline"""
+        words = request.split()
+        command = words[0].upper() if words else ''
+        handler = self.commands.get(command)
+        start = time.perf_counter()
+        ok = False
+        try:
+            if handler is None:
+                raise ProtocolError(f'unknown command {command}' if command else 'empty request')
+            reply = await handler(words[1:])
+            ok = True
+            return f'OK {reply}' if reply else 'OK'
+        except ProtocolError as e:
+            return f'ERR {e}'
+        finally:
+            self.stats.record(command if handler else 'INVALID', time.perf_counter() - start, ok)
+
+    async def serve_client(self, reader, writer):
+        self.stats.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = line.decode(errors='replace').strip()
+                if request.upper() == 'QUIT':
+                    break
+                writer.write((await self.handle(request) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.stats.connections -= 1
+            writer.close()
+
+async def serve(server, host='127.0.0.1', port=7100, unix=None):
+    if unix:
+        listener = await asyncio.start_unix_server(server.serve_client, unix)
+    else:
+        listener = await asyncio.start_server(server.serve_client, host, port)
+    names = ', '.join(str(sock.getsockname()) for sock in listener.sockets)
+    print(f"serving on {names}", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+async def _connect(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+async def _request(reader, writer, line, latencies):
+    start = time.perf_counter()
+    writer.write((line + '\n').encode())
+    await writer.drain()
+    reply = (await reader.readline()).decode().strip()
+    latencies.append(time.perf_counter() - start)
+    if not reply.startswith('OK'):
+        raise RuntimeError(f'{line}: {reply}')
+    return reply[3:]
+
+async def _load_client(host, port, unix, games, max_plies, engine_time, rng, latencies):
+    """Play random games on one connection, with the engine answering black if engine_time is set"""
+    reader, writer = await _connect(host, port, unix)
+    plies = 0
+    try:
+        for _ in range(games):
+            game_id = (await _request(reader, writer, 'NEW', latencies)).split()[0]
+            status = 'none'
+            for ply in range(max_plies):
+                if status not in ('none', 'check'):
+                    break
+                if engine_time and ply % 2 == 1:
+                    status = (await _request(reader, writer, f'ENGINE {game_id} {engine_time}',
+                                             latencies)).split()[1]
+                else:
+                    moves = (await _request(reader, writer, f'MOVES {game_id}', latencies)).split()
+                    status = await _request(reader, writer, f'MOVE {game_id} {rng.choice(moves)}',
+                                            latencies)
+                plies += 1
+            await _request(reader, writer, f'CLOSE {game_id}', latencies)
+    finally:
+        writer.close()
+    return plies
+
+async def load(host='127.0.0.1', port=7100, unix=None, connections=10, games=100, max_plies=200,
+               engine_time=0, seed=0):
+    """Play games over many concurrent connections and report client-side throughput and latency"""
+    latencies = []
+    per_client = [games // connections + (i < games % connections) for i in range(connections)]
+    start = time.perf_counter()
+    plies = await asyncio.gather(*(
+        _load_client(host, port, unix, count, max_plies, engine_time, random.Random(seed + i), latencies)
+        for i, count in enumerate(per_client) if count))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'games': games,
+        'plies': sum(plies),
+        'requests': len(latencies),
+        'seconds': round(elapsed, 2),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else 0,
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else 0,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Host chess with jokers games over a line protocol')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('serve', 'run the server'), ('load', 'run the load generator')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=7100)
+        command.add_argument('--unix', default=None, help='Unix socket path instead of TCP')
+
+    serve_parser = commands.choices['serve']
+    serve_parser.add_argument('--workers', type=int, default=None,
+                              help='engine worker processes (default: all cores)')
+    serve_parser.add_argument('--think', type=float, default=1.0, help='default engine seconds per move')
+    serve_parser.add_argument('--max-think', type=float, default=10.0, help='cap on requested engine time')
+    serve_parser.add_argument('--max-games', type=int, default=10000)
+    serve_parser.add_argument('--backend', choices=['numpy', 'bitboard'], default='numpy')
+    serve_parser.add_argument('--book', default=None, help='opening book file for the engine')
+    serve_parser.add_argument('--tablebase', default=None, help='endgame table directory for the engine')
+
+    load_parser = commands.choices['load']
+    load_parser.add_argument('--connections', type=int, default=10)
+    load_parser.add_argument('--games', type=int, default=100)
+    load_parser.add_argument('--max-plies', type=int, default=200)
+    load_parser.add_argument('--engine-time', type=float, default=0,
+                             help='let the engine play black with this many seconds per move')
+    load_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'load':
+        report = asyncio.run(load(args.host, args.port, args.unix, args.connections, args.games,
+                                  args.max_plies, args.engine_time, args.seed))
+        print(' '.join(f'{name}={value}' for name, value in report.items()))
+        return
+
+    server = GameServer(args.workers, args.think, args.max_think, args.max_games,
+                        args.book, args.tablebase, args.backend)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
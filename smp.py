@@ -0,0 +1,186 @@
+"""Parallel search: several processes searching one position (Lazy SMP).
+
+Every worker runs the ordinary Engine on its own copy of the root position.
+They cooperate only through a transposition table in shared memory, so one
+worker's results cut off whole subtrees for the others. Workers start at
+staggered depths and with shuffled root move orders so they do not all
+search the same lines in lockstep. When time runs out the deepest result
+wins, with ties settled by a vote over the workers' best moves.
+
+    python engine.py --time 10 --threads 8
+"""
+import copy
+import os
+import random
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from chess_logic import pack_move, unpack_move
+from engine import Engine, SearchResult
+
+ParallelResult = namedtuple('ParallelResult', 'result workers')
+
+_NO_MOVE = 0xFFFF
+_SCORE_OFFSET = 1 << 31
+
+def _pack_move(move):
+    return _NO_MOVE if move is None else pack_move(*move)
+
+def _unpack_move(packed):
+    return None if packed == _NO_MOVE else unpack_move(packed)
+
+class SharedTranspositionTable:
+    """Transposition table in shared memory, usable by Engine from any process.
+
+    Entries are two 64-bit words: the data (move, score, depth, flag and
+    generation packed together) and the key xor the data. Writers never take
+    a lock; a reader that catches a half-written entry sees a key mismatch and
+    treats it as a miss. Values are the (score, flag, move) tuples Engine uses.
+
+    The table pickles as its shared memory name, so passing it to a worker
+    process attaches the worker to the same memory.
+    """
+
+    def __init__(self, size=1 << 20, name=None, generation=0):
+        self.size = size
+        self.generation = generation
+        # One leading word holds the stop flag for all workers
+        nbytes = (2 * size + 1) * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        words = np.ndarray((2 * size + 1,), dtype=np.uint64, buffer=self.shm.buf)
+        if self.owner:
+            words[:] = 0
+        self.flag = words[:1]
+        self.checks = words[1:size + 1]
+        self.data = words[size + 1:]
+
+    def __getstate__(self):
+        return {'size': self.size, 'name': self.shm.name, 'generation': self.generation}
+
+    def __setstate__(self, state):
+        self.__init__(state['size'], state['name'], state['generation'])
+
+    @property
+    def stopped(self):
+        return bool(self.flag[0])
+
+    def stop(self):
+        """Tell every worker attached to the table to finish its search"""
+        self.flag[0] = 1
+
+    def new_generation(self):
+        """Mark all current entries as old so they are replaced first"""
+        self.generation += 1
+
+    def _read(self, key):
+        index = key % self.size
+        data = int(self.data[index])
+        if data == 0 or int(self.checks[index]) ^ data != key:
+            return None
+        return data
+
+    def probe(self, key, default=None):
+        entry = self.probe_depth(key)
+        return default if entry is None else entry[1]
+
+    def probe_depth(self, key):
+        """Return (depth, value) for key, or None"""
+        data = self._read(key)
+        if data is None:
+            return None
+        move = _unpack_move(data & 0xFFFF)
+        score = ((data >> 16) & 0xFFFFFFFF) - _SCORE_OFFSET
+        depth = (data >> 48) & 0xFF
+        flag = (data >> 56) & 0x3
+        return depth, (score, flag, move)
+
+    def store(self, key, value, depth=0):
+        index = key % self.size
+        old = int(self.data[index])
+        if old:
+            old_key = int(self.checks[index]) ^ old
+            old_depth = (old >> 48) & 0xFF
+            old_generation = old >> 58
+            if old_key != key and old_generation == self.generation & 0x3F and depth < old_depth:
+                return False
+        score, flag, move = value
+        data = (_pack_move(move) | (score + _SCORE_OFFSET) << 16 | min(depth, 0xFF) << 48
+                | flag << 56 | (self.generation & 0x3F) << 58)
+        self.data[index] = data
+        self.checks[index] = key ^ data
+        return True
+
+    def clear(self):
+        self.checks[:] = 0
+        self.data[:] = 0
+
+    def close(self):
+        """Detach from the shared memory, freeing it if this process created it"""
+        self.flag = self.checks = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __len__(self):
+        return int(np.count_nonzero(self.data))
+
+    def __contains__(self, key):
+        return self._read(key) is not None
+
+def _search_worker(worker_id, game, table, time_limit, max_depth, tablebase=None, on_iteration=None):
+    engine = Engine(tt=table, tablebase=tablebase)
+    if worker_id > 0:
+        # Helpers get a different root move order and every other one skips depth 1
+        rng = random.Random(worker_id)
+        for move in game.all_valid_moves():
+            engine.history[move] = rng.randrange(64)
+    return engine.search(game, time_limit, max_depth, stop=lambda: table.stopped,
+                         on_iteration=on_iteration, min_depth=1 + worker_id % 2)
+
+def combine_results(results):
+    """Pick the deepest result; among equally deep ones, the most common move"""
+    depth = max(result.depth for result in results)
+    deepest = [result for result in results if result.depth == depth]
+    votes = Counter(result.move for result in deepest)
+    return max(deepest, key=lambda result: (votes[result.move], result.score))
+
+def parallel_search(game, time_limit=1.0, max_depth=64, workers=None, tt_size=1 << 20,
+                    on_iteration=None, tablebase=None):
+    """Search the position with several processes for up to time_limit seconds.
+
+    Worker 0 runs in this process and reports through on_iteration; the rest
+    run in a process pool. Returns a ParallelResult holding the combined
+    SearchResult (nodes summed over workers) and each worker's own result.
+    """
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    table = SharedTranspositionTable(tt_size)
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, workers - 1)) as executor:
+            # Arguments are pickled in the background, so helpers get their own copy
+            # rather than a board the main search is busy making moves on
+            snapshot = copy.deepcopy(game)
+            helpers = [executor.submit(_search_worker, worker_id, snapshot, table, time_limit, max_depth,
+                                       tablebase)
+                       for worker_id in range(1, workers)]
+            main_result = _search_worker(0, game, table, time_limit, max_depth, tablebase, on_iteration)
+            # The main search can finish early on a mate or at max_depth
+            table.stop()
+            results = [main_result] + [future.result() for future in helpers]
+    finally:
+        table.close()
+
+    best = combine_results(results)
+    total = sum(result.nodes for result in results)
+    combined = SearchResult(best.move, best.score, best.depth, total,
+                            time.perf_counter() - start, best.pv)
+    return ParallelResult(combined, results)
@@ -0,0 +1,602 @@
+"""Endgame tablebases for small pawnless endgames, solved by retrograde analysis.
+
+A table covers one material balance given by movement type, e.g. KQvK or
+KRvKN, so a joker counts as the piece it moves like and one table serves
+real pieces and jokers alike. Every position with either side to move is
+solved once; the engine then looks endgames up instead of searching them.
+
+Positions are indexed with the white king folded into the a1-d1-d4 triangle
+by the board's eight symmetries:
+
+    index = side * 10 * 64**(n-1) + triangle(white king) * 64**(n-1) + squares of the other pieces
+
+with side 0 for white to move and pieces ordered white king, other white
+pieces, black king, other black pieces (queen, rook, bishop, knight). A
+table file <name>.tb holds one little-endian int16 per index, read through
+a memory map: 0 for a draw, MATE_VALUE - plies for a win and
+-(MATE_VALUE - plies) for a loss of the side to move, with plies counted to
+mate. Castling and the fifty-move rule are ignored.
+
+    python tablebase.py generate --pieces 3 --dir tables
+    python tablebase.py generate KQvKR KRvKN --dir tables --workers 4
+    python tablebase.py probe --dir tables --fen "8/8/8/4k3/8/8/8/KQ6 w - - 0 1 bg -"
+"""
+import argparse
+import os
+import sys
+import time
+from itertools import combinations_with_replacement
+
+import numpy as np
+
+from pieces import W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING
+from chess_logic import KNIGHT_JUMPS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS, move_name
+
+MATE_VALUE = 32000
+DRAW = 0
+ILLEGAL = -32768  # Stored for impossible positions, never returned by probes
+
+LETTER_TYPES = {'K': W_KING, 'Q': W_QUEEN, 'R': W_ROOK, 'B': W_BISHOP, 'N': W_KNIGHT}
+TYPE_LETTERS = {piece: letter for letter, piece in LETTER_TYPES.items()}
+# Order of pieces within each side of a table name, strongest first
+PIECE_ORDER = 'KQRBN'
+
+DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+KING_OFFSETS = DIRECTIONS
+SLIDER_DIRECTIONS = {W_ROOK: range(0, 4), W_BISHOP: range(4, 8), W_QUEEN: range(0, 8)}
+
+def _build_geometry():
+    leaps = {W_KNIGHT: np.full((64, 8), -1, dtype=np.int16), W_KING: np.full((64, 8), -1, dtype=np.int16)}
+    rays = np.full((8, 64, 7), -1, dtype=np.int16)
+    attacks = {piece: np.zeros((64, 64), dtype=bool) for piece in LETTER_TYPES.values()}
+    between = np.zeros((64, 64, 64), dtype=bool)
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        for piece, offsets in ((W_KNIGHT, KNIGHT_JUMPS), (W_KING, KING_OFFSETS)):
+            for k, (dr, dc) in enumerate(offsets):
+                r, c = row + dr, col + dc
+                if 0 <= r < 8 and 0 <= c < 8:
+                    leaps[piece][sq, k] = r * 8 + c
+                    attacks[piece][sq, r * 8 + c] = True
+        for d, (dr, dc) in enumerate(DIRECTIONS):
+            passed = []
+            for step in range(7):
+                r, c = row + (step + 1) * dr, col + (step + 1) * dc
+                if not (0 <= r < 8 and 0 <= c < 8):
+                    break
+                target = r * 8 + c
+                rays[d, sq, step] = target
+                between[sq, target, passed] = True
+                passed.append(target)
+                for piece, directions in SLIDER_DIRECTIONS.items():
+                    if d in directions:
+                        attacks[piece][sq, target] = True
+    return leaps, rays, attacks, between
+
+LEAPS, RAYS, ATTACKS, BETWEEN = _build_geometry()
+
+def _build_symmetry():
+    """The eight board symmetries as square permutations, and which one folds each king square"""
+    transforms = []
+    for transpose in (False, True):
+        for flip_row in (False, True):
+            for flip_col in (False, True):
+                perm = np.zeros(64, dtype=np.int16)
+                for sq in range(64):
+                    row, col = divmod(sq, 8)
+                    if transpose:
+                        row, col = col, row
+                    if flip_row:
+                        row = 7 - row
+                    if flip_col:
+                        col = 7 - col
+                    perm[sq] = row * 8 + col
+                transforms.append(perm)
+    transforms = np.array(transforms)
+    # a1-d1-d4: files a-d, ranks 1-4, rank <= file; rank 1 is row 7
+    triangle = [(7 - rank) * 8 + file for file in range(4) for rank in range(file + 1)]
+    triangle_index = np.full(64, -1, dtype=np.int64)
+    triangle_index[triangle] = np.arange(len(triangle))
+    fold = np.zeros(64, dtype=np.int8)
+    for sq in range(64):
+        fold[sq] = next(t for t in range(8) if triangle_index[transforms[t, sq]] >= 0)
+    return transforms, fold, triangle_index, np.array(triangle, dtype=np.int16)
+
+SYMMETRY, FOLD, TRIANGLE_INDEX, TRIANGLE = _build_symmetry()
+# Reflection in the a1-h8 diagonal, which leaves kings on a1, b2, c3 and d4 in the triangle
+DIAGONAL_REFLECTION = 7
+ON_DIAGONAL = np.array([SYMMETRY[DIAGONAL_REFLECTION, sq] == sq for sq in range(64)])
+
+def _strength(letters):
+    return len(letters), tuple(-PIECE_ORDER.index(letter) for letter in letters)
+
+def _side_letters(types):
+    return 'K' + ''.join(sorted((TYPE_LETTERS[t] for t in types if t != W_KING), key=PIECE_ORDER.index))
+
+def table_name(white_types, black_types):
+    """Name of the table for the given movement types, and whether colours are swapped in it"""
+    white, black = _side_letters(white_types), _side_letters(black_types)
+    if _strength(black) > _strength(white):
+        return f"{black}v{white}", True
+    return f"{white}v{black}", False
+
+def all_table_names(max_pieces):
+    """Every table with at most max_pieces pieces, kings included"""
+    names = []
+    for extra in range(1, max_pieces - 1):
+        for pieces in combinations_with_replacement(PIECE_ORDER[1:], extra):
+            for split in range(len(pieces) + 1):
+                white_types = [W_KING] + [LETTER_TYPES[p] for p in pieces[:split]]
+                black_types = [W_KING] + [LETTER_TYPES[p] for p in pieces[split:]]
+                name, _ = table_name(white_types, black_types)
+                if name not in names:
+                    names.append(name)
+    return sorted(names, key=len)
+
+class TableLayout:
+    """Piece list and index arithmetic of one table"""
+
+    def __init__(self, name):
+        white, black = name.split('v')
+        self.name = name
+        self.types = [LETTER_TYPES[letter] for letter in white + black]
+        self.white = [True] * len(white) + [False] * len(black)
+        self.count = len(self.types)
+        self.black_king = len(white)
+        self.per_side = len(TRIANGLE) * 64 ** (self.count - 1)
+        self.size = 2 * self.per_side
+
+    def pieces_of(self, white):
+        return [i for i in range(self.count) if self.white[i] == white]
+
+    def index(self, white_to_move, squares):
+        """Index of every position given as a list of square arrays in piece order"""
+        fold = FOLD[squares[0]]
+        index = TRIANGLE_INDEX[SYMMETRY[fold, squares[0]]]
+        for sq in squares[1:]:
+            index = index * 64 + SYMMETRY[fold, sq]
+        return np.where(white_to_move, 0, self.per_side) + index
+
+    def decode(self, index):
+        """Inverse of index: (white_to_move, squares)"""
+        index = np.asarray(index, dtype=np.int64)
+        white_to_move = index < self.per_side
+        rest = index % self.per_side
+        squares = []
+        for _ in range(self.count - 1):
+            squares.append((rest % 64).astype(np.int16))
+            rest //= 64
+        squares.append(TRIANGLE[rest])
+        return white_to_move, squares[::-1]
+
+    def twins(self, index):
+        """The other index of positions stored twice.
+
+        With the white king on the diagonal, a position and its reflection in
+        that diagonal both fold to themselves, so they have separate entries
+        that must always be solved together.
+        """
+        white_to_move, squares = self.decode(index)
+        on_diagonal = ON_DIAGONAL[squares[0]]
+        reflected = [SYMMETRY[DIAGONAL_REFLECTION, sq[on_diagonal]] for sq in squares]
+        return self.index(white_to_move[on_diagonal], reflected)
+
+def _occupied_by(squares, target, pieces):
+    """Index of the piece standing on target, or -1, per position"""
+    found = np.full(len(target), -1, dtype=np.int8)
+    for j in pieces:
+        found[squares[j] == target] = j
+    return found
+
+def _attacked(types, squares, target, attackers):
+    """Whether target is attacked by any of the given pieces"""
+    hit = np.zeros(len(target), dtype=bool)
+    for j in attackers:
+        reach = ATTACKS[types[j]][squares[j], target]
+        if types[j] in SLIDER_DIRECTIONS:
+            for k in range(len(squares)):
+                if k != j:
+                    reach &= ~BETWEEN[squares[j], target, squares[k]]
+        hit |= reach
+    return hit
+
+def _legal(layout, white_to_move, squares):
+    """Positions with distinct squares where the side not to move is not in check"""
+    legal = np.ones(len(white_to_move), dtype=bool)
+    for a in range(layout.count):
+        for b in range(a + 1, layout.count):
+            legal &= squares[a] != squares[b]
+    for white in (True, False):
+        side = white_to_move == white
+        # The king of the side that just moved
+        king = squares[layout.black_king if white else 0]
+        legal[side] &= ~_attacked(layout.types, [s[side] for s in squares], king[side],
+                                  layout.pieces_of(white))
+    return legal
+
+def _moves(layout, white, squares):
+    """Yield (piece, target, valid, captured) for the pseudo-legal moves of one side.
+
+    captured is the index of the piece taken on target, or -1 for a quiet move.
+    """
+    own = layout.pieces_of(white)
+    enemy = layout.pieces_of(not white)
+    for i in own:
+        piece = layout.types[i]
+        others = [j for j in own if j != i]
+        if piece in LEAPS:
+            for k in range(8):
+                target = LEAPS[piece][squares[i], k]
+                valid = (target >= 0) & (_occupied_by(squares, target, others) < 0)
+                yield i, target, valid, _occupied_by(squares, target, enemy)
+        else:
+            for d in SLIDER_DIRECTIONS[piece]:
+                alive = np.ones(len(squares[i]), dtype=bool)
+                for step in range(7):
+                    target = RAYS[d, squares[i], step]
+                    alive &= (target >= 0) & (_occupied_by(squares, target, others) < 0)
+                    if not alive.any():
+                        break
+                    captured = _occupied_by(squares, target, enemy)
+                    yield i, target, alive.copy(), captured
+                    alive &= captured < 0
+
+def _predecessors(layout, index, legal):
+    """Indices of the legal positions with a quiet move into any of the given positions"""
+    found = []
+    white_to_move, squares = layout.decode(index)
+    for white in (True, False):
+        side = white_to_move == white
+        if not side.any():
+            continue
+        sub = [s[side] for s in squares]
+        # The side that just moved is the other one; its pieces walk back to empty squares
+        for i in layout.pieces_of(not white):
+            piece = layout.types[i]
+            if piece in LEAPS:
+                paths = [(LEAPS[piece][sub[i], k], None) for k in range(8)]
+            else:
+                paths = [(None, d) for d in SLIDER_DIRECTIONS[piece]]
+            for leap, d in paths:
+                alive = np.ones(len(sub[i]), dtype=bool)
+                for step in range(1 if leap is not None else 7):
+                    origin = leap if leap is not None else RAYS[d, sub[i], step]
+                    alive &= (origin >= 0) & (_occupied_by(sub, origin, range(layout.count)) < 0)
+                    if not alive.any():
+                        break
+                    before = list(sub)
+                    before[i] = np.where(alive, origin, sub[i])
+                    prev = layout.index(not white, before)[alive]
+                    found.append(prev[legal[prev]])
+    if not found:
+        return np.zeros(0, dtype=np.int64)
+    found = np.unique(np.concatenate(found))
+    return np.union1d(found, layout.twins(found))
+
+class _SubTables:
+    """Values of the positions reached by captures, read from smaller tables"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+
+    def values(self, types, white_types_mask, squares, white_to_move):
+        """Value for the side to move of every position with the given pieces"""
+        white_types = [t for t, w in zip(types, white_types_mask) if w]
+        black_types = [t for t, w in zip(types, white_types_mask) if not w]
+        if len(types) == 2:
+            # Bare kings: a draw unless the kings touch, which cannot happen legally
+            touching = ATTACKS[W_KING][squares[0], squares[1]]
+            return np.where(touching, ILLEGAL, DRAW).astype(np.int16)
+        name, swapped = table_name(white_types, black_types)
+        if name not in self.tables:
+            self.tables[name] = (TableLayout(name), open_table(self.directory, name))
+        layout, values = self.tables[name]
+        # Assign the pieces to the table's slots, strongest first on each side
+        order = []
+        for white in (not swapped, swapped):
+            side = [k for k in range(len(types)) if white_types_mask[k] == white]
+            side.sort(key=lambda k: PIECE_ORDER.index(TYPE_LETTERS[types[k]]))
+            order.extend(side)
+        index = layout.index(white_to_move != swapped, [squares[k] for k in order])
+        return np.asarray(values[index])
+
+def _capture_info(layout, white, squares, subtables):
+    """Summarise capture moves: (has legal capture, min loss plies, max win plies, any draw)
+
+    Plies are those of the position after the capture, for the opponent.
+    """
+    count = len(squares[0])
+    has_capture = np.zeros(count, dtype=bool)
+    loss_min = np.full(count, np.iinfo(np.int16).max, dtype=np.int16)
+    win_max = np.full(count, -1, dtype=np.int16)
+    any_draw = np.zeros(count, dtype=bool)
+    for i, target, valid, captured in _moves(layout, white, squares):
+        for j in set(captured[valid].tolist()) - {-1}:
+            hit = valid & (captured == j)
+            rest = [k for k in range(layout.count) if k != j]
+            after = [np.where(k == i, target, squares[k])[hit] for k in rest]
+            values = subtables.values([layout.types[k] for k in rest], [layout.white[k] for k in rest],
+                                      after, np.full(hit.sum(), not white))
+            ok = values != ILLEGAL
+            rows = np.flatnonzero(hit)[ok]
+            values = values[ok]
+            has_capture[rows] = True
+            plies = MATE_VALUE - np.abs(values.astype(np.int32))
+            lost = values < 0
+            np.minimum.at(loss_min, rows[lost], plies[lost].astype(np.int16))
+            won = values > 0
+            np.maximum.at(win_max, rows[won], plies[won].astype(np.int16))
+            any_draw[rows[values == DRAW]] = True
+    return has_capture, loss_min, win_max, any_draw
+
+def _all_quiet_successors_won(layout, index, values, decided, legal):
+    """Whether every legal quiet move of each position leads to a win for the opponent"""
+    white_to_move, squares = layout.decode(index)
+    result = np.ones(len(index), dtype=bool)
+    for white in (True, False):
+        side = white_to_move == white
+        if not side.any():
+            continue
+        sub = [s[side] for s in squares]
+        ok = np.ones(side.sum(), dtype=bool)
+        for i, target, valid, captured in _moves(layout, white, sub):
+            quiet = valid & (captured < 0)
+            after = list(sub)
+            after[i] = np.where(quiet, target, sub[i])
+            succ = layout.index(not white, after)
+            check = quiet & legal[succ]
+            ok &= ~check | (decided[succ] & (values[succ] > 0))
+        result[side] = ok
+    return result
+
+def generate(name, directory, chunk_size=1 << 18, log=None):
+    """Solve one table and write it to directory; smaller tables must already exist there"""
+    start = time.perf_counter()
+    layout = TableLayout(name)
+    subtables = _SubTables(directory)
+    size = layout.size
+    legal = np.zeros(size, dtype=bool)
+    values = np.zeros(size, dtype=np.int16)
+    decided = np.zeros(size, dtype=bool)
+    has_quiet = np.zeros(size, dtype=bool)
+    capture_loss = np.full(size, np.iinfo(np.int16).max, dtype=np.int16)
+    capture_win = np.full(size, -1, dtype=np.int16)
+    capture_draw = np.zeros(size, dtype=bool)
+
+    # Legality first, since quiet moves are legal exactly when they reach a legal position
+    for first in range(0, size, chunk_size):
+        index = np.arange(first, min(first + chunk_size, size))
+        legal[index] = _legal(layout, *layout.decode(index))
+
+    for first in range(0, size, chunk_size):
+        index = np.arange(first, min(first + chunk_size, size))
+        white_to_move, squares = layout.decode(index)
+        for white in (True, False):
+            side = (white_to_move == white) & legal[index]
+            if not side.any():
+                continue
+            rows = index[side]
+            sub = [s[side] for s in squares]
+            quiet = np.zeros(len(rows), dtype=bool)
+            for i, target, valid, captured in _moves(layout, white, sub):
+                after = list(sub)
+                after[i] = np.where(valid, target, sub[i])
+                succ = layout.index(not white, after)
+                quiet |= valid & (captured < 0) & legal[succ]
+            has_quiet[rows] = quiet
+            capture, loss, win, draw = _capture_info(layout, white, sub, subtables)
+            capture_loss[rows] = loss
+            capture_win[rows] = win
+            capture_draw[rows] = draw
+            # No legal move at all: checkmate or stalemate
+            stuck = rows[~quiet & ~capture]
+            if len(stuck):
+                white_stuck, stuck_squares = layout.decode(stuck)
+                king = stuck_squares[0 if white else layout.black_king]
+                in_check = _attacked(layout.types, stuck_squares, king, layout.pieces_of(not white))
+                values[stuck] = np.where(in_check, -MATE_VALUE, DRAW)
+                decided[stuck] = True
+
+    lost = np.flatnonzero(decided & (values == -MATE_VALUE))
+    last_event = max(int(capture_win.max()), int(np.where(capture_loss < np.iinfo(np.int16).max,
+                                                          capture_loss, -1).max()))
+    plies = 0
+    while True:
+        # Won in plies + 1: a move into a position lost in plies
+        won = _predecessors(layout, lost, legal)
+        won = np.union1d(won, np.flatnonzero(legal & (capture_loss == plies)))
+        won = won[~decided[won]]
+        values[won] = MATE_VALUE - (plies + 1)
+        decided[won] = True
+
+        # Lost in plies + 2: every move reaches a position won in at most plies + 1
+        candidates = np.union1d(_predecessors(layout, won, legal),
+                                np.flatnonzero(legal & (capture_win == plies + 1)))
+        candidates = candidates[~decided[candidates]]
+        candidates = candidates[~capture_draw[candidates]
+                                & (capture_loss[candidates] == np.iinfo(np.int16).max)
+                                & (capture_win[candidates] <= plies + 1)]
+        lost = candidates[_all_quiet_successors_won(layout, candidates, values, decided, legal)]
+        values[lost] = -(MATE_VALUE - (plies + 2))
+        decided[lost] = True
+
+        if log:
+            log(f"{name}: ply {plies + 1} won {len(won)}, ply {plies + 2} lost {len(lost)}")
+        plies += 2
+        if len(won) == 0 and len(lost) == 0 and plies > last_event + 1:
+            break
+
+    values[~legal] = ILLEGAL
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.tb')
+    values.astype('<i2').tofile(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return name, time.perf_counter() - start
+
+def open_table(directory, name):
+    """Memory-map a table file"""
+    return np.memmap(os.path.join(directory, name + '.tb'), dtype='<i2', mode='r')
+
+def _dependencies(name):
+    """Tables reached from name by one capture"""
+    layout = TableLayout(name)
+    found = set()
+    for j in range(layout.count):
+        if layout.types[j] == W_KING or layout.count <= 3:
+            continue
+        rest = [k for k in range(layout.count) if k != j]
+        found.add(table_name([layout.types[k] for k in rest if layout.white[k]],
+                             [layout.types[k] for k in rest if not layout.white[k]])[0])
+    return found
+
+def generate_all(names, directory, workers=None, log=None):
+    """Generate tables and everything they depend on, smaller tables first.
+
+    Tables with the same piece count are independent and run in parallel.
+    """
+    needed = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in needed and not os.path.exists(os.path.join(directory, name + '.tb')):
+            needed.add(name)
+            pending.extend(_dependencies(name))
+    by_count = {}
+    for name in needed:
+        by_count.setdefault(len(name) - 1, []).append(name)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for count in sorted(by_count):
+            for name, elapsed in executor.map(generate, sorted(by_count[count]),
+                                              [directory] * len(by_count[count])):
+                if log:
+                    log(f"{name}: solved in {elapsed:.1f}s")
+
+class Tablebase:
+    """Probe the tables found in a directory"""
+
+    def __init__(self, directory, max_pieces=None):
+        self.directory = directory
+        self.names = {entry[:-3] for entry in os.listdir(directory) if entry.endswith('.tb')}
+        self.max_pieces = max_pieces or max((len(name) - 1 for name in self.names), default=0)
+        self.tables = {}
+
+    def __getstate__(self):
+        # Worker processes map the files themselves rather than receiving copies
+        return {'directory': self.directory, 'max_pieces': self.max_pieces}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['max_pieces'])
+
+    def _table(self, name):
+        if name not in self.tables:
+            self.tables[name] = (TableLayout(name), open_table(self.directory, name))
+        return self.tables[name]
+
+    def probe(self, game):
+        """Value of the position for the side to move, or None if no table covers it"""
+        board = game.board
+        if np.count_nonzero(board) > self.max_pieces:
+            return None
+        if game.castling:
+            return None
+        rows, cols = np.nonzero(board)
+        pieces = []
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            piece = int(board[row, col])
+            movement_type = int(game.movement[row, col]) or abs(piece)
+            if movement_type == W_PAWN:
+                return None
+            pieces.append((piece > 0, movement_type, row * 8 + col))
+        name, swapped = table_name([t for w, t, _ in pieces if w], [t for w, t, _ in pieces if not w])
+        if name not in self.names:
+            return None
+        layout, values = self._table(name)
+        order = []
+        for white in (not swapped, swapped):
+            side = [p for p in pieces if p[0] == white]
+            side.sort(key=lambda p: PIECE_ORDER.index(TYPE_LETTERS[p[1]]))
+            order.extend(side)
+        index = layout.index(game.current_player_white != swapped,
+                             [np.array([p[2]], dtype=np.int16) for p in order])
+        value = int(values[int(index[0])])
+        return None if value == ILLEGAL else value
+
+    def best_move(self, game):
+        """Return (move, value) of the move that keeps the best table value, or None"""
+        value = self.probe(game)
+        if value is None:
+            return None
+        best = None
+        for move in game.all_valid_moves():
+            undo = game.make_move(*move)
+            try:
+                reply = self.probe(game)
+            finally:
+                game.unmake_move(undo)
+            mine = parent_value(DRAW if reply is None else reply)
+            if best is None or mine > best[1]:
+                best = (move, mine)
+        return best
+
+def parent_value(value):
+    """Value of a move for its mover, from the value of the position it reaches"""
+    # The opponent's loss in n plies is a win in n + 1, and the other way round
+    if value < 0:
+        return -value - 1
+    if value > 0:
+        return -value + 1
+    return DRAW
+
+def describe(value):
+    if value is None:
+        return 'not in tablebase'
+    if value == DRAW:
+        return 'draw'
+    plies = MATE_VALUE - abs(value)
+    return f"{'win' if value > 0 else 'loss'} in {plies} plies"
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate or probe pawnless endgame tablebases')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='solve tables and the smaller ones they depend on')
+    gen.add_argument('tables', nargs='*', help='table names such as KQvK or KRvKN')
+    gen.add_argument('--pieces', type=int, default=None, help='every table with up to this many pieces')
+    gen.add_argument('--dir', default='tables')
+    gen.add_argument('--workers', type=int, default=None)
+
+    probe = commands.add_parser('probe', help='look up a position given as extended FEN')
+    probe.add_argument('--dir', default='tables')
+    probe.add_argument('--fen', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        names = list(args.tables)
+        if args.pieces:
+            names += all_table_names(args.pieces)
+        if not names:
+            parser.error('give table names or --pieces')
+        for name in names:
+            try:
+                TableLayout(name)
+            except (KeyError, ValueError):
+                parser.error(f"Invalid table name: {name}")
+        log = lambda message: print(message, file=sys.stderr, flush=True)
+        generate_all(names, args.dir, args.workers, log)
+        return
+
+    from notation import from_fen
+    try:
+        game = from_fen(args.fen)
+    except ValueError as e:
+        parser.error(str(e))
+    tablebase = Tablebase(args.dir)
+    print(describe(tablebase.probe(game)))
+    best = tablebase.best_move(game)
+    if best is not None:
+        print(f"bestmove {move_name(*best[0])} ({describe(best[1])})")
+
+if __name__ == "__main__":
+    main()
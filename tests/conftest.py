@@ -0,0 +1,30 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chess_logic import GameState
+
+@pytest.fixture
+def random_game():
+    """Play random legal moves and yield the game before the first and after every move.
+
+    Everything random, the joker pairing included, derives from seed, so a
+    failing game can be replayed. The same GameState is yielded each time.
+    """
+    def play(seed, plies=150, backend='numpy'):
+        random.seed(seed)
+        rng = random.Random(seed)
+        game = GameState(backend)
+        yield game
+        for _ in range(plies):
+            if game.is_game_over():
+                return
+            moves = [(start, end) for start, targets in game.legal_moves().items() for end in targets]
+            game.make_move(*rng.choice(moves))
+            yield game
+    return play
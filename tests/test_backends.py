@@ -0,0 +1,41 @@
+import pytest
+
+from chess_logic import GameState, get_joker_columns
+from notation import from_fen
+
+def _sorted_table(game):
+    return {pos: sorted(targets) for pos, targets in game.legal_moves().items() if targets}
+
+@pytest.mark.parametrize('seed', range(20))
+def test_backends_agree_on_random_games(seed, random_game):
+    other = None
+    for game in random_game(seed):
+        if other is None:
+            other = GameState('bitboard', get_joker_columns(game.joker_mapping))
+        else:
+            other.make_move(*game.last_move)
+        assert other.hash == game.hash
+        assert _sorted_table(other) == _sorted_table(game), game.move_history.tolist()
+        assert other.game_status() == game.game_status()
+
+@pytest.mark.parametrize('fen, start, end', [
+    # Castling on both sides; only the king's destination has to be safe
+    ('r3k2r/8/8/8/8/8/5r2/R3K2R w KQkq - 0 1 bg -', (7, 4), (7, 6)),
+    ('r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1 bg -', (0, 4), (0, 2)),
+    # En passant for either side
+    ('k7/8/8/3pP3/8/8/8/K7 w - d6 0 1 bg -', (3, 4), (2, 3)),
+    ('k7/8/8/8/4pP2/8/8/7K b - f3 0 1 bg -', (4, 4), (5, 5)),
+    # Jokers move like their partner: the b1 knight moves like a queen
+    ('4k3/8/8/8/8/8/8/1N2K3 w - - 0 1 bg b1Q', (7, 1), (0, 1)),
+])
+def test_backends_agree_on_special_moves(fen, start, end):
+    numpy_game = from_fen(fen)
+    bitboard_game = from_fen(fen, 'bitboard')
+    assert end in numpy_game.legal_moves()[start]
+    assert _sorted_table(bitboard_game) == _sorted_table(numpy_game)
+
+def test_joker_does_not_capture_en_passant():
+    # The e5 knight moves like a pawn but only real pawns take en passant
+    for backend in ('numpy', 'bitboard'):
+        game = from_fen('k7/8/8/3pN3/8/8/8/K7 w - d6 0 1 bg e5P', backend)
+        assert (2, 3) not in game.legal_moves()[(3, 4)]
@@ -0,0 +1,43 @@
+import copy
+
+import numpy as np
+
+from batch import in_check, legal_move_masks, stack_games
+from notation import from_fen
+
+def _positions(random_game, seeds):
+    return [copy.deepcopy(game) for seed in seeds for game in random_game(seed, plies=80)]
+
+def _mask_of(game):
+    mask = np.zeros((64, 64), dtype=bool)
+    for (row, col), targets in game.legal_moves().items():
+        for end_row, end_col in targets:
+            mask[row * 8 + col, end_row * 8 + end_col] = True
+    return mask
+
+def test_masks_match_legal_moves(random_game):
+    games = _positions(random_game, range(8))
+    # A small chunk size so positions are split across chunks
+    masks = legal_move_masks(*stack_games(games), chunk_size=100)
+    for game, mask in zip(games, masks):
+        assert np.array_equal(mask, _mask_of(game)), game.move_history.tolist()
+
+def test_masks_include_castling_and_en_passant():
+    games = [from_fen('r3k2r/8/8/8/8/8/5r2/R3K2R w KQkq - 0 1 bg -'),
+             from_fen('r3k2r/8/8/8/8/8/8/R3K2R b Kq - 0 1 bg -'),
+             from_fen('k7/8/8/3pP3/8/8/8/K7 w - d6 0 1 bg -'),
+             from_fen('k7/8/8/8/4pP2/8/8/7K b - f3 0 1 bg -')]
+    masks = legal_move_masks(*stack_games(games))
+    for game, mask in zip(games, masks):
+        assert np.array_equal(mask, _mask_of(game))
+    assert masks[0, 60, 62] and masks[0, 60, 58]
+    assert masks[1, 4, 2] and not masks[1, 4, 6]
+    assert masks[2, 28, 19]
+    assert masks[3, 36, 45]
+
+def test_in_check_matches_game(random_game):
+    games = _positions(random_game, range(8))
+    boards, white_to_move, movement, _, _ = stack_games(games)
+    expected = [game.rules.is_in_check(game.board, game.current_player_white, game.movement)
+                for game in games]
+    assert in_check(boards, white_to_move, movement).tolist() == expected
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import bitboard
+import chess_logic
+from notation import from_fen
+from pieces import W_KING, get_basic_moves
+
+def _attacked_by_scan(game, is_white):
+    """Whether any enemy piece's moves reach the king, by generating them all"""
+    board, movement = game.board, game.movement
+    king = W_KING if is_white else -W_KING
+    king_pos = divmod(int(np.flatnonzero(board == king)[0]), 8)
+    sign = -1 if is_white else 1
+    for row in range(8):
+        for col in range(8):
+            piece = int(board[row, col])
+            if piece * sign > 0:
+                movement_type = int(movement[row, col])
+                mover = movement_type * sign if movement_type else piece
+                if king_pos in get_basic_moves(mover, (row, col), board):
+                    return True
+    return False
+
+@pytest.mark.parametrize('seed', range(10))
+def test_in_check_matches_a_full_scan(seed, random_game):
+    for game in random_game(seed):
+        for is_white in (True, False):
+            expected = _attacked_by_scan(game, is_white)
+            assert chess_logic.is_in_check(game.board, is_white, game.movement) == expected
+            assert chess_logic.is_in_check(game.board, is_white, game.movement,
+                                           game.pieces) == expected
+            assert bitboard.is_in_check(game.board, is_white, game.movement) == expected
+
+@pytest.mark.parametrize('fen, in_check', [
+    # Pawns only attack diagonally forward
+    ('8/8/8/3k4/4P3/8/8/K7 b - - 0 1 bg -', True),
+    ('8/8/8/3k4/3P4/8/8/K7 b - - 0 1 bg -', False),
+    ('8/8/8/8/4p3/3K4/8/k7 w - - 0 1 bg -', True),
+    # The checking line follows joker movement, not the piece letter
+    ('k7/8/8/8/8/8/8/R3K3 b - - 0 1 ab a1N', False),
+    ('k7/8/8/8/8/8/8/N3K3 b - - 0 1 ab a1R', True),
+    # A blocker stops a slider
+    ('k7/8/8/8/B7/8/8/R3K3 b - - 0 1 bg -', False),
+])
+def test_in_check_positions(fen, in_check):
+    for backend in ('numpy', 'bitboard'):
+        game = from_fen(fen, backend)
+        assert game.rules.is_in_check(game.board, game.current_player_white, game.movement) == in_check
@@ -0,0 +1,69 @@
+import pickle
+
+import pytest
+
+from chess_logic import (MOVE_CASTLING, MOVE_EN_PASSANT, MOVE_NORMAL, MOVE_PROMOTION,
+                         PROMOTION_PIECES, move_kind, move_promotion, pack_move, unpack_move)
+from notation import from_fen, to_fen
+
+def _state(game):
+    return (to_fen(game), game.hash, game.score, game.hash_history.tolist(),
+            game.move_history.tolist(), game.legal_moves())
+
+def test_pack_move_round_trip():
+    for start in range(64):
+        for end in range(64):
+            start_pos, end_pos = divmod(start, 8), divmod(end, 8)
+            for kind in (MOVE_NORMAL, MOVE_EN_PASSANT, MOVE_CASTLING):
+                packed = pack_move(start_pos, end_pos, kind)
+                assert packed < 1 << 16
+                assert unpack_move(packed) == (start_pos, end_pos)
+                assert move_kind(packed) == kind
+                assert move_promotion(packed) is None
+    for promotion in PROMOTION_PIECES:
+        packed = pack_move((1, 4), (0, 4), MOVE_PROMOTION, promotion)
+        assert unpack_move(packed) == ((1, 4), (0, 4))
+        assert move_promotion(packed) == promotion
+
+@pytest.mark.parametrize('seed', range(4))
+def test_replay_to_every_ply(seed, random_game):
+    states = []
+    for game in random_game(seed, plies=100):
+        states.append(_state(game))
+    last = len(states) - 1
+    # Each replay_to drops the moves after it, so go backwards
+    for ply in (last, last * 2 // 3, last // 3, 1, 0):
+        game.replay_to(ply)
+        assert _state(game) == states[ply]
+
+@pytest.mark.parametrize('seed', range(4))
+def test_takeback_then_play_on(seed, random_game):
+    for game in random_game(seed, plies=40):
+        pass
+    moves = game.move_history.tolist()
+    expected = _state(game)
+    game.takeback(3)
+    assert game.ply == len(moves) - 3
+    for packed in moves[-3:]:
+        game.make_move(*unpack_move(packed))
+    assert _state(game) == expected
+    with pytest.raises(ValueError):
+        game.takeback(game.ply + 1)
+
+def test_replay_from_a_fen():
+    fen = 'rn2k2r/8/8/8/8/8/8/RN2K2R w KQkq - 0 1 ab a8N,b8R,a1N,b1R'
+    game = from_fen(fen)
+    game.make_move((7, 4), (7, 6))
+    game.make_move((0, 4), (0, 5))
+    game.replay_to(0)
+    assert to_fen(game) == fen
+    assert game.ply == 0
+
+def test_pickle_keeps_the_history(random_game):
+    for game in random_game(3, plies=30):
+        pass
+    copy = pickle.loads(pickle.dumps(game))
+    assert _state(copy) == _state(game)
+    copy.takeback(10)
+    game.replay_to(game.ply - 10)
+    assert _state(copy) == _state(game)
@@ -0,0 +1,32 @@
+from chess_logic import HasInsufficientMaterial
+from engine import Engine
+from notation import from_fen
+from tablebase import Tablebase, generate
+
+# A knight that moves like a queen mates; a rook that moves like a knight cannot
+KNIGHT_AS_QUEEN = '8/8/8/4k3/8/8/8/KN6 w - - 0 1 bg b1Q'
+ROOK_AS_KNIGHT = '8/8/8/4k3/8/8/8/RK6 w - - 0 1 ab a1N'
+
+def test_joker_moving_like_a_queen_can_still_win(tmp_path):
+    game = from_fen(KNIGHT_AS_QUEEN)
+    assert game.game_status() is None
+    assert not game.pieces.insufficient_material()
+    assert not HasInsufficientMaterial(game.board, game.movement)
+
+    generate('KQvK', str(tmp_path))
+    tablebase = Tablebase(str(tmp_path))
+    assert tablebase.probe(game) > 0
+    assert Engine(tablebase=tablebase).search(game, 1.0).score > 0
+
+def test_joker_moving_like_a_knight_is_a_draw(tmp_path):
+    game = from_fen(ROOK_AS_KNIGHT)
+    assert game.game_status() == 'insufficient_material'
+    assert HasInsufficientMaterial(game.board, game.movement)
+
+    generate('KNvK', str(tmp_path))
+    assert Tablebase(str(tmp_path)).probe(game) == 0
+
+def test_pawn_moving_like_a_knight_can_still_promote():
+    game = from_fen('8/8/8/4k3/8/8/1P6/K7 w - - 0 1 bg b2N')
+    assert not game.pieces.insufficient_material()
+    assert not HasInsufficientMaterial(game.board, game.movement)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import evaluation
+import zobrist
+from chess_logic import PieceLists
+
+def _pieces_state(pieces):
+    return (pieces.squares, pieces.kings, pieces.counts.tolist(), pieces.movers.tolist())
+
+def _snapshot(game):
+    return (game.board.tobytes(), game.movement.tobytes(), game.current_player_white,
+            game.castling, game.en_passant, game.halfmove_clock, game.fullmove_number,
+            game.hash, game.score, _pieces_state(game.pieces), game.hash_history.tolist(),
+            game.move_history.tolist())
+
+@pytest.mark.parametrize('backend', ['numpy', 'bitboard'])
+@pytest.mark.parametrize('seed', range(4))
+def test_incremental_state_matches_a_rebuild(seed, backend, random_game):
+    for game in random_game(seed, backend=backend):
+        assert game.hash == zobrist.position_hash(game.board, game.current_player_white,
+                                                  game.castling, game.en_passant,
+                                                  game.joker_overrides())
+        assert game.score == evaluation.evaluate(game.board, game.movement)
+        assert _pieces_state(game.pieces) == _pieces_state(PieceLists(game.board, game.movement))
+        # Movement entries travel with their joker and vanish when it is captured
+        assert not np.any((game.movement != 0) & (game.board == 0))
+
+@pytest.mark.parametrize('seed', range(4))
+def test_unmake_restores_every_move(seed, random_game):
+    for game in random_game(seed, plies=60):
+        before = _snapshot(game)
+        for start_pos, targets in game.legal_moves().items():
+            for end_pos in targets:
+                undo = game.make_move(start_pos, end_pos)
+                game.unmake_move(undo)
+                assert _snapshot(game) == before, (start_pos, end_pos)
@@ -0,0 +1,62 @@
+import io
+
+import pytest
+
+from chess_logic import get_joker_columns, move_name, parse_pairing
+from notation import (from_fen, game_from_pgn, read_games, replay, selfplay_tags, to_fen,
+                      write_game, write_games)
+from selfplay import play_game
+
+@pytest.mark.parametrize('seed', range(6))
+def test_fen_round_trip(seed, random_game):
+    for game in random_game(seed):
+        fen = to_fen(game)
+        copy = from_fen(fen)
+        assert to_fen(copy) == fen
+        assert copy.hash == game.hash
+        assert copy.legal_moves() == game.legal_moves()
+
+@pytest.mark.parametrize('fen', [
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN w KQkq - 0 1 bg -',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1 bg -',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkx - 0 1 bg -',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e4 0 1 bg -',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 bg e4N',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 ee -',
+])
+def test_malformed_fen_is_rejected(fen):
+    with pytest.raises(ValueError):
+        from_fen(fen)
+
+def test_selfplay_pgn_round_trip():
+    records = [play_game(seed, max_plies=120) for seed in range(4)]
+    stream = io.StringIO()
+    assert write_games(stream, records) == len(records)
+    stream.seek(0)
+    games = list(read_games(stream))
+    assert len(games) == len(records)
+    for record, pgn_game in zip(records, games):
+        tags = selfplay_tags(record)
+        assert pgn_game.tags == {name: str(value) for name, value in tags.items()}
+        assert pgn_game.moves == record['moves']
+        assert pgn_game.result == tags['Result']
+        game = game_from_pgn(pgn_game)
+        assert to_fen(game) == to_fen(replay(record['moves'], parse_pairing(record['pairing'])))
+
+def test_pgn_from_a_fen():
+    fen = 'rn2k2r/8/8/8/8/8/8/RN2K2R w KQkq - 0 1 ab a1N,b1R,a8N,b8R'
+    game = from_fen(fen)
+    moves = []
+    for _ in range(6):
+        start_pos, end_pos = next(game.iter_legal_moves())
+        moves.append(move_name(start_pos, end_pos))
+        game.make_move(start_pos, end_pos)
+    stream = io.StringIO()
+    write_game(stream, {'FEN': fen, 'JokerPairing': 'ab'}, moves)
+    stream.seek(0)
+    (pgn_game,) = read_games(stream)
+    assert pgn_game.result == '*'
+    copy = game_from_pgn(pgn_game)
+    assert to_fen(copy) == to_fen(game)
+    assert get_joker_columns(copy.joker_mapping) == get_joker_columns(game.joker_mapping)
@@ -0,0 +1,46 @@
+import pytest
+
+from notation import from_fen, to_fen
+from perft import divide, perft, setup_game
+
+# Node counts by depth. A pairing of two knights, or an empty joker field,
+# plays standard chess, but the counts differ from the standard tables
+# wherever the rules here do: castling only needs a safe destination, the
+# pawn taken en passant stays on the board for the check test, and pawns
+# always promote to a queen.
+POSITIONS = [
+    # Standard start: 20, 400, 8902
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 bg -', [20, 400, 8902]),
+    # Kiwipete: 48, 2039, 97862
+    ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1 bg -',
+     [48, 2043, 98196]),
+    # Position 3: 14, 191, 2812, 43238
+    ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1 bg -', [14, 193, 2850, 43718]),
+    # Position 4: 6, 264, 9467
+    ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1 bg -', [6, 228, 8087]),
+    # Position 5: 44, 1486, 62379
+    ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8 bg -', [41, 1373, 54094]),
+    # Jokers on their starting squares
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 bc b8B,c8N,b1B,c1N', [20, 400, 8958]),
+    ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 dg d8N,g8Q,d1N,g1Q', [20, 400, 8936]),
+]
+
+@pytest.mark.parametrize('backend', ['numpy', 'bitboard'])
+@pytest.mark.parametrize('fen, counts', POSITIONS)
+def test_perft_counts(fen, counts, backend):
+    game = from_fen(fen, backend)
+    assert [perft(game, depth) for depth in range(1, len(counts) + 1)] == counts
+    # make_move/unmake_move put everything back
+    assert to_fen(game) == fen
+
+def test_divide_adds_up_to_perft():
+    game = from_fen(POSITIONS[1][0])
+    results = divide(game, 2)
+    assert len(results) == 48
+    assert sum(nodes for _, nodes in results) == perft(game, 2)
+
+def test_setup_game_from_fen():
+    game = setup_game(None, ['b4f4'], fen=POSITIONS[2][0])
+    assert to_fen(game) == '8/2p5/3p4/KP5r/5R1k/8/4P1P1/8 b - - 0 1 bg -'
+    with pytest.raises(ValueError):
+        setup_game(None, ['b5b6'], fen=POSITIONS[2][0])
@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+
+from chess_logic import GameState
+from notation import from_fen
+from pieces import W_KING, W_QUEEN, W_ROOK, W_BISHOP, W_KNIGHT
+from tablebase import DRAW, MATE_VALUE, Tablebase, generate, parent_value
+
+TABLES = ('KQvK', 'KRvK', 'KBvK', 'KNvK')
+
+@pytest.fixture(scope='module')
+def tablebase(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('tables'))
+    for name in TABLES:
+        generate(name, directory)
+    return Tablebase(directory)
+
+def _random_positions(piece, count, seed):
+    """Legal positions of both kings and piece, white when positive, either side to move"""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        squares = rng.sample(range(64), 3)
+        board = np.zeros((8, 8), dtype=np.int8)
+        for sq, value in zip(squares, (W_KING, piece, -W_KING)):
+            board[divmod(sq, 8)] = value
+        game = GameState()
+        game.set_position(board, np.zeros((8, 8), dtype=np.int8), rng.random() < 0.5, 0)
+        # The side that just moved must not be left in check
+        if not game.rules.is_in_check(game.board, not game.current_player_white, game.movement):
+            positions.append(game)
+    return positions
+
+@pytest.mark.parametrize('piece', [W_QUEEN, -W_QUEEN, W_ROOK, -W_ROOK, W_BISHOP, W_KNIGHT])
+def test_probe_is_the_best_move_value(piece, tablebase):
+    for game in _random_positions(piece, 150, piece):
+        value = tablebase.probe(game)
+        status = game.game_status()
+        if status == 'checkmate':
+            assert value == -MATE_VALUE
+            continue
+        if status in ('stalemate', 'insufficient_material'):
+            assert value == DRAW
+            continue
+        children = []
+        for move in game.all_valid_moves():
+            undo = game.make_move(*move)
+            # Taking the last piece leaves two kings, which no table covers
+            reply = tablebase.probe(game)
+            game.unmake_move(undo)
+            children.append(parent_value(DRAW if reply is None else reply))
+        assert value == max(children)
+
+def test_probe_is_symmetric(tablebase):
+    for game in _random_positions(W_ROOK, 100, 1):
+        value = tablebase.probe(game)
+        for board in (game.board[:, ::-1], game.board[::-1, :], game.board.T):
+            mirrored = GameState()
+            mirrored.set_position(board, game.movement, game.current_player_white, 0)
+            assert tablebase.probe(mirrored) == value
+
+def test_probe_outside_the_tables(tablebase):
+    # Too many pieces, castling rights and pawns are all left to the search
+    assert tablebase.probe(GameState()) is None
+    assert tablebase.probe(from_fen('4k3/8/8/8/8/8/8/R3K3 w Q - 0 1 bg -')) is None
+    assert tablebase.probe(from_fen('4k3/8/8/8/8/8/P7/4K3 w - - 0 1 bg -')) is None
+    assert tablebase.probe(from_fen('4k3/8/8/8/8/8/8/R3K3 w - - 0 1 bg -')) > 0
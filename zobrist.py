@@ -0,0 +1,122 @@
+import random
+
+from pieces import (W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING,
+                    B_PAWN, B_ROOK, B_KNIGHT, B_BISHOP, B_QUEEN, B_KING)
+
+# Fixed seed so hashes are identical across processes and runs
+_rng = random.Random(0x4A4F4B4552)
+
+def _key():
+    return _rng.getrandbits(64)
+
+PIECE_KEYS = {piece: [_key() for _ in range(64)]
+              for piece in (W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING,
+                            B_PAWN, B_ROOK, B_KNIGHT, B_BISHOP, B_QUEEN, B_KING)}
+PIECE_KEYS[0] = [0] * 64  # Empty squares hash to nothing
+SIDE_KEY = _key()  # Present when black is to move
+CASTLING_KEYS = [_key() for _ in range(4)]  # White K, White Q, Black K, Black Q
+EN_PASSANT_KEYS = [_key() for _ in range(8)]  # By column of the target square
+# Joker movement overrides, keyed by movement type and square
+JOKER_KEYS = {movement_type: [_key() for _ in range(64)]
+              for movement_type in (W_PAWN, W_ROOK, W_KNIGHT, W_BISHOP, W_QUEEN, W_KING)}
+
+def piece_key(piece, row, col):
+    return PIECE_KEYS[piece][row * 8 + col]
+
+def board_hash(board):
+    h = 0
+    for sq, piece in enumerate(board.ravel().tolist()):
+        h ^= PIECE_KEYS[piece][sq]
+    return h
+
+def _castling_combination(castling):
+    h = 0
+    for i in range(4):
+        if castling >> i & 1:
+            h ^= CASTLING_KEYS[i]
+    return h
+
+# Hash of every combination of castling bits
+CASTLING_HASHES = [_castling_combination(castling) for castling in range(16)]
+
+def castling_hash(castling):
+    """Hash of castling rights given as the bits of GameState.castling"""
+    return CASTLING_HASHES[castling]
+
+def en_passant_hash(en_passant):
+    """Hash of an en passant target square index, or None"""
+    if en_passant is None:
+        return 0
+    return EN_PASSANT_KEYS[en_passant & 7]
+
+def joker_key(movement_type, row, col):
+    """Key of a joker movement override on a square; 0 means no override"""
+    return JOKER_KEYS[movement_type][row * 8 + col] if movement_type else 0
+
+def joker_hash(overrides):
+    """Hash the joker movement assignments, given as ((row, col), movement_type) pairs"""
+    h = 0
+    for (row, col), movement_type in overrides:
+        h ^= JOKER_KEYS[movement_type][row * 8 + col]
+    return h
+
+def position_hash(board, is_white, castling, en_passant, overrides):
+    h = board_hash(board) ^ castling_hash(castling) ^ en_passant_hash(en_passant)
+    h ^= joker_hash(overrides)
+    if not is_white:
+        h ^= SIDE_KEY
+    return h
+
+class TranspositionTable:
+    """Fixed-size table of per-position results keyed by Zobrist hash.
+
+    Each hash maps to a single slot. A stored entry is replaced when the new
+    one comes from a deeper search or the old one is left over from an earlier
+    generation (see new_generation), so long-running jobs never grow memory.
+    """
+
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.slots = [None] * size  # (key, depth, generation, value)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def new_generation(self):
+        """Mark all current entries as old so they are replaced first"""
+        self.generation += 1
+
+    def probe(self, key, default=None):
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[3]
+        self.misses += 1
+        return default
+
+    def probe_depth(self, key):
+        """Return (depth, value) for key, or None"""
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry[1], entry[3]
+        return None
+
+    def store(self, key, value, depth=0):
+        index = key % self.size
+        entry = self.slots[index]
+        if entry is None or entry[0] == key or entry[2] != self.generation or depth >= entry[1]:
+            self.slots[index] = (key, depth, self.generation, value)
+            return True
+        return False
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(1 for entry in self.slots if entry is not None)
+
+    def __contains__(self, key):
+        entry = self.slots[key % self.size]
+        return entry is not None and entry[0] == key